@@ -8,267 +8,3635 @@
 
 import sys
 import os
+import re
 import ast
 import argparse
 import subprocess
+import multiprocessing
+import multiprocessing.pool
+import hashlib
+import marshal
+import tempfile
+import json
+import time
+import struct
+import glob
+import io
+import socket
+import posixpath
+import heapq
+import shutil
+import math
+import threading
+import stat
+from xml.sax.saxutils import quoteattr
+from array import array
+try :
+    import tracemalloc
+except ImportError :
+    # Python 2
+    tracemalloc = None
+try :
+    import resource
+except ImportError :
+    # Windows
+    resource = None
+
+### ** Parameters
+
+__version__ = "0.0.1"
+
+# Headers of the binary edge list format, without and with the call weights
+EDGE_LIST_MAGIC = b"PYDEPEL\x01"
+EDGE_LIST_WEIGHTED_MAGIC = b"PYDEPEL\x02"
+
+# Version of the cached record layout, to be incremented each time the content
+# of the records returned by _extractFileRecord() changes
+CACHE_FORMAT = 5
+
+# File marking a directory as a pydep cache, following the Cache Directory
+# Tagging Specification (https://bford.info/cachedir/). Only the marked
+# directories are pruned, and only their entries matching the cache layout.
+CACHE_MARKER = "CACHEDIR.TAG"
+CACHE_MARKER_CONTENT = (b"Signature: 8a477f597d28d172789f06886806bc55\n"
+                        b"# This file is a cache directory tag created by "
+                        b"pydep.\n")
+_CACHE_DIR_NAME = re.compile(r"^[0-9a-f]{2}$")
+_CACHE_ENTRY_NAME = re.compile(r"^[0-9a-f]{38}$")
+
+# Locations of the external programs found on the PATH, filled by _findProgram()
+_PROGRAM_PATHS = dict()
+
+# Number of nodes above which the "auto" layout engine is sfdp instead of dot
+AUTO_ENGINE_NODES = 1000
+
+### * Classes
+
+### ** class CsrGraph
+
+class CsrGraph(object) :
+    """Compact call graph with interned function names and a compressed sparse
+    row (CSR) adjacency. Function names are mapped to integer ids; the
+    callees of the function with id ``i`` are the ids stored in
+    ``targets[offsets[i]:offsets[i + 1]]``.
+
+    The callers (keys of the relations dictionary) get the ids ``0`` to
+    ``nCallers - 1``, in sorted order. Called functions which are not callers
+    get the following ids. Local filtering (see :func:`filterLocalCalls`) thus
+    amounts to keeping the targets lower than ``nCallers``.
+
+    Attributes:
+        names (list of str): Function names, indexed by id
+        ids (dict): Dictionary mapping function names to ids
+        nCallers (int): Number of functions for which the calls are known
+        offsets (array.array): Offsets of the adjacency of each caller in
+          ``targets`` (length ``nCallers + 1``)
+        targets (array.array): Concatenated callee ids
+
+    """
+
+    __slots__ = ["names", "ids", "nCallers", "offsets", "targets"]
+
+    def __init__(self, names, nCallers, offsets, targets) :
+        self.names = names
+        self.ids = dict(zip(names, range(len(names))))
+        self.nCallers = nCallers
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def fromRelations(cls, relations) :
+        """Build a graph from a relations dictionary
+
+        Args:
+            relations (dict): Dictionary mapping function names (str) and the
+              functions they call (list of str)
+
+        Returns:
+            CsrGraph
+
+        """
+        names = sorted(relations.keys())
+        ids = dict(zip(names, range(len(names))))
+        nCallers = len(names)
+        offsets = array("i", [0])
+        targets = array("i")
+        for caller in names[:nCallers] :
+            for called in relations[caller] :
+                i = ids.get(called)
+                if i is None :
+                    i = len(names)
+                    ids[called] = i
+                    names.append(called)
+                targets.append(i)
+            offsets.append(len(targets))
+        return cls(names, nCallers, offsets, targets)
+
+    def toRelations(self) :
+        """Convert the graph back to a relations dictionary
+
+        Returns:
+            dict: Dictionary mapping function names (str) and the functions
+              they call (list of str)
+
+        """
+        names = self.names
+        offsets = self.offsets
+        targets = self.targets
+        o = dict()
+        for i in range(self.nCallers) :
+            o[names[i]] = [names[j] for j in targets[offsets[i]:offsets[i + 1]]]
+        return o
+
+    def nEdges(self) :
+        """Get the number of edges (calls) in the graph"""
+        return len(self.targets)
+
+    def successors(self, i) :
+        """Get the callee ids of a function id"""
+        if i >= self.nCallers :
+            return self.targets[0:0]
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def filterLocal(self) :
+        """Keep only the calls to functions which are callers, in linear time.
+        See :func:`filterLocalCalls`.
+
+        Returns:
+            CsrGraph
+
+        """
+        nCallers = self.nCallers
+        offsets = array("i", [0])
+        targets = array("i")
+        oldOffsets = self.offsets
+        oldTargets = self.targets
+        for i in range(nCallers) :
+            for j in oldTargets[oldOffsets[i]:oldOffsets[i + 1]] :
+                if j < nCallers :
+                    targets.append(j)
+            offsets.append(len(targets))
+        return CsrGraph(self.names[:nCallers], nCallers, offsets, targets)
+
+    def reverse(self) :
+        """Build the graph with all the edges reversed (callers of each
+        function). All the functions are callers in the reversed graph.
+
+        Returns:
+            CsrGraph
+
+        """
+        n = len(self.names)
+        counts = array("i", [0]) * (n + 1)
+        for j in self.targets :
+            counts[j + 1] += 1
+        for i in range(n) :
+            counts[i + 1] += counts[i]
+        offsets = array("i", counts)
+        targets = array("i", [0]) * len(self.targets)
+        for i in range(self.nCallers) :
+            for j in self.targets[self.offsets[i]:self.offsets[i + 1]] :
+                targets[counts[j]] = i
+                counts[j] += 1
+        return CsrGraph(list(self.names), n, offsets, targets)
+
+    def functions(self, getSingles = False) :
+        """Get the sorted list of all functions present in the graph. See
+        :func:`_getFuncFromRelations`.
+        """
+        if getSingles :
+            return sorted(self.names)
+        present = array("b", [0]) * len(self.names)
+        offsets = self.offsets
+        targets = self.targets
+        for i in range(self.nCallers) :
+            if offsets[i] != offsets[i + 1] :
+                present[i] = 1
+                for j in targets[offsets[i]:offsets[i + 1]] :
+                    present[j] = 1
+        return sorted([x for (x, y) in zip(self.names, present) if y])
+
+    def iterEdges(self) :
+        """Iterate over the (caller, called) name pairs, in caller order"""
+        names = self.names
+        offsets = self.offsets
+        targets = self.targets
+        for i in range(self.nCallers) :
+            caller = names[i]
+            for j in targets[offsets[i]:offsets[i + 1]] :
+                yield (caller, names[j])
+
+### ** class SpilledEdges
+
+class SpilledEdges(object) :
+    """Call edges kept in sorted runs on disk, for graphs too large to be held
+    in memory. Edges are buffered in memory up to a size limit; when the limit
+    is reached, the buffer is sorted and written as a run to a temporary
+    directory. The runs are merged on the fly when the edges are iterated
+    over, and merged into a single run whenever there are too many of them, so
+    that the number of open files stays bounded (external merge sort).
+
+    This has the same read interface as :class:`CsrGraph` (``functions``,
+    ``iterEdges`` and ``nEdges``), and can be given to the output writers.
+    Function names are interned, so each name is stored once.
+
+    Attributes:
+        directory (str): Temporary directory holding the runs
+        runs (list of str): Paths of the sorted runs
+        buffer (list of tuple): In-memory (caller, called) edges
+        maxBuffer (int): Maximum number of edges in the buffer
+        maxRuns (int): Number of runs above which they are merged
+        names (dict): Interned function names
+        connected (set): Names of the functions with at least one edge
+        edgeCount (int): Total number of edges
+        runCount (int): Number of run files written so far
+
+    """
+
+    __slots__ = ["directory", "runs", "buffer", "maxBuffer", "maxRuns",
+                 "names", "connected", "edgeCount", "runCount"]
+
+    # Approximate memory used by a buffered edge (tuple and list slot), in
+    # bytes
+    EDGE_SIZE = 100
+
+    def __init__(self, maxMemory = 64 * 1024 * 1024, tmpDir = None,
+                 maxRuns = 64) :
+        self.directory = tempfile.mkdtemp(prefix = "pydep-", dir = tmpDir)
+        self.runs = []
+        self.buffer = []
+        self.maxBuffer = max(1, maxMemory // self.EDGE_SIZE)
+        self.maxRuns = max(2, maxRuns)
+        self.names = dict()
+        self.connected = set()
+        self.edgeCount = 0
+        self.runCount = 0
+
+    def add(self, caller, callees) :
+        """Add a function and the functions it calls"""
+        names = self.names
+        caller = names.setdefault(caller, caller)
+        for called in callees :
+            called = names.setdefault(called, called)
+            self.connected.add(caller)
+            self.connected.add(called)
+            self.buffer.append((caller, called))
+            self.edgeCount += 1
+            if len(self.buffer) >= self.maxBuffer :
+                self.spill()
+
+    def spill(self) :
+        """Write the buffered edges as a sorted run"""
+        if not self.buffer :
+            return
+        self.buffer.sort()
+        self.runs.append(self._writeRun(self.buffer))
+        self.buffer = []
+        if len(self.runs) >= self.maxRuns :
+            merged = self._writeRun(heapq.merge(*[self._readRun(x)
+                                                  for x in self.runs]))
+            for path in self.runs :
+                os.remove(path)
+            self.runs = [merged]
+
+    def _writeRun(self, edges) :
+        path = os.path.join(self.directory, "run%d" % self.runCount)
+        self.runCount += 1
+        with open(path, "wb") as fo :
+            for (caller, called) in edges :
+                fo.write((caller + "\t" + called + "\n").encode("utf-8"))
+        return path
+
+    def _readRun(self, path) :
+        names = self.names
+        with open(path, "rb") as fi :
+            for line in fi :
+                (caller, called) = line.decode("utf-8")[:-1].split("\t")
+                yield (names.get(caller, caller), names.get(called, called))
+
+    def iterEdges(self) :
+        """Iterate over the (caller, called) pairs, in sorted order"""
+        self.buffer.sort()
+        runs = [self._readRun(x) for x in self.runs] + [iter(self.buffer)]
+        for edge in heapq.merge(*runs) :
+            yield edge
+
+    def nEdges(self) :
+        return self.edgeCount
+
+    def functions(self, getSingles = False) :
+        """Get the sorted list of the function names"""
+        if getSingles :
+            return sorted(self.names.keys())
+        return sorted(self.connected)
+
+    def close(self) :
+        """Remove the runs from the disk"""
+        shutil.rmtree(self.directory, ignore_errors = True)
+        self.runs = []
+        self.buffer = []
+
+### ** class FunctionRecord
+
+class FunctionRecord(object) :
+    """Description of a function of a :class:`CallGraph`
+
+    Attributes:
+        name (str): Qualified name of the function
+        filename (str): Source file in which the function is defined
+        lineno (int): Line of the definition
+        callees (tuple of str): Sorted names of the functions it calls
+
+    """
+
+    __slots__ = ["name", "filename", "lineno", "callees"]
+
+    def __init__(self, name, filename, lineno, callees) :
+        self.name = name
+        self.filename = filename
+        self.lineno = lineno
+        self.callees = callees
+
+    def __repr__(self) :
+        return ("FunctionRecord(" + repr(self.name) + ", " +
+                repr(self.filename) + ", " + repr(self.lineno) + ", " +
+                repr(self.callees) + ")")
+
+### ** class CallGraph
+
+class CallGraph(object) :
+    """Call graph between the functions of one or several source files. The
+    graph only holds :class:`FunctionRecord` objects: the parsed sources are
+    discarded as soon as each file has been processed, and the callee names
+    are shared with the function names.
+
+    Usage::
+
+        graph = CallGraph.fromSource("mypackage/", jobs = 4)
+        graph.focus("run", depth = 2).write(sys.stdout, "jsonl")
+
+    Attributes:
+        functions (dict): Dictionary mapping function names and their
+          :class:`FunctionRecord`
+
+    """
+
+    __slots__ = ["functions"]
+
+    def __init__(self, functions = None) :
+        if functions is None :
+            functions = dict()
+        self.functions = functions
+
+    @classmethod
+    def fromSource(cls, path, jobs = 1, cacheDir = None, getMethods = False,
+                   profiler = None) :
+        """Build the call graph of a source file, or of all the modules below
+        a directory. See :func:`getRelationsFromSrc`.
+
+        Returns:
+            CallGraph
+
+        """
+        if os.path.isdir(path) :
+            tasks = _getPackageTasks(path, cacheDir)
+        else :
+            tasks = [(path, "", cacheDir)]
+        return cls.fromModules([x[0] for x in tasks],
+                               _extractModules(tasks, jobs, profiler),
+                               getMethods)
+
+    @classmethod
+    def fromModules(cls, filenames, modules, getMethods = False) :
+        """Build a call graph from extracted module records
+
+        Args:
+            filenames (list of str): Source file of each module
+            modules (list of tuple): List of (moduleName, isPackage, record)
+              tuples, see :func:`_extractModuleTask`
+            getMethods (boolean): If True, also include the methods
+
+        Returns:
+            CallGraph
+
+        """
+        relations = resolveCalls(modules, getMethods)
+        functions = dict()
+        for (filename, (moduleName, isPackage, record)) in zip(filenames,
+                                                               modules) :
+            prefix = moduleName + "." if moduleName else ""
+            definitions = [(prefix + x[0], x[3]) for x in record[0]]
+            if getMethods :
+                for (className, bases, methods) in record[2] :
+                    definitions.extend([(prefix + className + "." + x[0], x[4])
+                                        for x in methods])
+            for (name, lineno) in definitions :
+                functions[name] = FunctionRecord(name, filename, lineno, None)
+        for record in functions.values() :
+            record.callees = tuple([functions[x].name
+                                    for x in relations[record.name]])
+        return cls(functions)
+
+    @classmethod
+    def fromRelations(cls, relations) :
+        """Build a call graph (without file and line information) from a
+        relations dictionary
+        """
+        if isinstance(relations, CsrGraph) :
+            relations = relations.toRelations()
+        functions = dict()
+        for name in relations.keys() :
+            functions[name] = FunctionRecord(name, None, None,
+                                             tuple(sorted(relations[name])))
+        return cls(functions)
+
+    def __len__(self) :
+        return len(self.functions)
+
+    def __contains__(self, name) :
+        return name in self.functions
+
+    def __getitem__(self, name) :
+        return self.functions[name]
+
+    def __iter__(self) :
+        return iter(sorted(self.functions.keys()))
+
+    def relations(self) :
+        """Get the relations dictionary of the graph
+
+        Returns:
+            dict: Dictionary mapping function names (str) and the functions
+              they call (list of str)
+
+        """
+        return dict([(x.name, list(x.callees))
+                     for x in self.functions.values()])
+
+    def csr(self) :
+        """Get the graph as a :class:`CsrGraph`"""
+        return CsrGraph.fromRelations(self.relations())
+
+    def merge(self, other) :
+        """Merge two call graphs. The calls of the functions present in both
+        graphs are merged; the file and line of ``self`` are kept.
+
+        Returns:
+            CallGraph
+
+        """
+        functions = dict(self.functions)
+        for (name, record) in other.functions.items() :
+            mine = functions.get(name)
+            if mine is None :
+                functions[name] = record
+            else :
+                callees = tuple(sorted(set(mine.callees) | set(record.callees)))
+                functions[name] = FunctionRecord(name, mine.filename,
+                                                 mine.lineno, callees)
+        return CallGraph(functions)
+
+    def filter(self, predicate) :
+        """Keep the functions for which a predicate is true, and the calls
+        between them
+
+        Args:
+            predicate (function): Function taking a :class:`FunctionRecord`
+              and returning a boolean
+
+        Returns:
+            CallGraph
+
+        """
+        functions = dict([(x.name, x) for x in self.functions.values()
+                          if predicate(x)])
+        o = dict()
+        for (name, record) in functions.items() :
+            callees = tuple([x for x in record.callees if x in functions])
+            o[name] = FunctionRecord(name, record.filename, record.lineno,
+                                     callees)
+        return CallGraph(o)
+
+    def focus(self, name, depth = 2, direction = "both") :
+        """Keep the neighbourhood of a function, see
+        :func:`getNeighbourhood`
+
+        Returns:
+            CallGraph
+
+        """
+        matches = findFunction(self.functions, name)
+        if len(matches) != 1 :
+            raise Exception("Function not found or ambiguous: " + name)
+        region = getNeighbourhood(self.relations(), matches[0], depth,
+                                  direction)
+        return self.filter(lambda x : x.name in region)
+
+    def write(self, stream, outputFormat = "dot", dotOptions = None,
+              drawSingles = False) :
+        """Write the graph to a stream, see :func:`writeRelations`"""
+        writeRelations(self.relations(), stream, outputFormat, dotOptions,
+                       drawSingles)
+
+### ** class SourceIndex
+
+class SourceIndex(object) :
+    """Long-lived index of the records extracted from a set of inputs. On
+    :meth:`refresh`, only the files whose modification time or size changed
+    are read again, and only those whose content hash changed are parsed
+    again. This is the state kept in memory by ``pydep --serve``.
+
+    Attributes:
+        inputs (list of str): Source files and directories (see
+          :func:`getBatchRelations`)
+        jobs (int): Number of worker processes used to parse the files
+        cacheDir (str): Directory of the per-file cache, or None
+        getMethods (boolean): If True, also include the methods
+        entries (dict): Dictionary mapping file names and their
+          [(mtime, size), content hash, (moduleName, isPackage, record)]
+          entries
+        graph (CallGraph): Current call graph
+
+    """
+
+    __slots__ = ["inputs", "jobs", "cacheDir", "getMethods", "entries",
+                 "graph"]
+
+    def __init__(self, inputs, jobs = 1, cacheDir = None, getMethods = False) :
+        self.inputs = inputs
+        self.jobs = jobs
+        self.cacheDir = cacheDir
+        self.getMethods = getMethods
+        self.entries = dict()
+        self.graph = CallGraph()
+
+    def stamps(self) :
+        """Get the (modification time, size) stamp of each input file. This
+        only stats the files, and is used to poll for changes.
+
+        Returns:
+            dict: Dictionary mapping file names and their stamps
+
+        """
+        o = dict()
+        for group in _getBatchGroups(self.inputs) :
+            for task in group :
+                stat = os.stat(task[0])
+                o[task[0]] = (stat.st_mtime, stat.st_size)
+        return o
+
+    def refresh(self, profiler = None) :
+        """Update the index and the call graph from the files on disk
+
+        Args:
+            profiler (Profiler): If not None, record the stages
+
+        Returns:
+            int: Number of files parsed again
+
+        """
+        if profiler is None :
+            profiler = Profiler(enabled = False)
+        with profiler.stage("discover") as counts :
+            tasks = [x for group in _getBatchGroups(self.inputs, self.cacheDir)
+                     for x in group]
+            counts["files"] = len(tasks)
+            changed = []
+            entries = dict()
+            for task in tasks :
+                (filename, moduleName) = task[:2]
+                stat = os.stat(filename)
+                stamp = (stat.st_mtime, stat.st_size)
+                entry = self.entries.get(filename)
+                if (entry is not None and entry[0] == stamp and
+                    entry[2][0] == moduleName) :
+                    entries[filename] = entry
+                    continue
+                with open(filename, "rb") as fi :
+                    digest = hashlib.sha1(fi.read()).hexdigest()
+                if (entry is not None and entry[1] == digest and
+                    entry[2][0] == moduleName) :
+                    entries[filename] = [stamp, digest, entry[2]]
+                    continue
+                entries[filename] = [stamp, digest, None]
+                changed.append(task)
+            counts["changed"] = len(changed)
+        modules = _extractModules(changed, self.jobs, profiler)
+        for (task, module) in zip(changed, modules) :
+            entries[task[0]][2] = module
+        if changed or set(entries.keys()) != set(self.entries.keys()) :
+            with profiler.stage("resolve") as counts :
+                filenames = [x[0] for x in tasks]
+                self.graph = CallGraph.fromModules(
+                    filenames, [entries[x][2] for x in filenames],
+                    self.getMethods)
+                counts["functions"] = len(self.graph)
+        self.entries = entries
+        return len(changed)
+
+### ** class Profiler
+
+class Profiler(object) :
+    """Record the wall time, CPU time, memory peak and counts of the stages of
+    a run. When disabled, :meth:`stage` returns a shared no-op context so that
+    the instrumentation costs one attribute test per stage.
+
+    The memory peak is measured with ``tracemalloc`` when available (Python
+    3) and only covers the current process; ``maxRSS`` is the maximum resident
+    set size of the process reported by the system (kB on Linux). The CPU
+    time of the worker processes is reported in ``childCpu``.
+
+    Usage::
+
+        profiler = Profiler()
+        with profiler.stage("extract") as counts :
+            counts["files"] = 12
+        profiler.write(sys.stderr)
+
+    """
+
+    __slots__ = ["enabled", "stages", "start"]
+
+    def __init__(self, enabled = True) :
+        self.enabled = enabled
+        self.stages = []
+        self.start = time.time()
+        if enabled and tracemalloc is not None and not tracemalloc.is_tracing() :
+            tracemalloc.start()
+
+    def stage(self, name) :
+        """Get a context manager recording a stage. The context value is a
+        dictionary to which counts (e.g. number of files) can be added.
+        """
+        if not self.enabled :
+            return _NULL_STAGE
+        return _ProfilerStage(self, name)
+
+    def report(self) :
+        """Get the report of the recorded stages
+
+        Returns:
+            dict: JSON-serializable report
+
+        """
+        return {"pydep" : __version__,
+                "python" : ".".join([str(x) for x in sys.version_info[:3]]),
+                "wall" : time.time() - self.start,
+                "stages" : self.stages}
+
+    def write(self, stream) :
+        """Write the report as JSON to a stream"""
+        stream.write(json.dumps(self.report(), indent = 1, sort_keys = True))
+        stream.write("\n")
+
+### ** class _ProfilerStage
+
+class _ProfilerStage(object) :
+
+    __slots__ = ["profiler", "record", "wall", "times"]
+
+    def __init__(self, profiler, name) :
+        self.profiler = profiler
+        self.record = {"name" : name}
+
+    def __enter__(self) :
+        if tracemalloc is not None and hasattr(tracemalloc, "reset_peak") :
+            tracemalloc.reset_peak()
+        self.times = os.times()
+        self.wall = time.time()
+        return self.record
+
+    def __exit__(self, excType, excValue, traceback) :
+        wall = time.time()
+        times = os.times()
+        record = self.record
+        record["wall"] = wall - self.wall
+        record["cpu"] = ((times[0] - self.times[0]) +
+                         (times[1] - self.times[1]))
+        record["childCpu"] = ((times[2] - self.times[2]) +
+                              (times[3] - self.times[3]))
+        if tracemalloc is not None and tracemalloc.is_tracing() :
+            record["peakMemory"] = tracemalloc.get_traced_memory()[1]
+        else :
+            record["peakMemory"] = None
+        if resource is not None :
+            record["maxRSS"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.profiler.stages.append(record)
+        return False
+
+### ** class RenderTimeout
+
+class RenderTimeout(Exception) :
+    """Raised when a Graphviz layout engine was killed because it did not
+    finish within the time limit of a render"""
+
+### ** class _NullStage
+
+class _NullStage(object) :
+
+    __slots__ = ["record"]
+
+    def __init__(self) :
+        self.record = dict()
+
+    def __enter__(self) :
+        return self.record
+
+    def __exit__(self, excType, excValue, traceback) :
+        return False
+
+_NULL_STAGE = _NullStage()
 
 ### * Functions
 
-### ** astParseFile(sourceFileName)
+### ** astParseFile(sourceFileName)
+
+def astParseFile(sourceFileName) :
+    """Parse a source file using the ``ast`` module
+    
+    Args:
+        sourceFileName (str): Name of the source file to parse
+
+    Returns:
+        ast.Module: Output from ``ast.parse`` (ast.Module object)
+
+    """
+    with open(sourceFileName, "r") as fi :
+        source = fi.read()
+    return(ast.parse(source, sourceFileName))
+
+### ** findSourceFiles(path)
+
+def findSourceFiles(path) :
+    """Find all the Python source files below a directory. Hidden directories
+    and ``__pycache__`` folders are skipped.
+
+    Args:
+        path (str): Root directory to search
+
+    Returns:
+        list of str: Sorted list of the paths of the ``.py`` files
+
+    """
+    o = []
+    for (dirPath, dirNames, fileNames) in os.walk(path) :
+        dirNames[:] = sorted([x for x in dirNames
+                              if not x.startswith(".") and x != "__pycache__"])
+        for f in sorted(fileNames) :
+            if f.endswith(".py") :
+                o.append(os.path.join(dirPath, f))
+    return o
+
+### ** getModuleName(filename, root)
+
+def getModuleName(filename, root) :
+    """Get the dotted module name of a source file relative to a root
+    directory. If the root directory is itself a package (i.e. contains an
+    ``__init__.py`` file), its name is used as the first component.
+
+    Args:
+        filename (str): Path to the source file
+        root (str): Root directory of the analysed tree
+
+    Returns:
+        str: Dotted module name (e.g. ``package.subpackage.module``)
+
+    """
+    relPath = os.path.relpath(filename, root)
+    parts = os.path.splitext(relPath)[0].split(os.sep)
+    if parts[-1] == "__init__" :
+        parts = parts[:-1]
+    if os.path.isfile(os.path.join(root, "__init__.py")) :
+        parts = [os.path.basename(os.path.abspath(root))] + parts
+    return ".".join(parts)
+
+### ** _getImportedModules(astParsedSource)
+
+def _getImportedModules(astParsedSource) :
+    return extractModuleInfo(astParsedSource)[1]
+    
+### ** getFunctionDef(astParsedSource)
+
+def getFunctionDef(astParsedSource) :
+    """Extract the function definitions from a parsed source file
+
+    Args:
+        astParsedSource (ast.Module): Parsed source, output from 
+          :func:`astParseFile`
+
+    Returns:
+        list of ast.FunctionDef: List of the function definitions 
+          (``ast.FunctionDef`` objects)
+
+    """
+    return([x for x in astParsedSource.body if x.__class__ == ast.FunctionDef])
+
+### ** _getFunctionCallsFromOne(astFunctionDef)
+
+def _getFunctionCallsFromOne(astFunctionDef) :
+    """Extract the function calls from a function definition
+
+    Args:
+        astFunctionDef (ast.FunctionDef): Function definition, 
+          ``ast.FunctionDef`` object
+
+    Returns:
+        list: List of (unique) functions called in the function definition
+
+    """
+    calledFunctions = set()
+    _collectCallNames(astFunctionDef, calledFunctions)
+    return sorted(calledFunctions)
+
+### ** _collectCallNames(astNode, calledFunctions)
+
+# Cache of the names of the fields which can hold child nodes, per node class.
+# The "ctx" field (Load/Store/Del singletons) is never worth visiting.
+_CHILD_FIELDS = dict()
+
+def _collectCallNames(astNode, calledFunctions) :
+    """Add the names of the functions called (as ``name(...)``) anywhere below
+    a node to a set. This is an iterative walk over the node fields, which
+    avoids the per-node generators of ``ast.walk`` and builds no intermediate
+    list of nodes.
+
+    Args:
+        astNode (ast.AST): Root node
+        calledFunctions (set): Set to which the function names are added
+
+    """
+    Call = ast.Call
+    Name = ast.Name
+    AST = ast.AST
+    childFields = _CHILD_FIELDS
+    add = calledFunctions.add
+    stack = [astNode]
+    pop = stack.pop
+    push = stack.append
+    while stack :
+        node = pop()
+        cls = node.__class__
+        if cls is Call and node.func.__class__ is Name :
+            add(node.func.id)
+        fields = childFields.get(cls)
+        if fields is None :
+            fields = tuple([x for x in cls._fields if x != "ctx"])
+            childFields[cls] = fields
+        for field in fields :
+            value = getattr(node, field, None)
+            if value.__class__ is list :
+                for x in value :
+                    if isinstance(x, AST) :
+                        push(x)
+            elif isinstance(value, AST) :
+                push(value)
+
+### ** _collectCallSites(astNode, callSites, withAttributes)
+
+# Fields of the loop nodes which are evaluated once per iteration. The "iter"
+# of a for loop is evaluated once, and so is its "else" clause. The elements
+# and conditions of a comprehension are evaluated once per item.
+_LOOP_FIELDS = dict()
+for (_name, _fields) in [("For", ("body",)), ("AsyncFor", ("body",)),
+                         ("While", ("test", "body")),
+                         ("ListComp", ("elt", "generators")),
+                         ("SetComp", ("elt", "generators")),
+                         ("GeneratorExp", ("elt", "generators")),
+                         ("DictComp", ("key", "value", "generators"))] :
+    if hasattr(ast, _name) :
+        _LOOP_FIELDS[getattr(ast, _name)] = _fields
+
+def _collectCallSites(astNode, callSites, withAttributes = True) :
+    """Count the call sites of each called name below a node, and record the
+    deepest loop nesting at which each name is called. The loop depth of
+    each node is kept on a stack parallel to the node stack. This is the walk
+    of the detailed extraction; the called names are then obtained with
+    :func:`_splitCallSites`.
+
+    Args:
+        astNode (ast.AST): Root node
+        callSites (dict): Dictionary in which the [count, maximum loop depth]
+          list of each called name is updated
+        withAttributes (boolean): If True, also count the attribute calls
+          (as ``a.b.name(...)``) under their dotted name
+
+    """
+    Call = ast.Call
+    Name = ast.Name
+    Attribute = ast.Attribute
+    AST = ast.AST
+    childFields = _CHILD_FIELDS
+    loopFields = _LOOP_FIELDS
+    # Nodes and their loop depths, on two parallel stacks
+    stack = [astNode]
+    depths = [0]
+    pop = stack.pop
+    push = stack.append
+    popDepth = depths.pop
+    pushDepth = depths.append
+    while stack :
+        node = pop()
+        depth = popDepth()
+        cls = node.__class__
+        if cls is Call :
+            func = node.func
+            name = None
+            if func.__class__ is Name :
+                name = func.id
+            elif func.__class__ is Attribute and withAttributes :
+                name = _getDottedName(func)
+            if name is not None :
+                site = callSites.get(name)
+                if site is None :
+                    callSites[name] = [1, depth]
+                else :
+                    site[0] += 1
+                    if depth > site[1] :
+                        site[1] = depth
+        fields = childFields.get(cls)
+        if fields is None :
+            fields = tuple([x for x in cls._fields if x != "ctx"])
+            childFields[cls] = fields
+        inLoop = loopFields.get(cls)
+        for field in fields :
+            childDepth = depth
+            if inLoop is not None and field in inLoop :
+                childDepth = depth + 1
+            value = getattr(node, field, None)
+            if value.__class__ is list :
+                for x in value :
+                    if isinstance(x, AST) :
+                        push(x)
+                        pushDepth(childDepth)
+            elif isinstance(value, AST) :
+                push(value)
+                pushDepth(childDepth)
+
+### ** _splitCallSites(callSites, calledFunctions, calledAttributes)
+
+def _splitCallSites(callSites, calledFunctions, calledAttributes) :
+    """Add the names counted by :func:`_collectCallSites` to a set of function
+    names and a set of dotted attribute names"""
+    for name in callSites :
+        if "." in name :
+            calledAttributes.add(name)
+        else :
+            calledFunctions.add(name)
+
+### ** _getDottedName(astNode)
+
+def _getDottedName(astNode) :
+    """Get the dotted name of a chain of attributes ending with a name, e.g.
+    ``"a.b.c"`` for ``a.b.c``
+
+    Args:
+        astNode (ast.Attribute): Attribute node
+
+    Returns:
+        str: Dotted name, or None if the chain does not end with a name (e.g.
+          ``f().b``)
+
+    """
+    parts = []
+    while astNode.__class__ is ast.Attribute :
+        parts.append(astNode.attr)
+        astNode = astNode.value
+    if astNode.__class__ is not ast.Name :
+        return None
+    parts.append(astNode.id)
+    parts.reverse()
+    return ".".join(parts)
+
+### ** extractModuleInfo(astParsedSource, detailed = False)
+
+def extractModuleInfo(astParsedSource, detailed = False) :
+    """Extract the function definitions, the imports and the function calls
+    from a parsed source file in a single pass over the module body. The
+    results are the same as those of :func:`getFunctionDef`,
+    :func:`_getImportedModules` and :func:`getFunctionCalls`.
+
+    Args:
+        astParsedSource (ast.Module): Parsed source, output from
+          :func:`astParseFile`
+        detailed (boolean): If True, return the import bindings instead of the
+          (name, asname) tuples, and also return the attribute calls and the
+          classes
+
+    Returns:
+        tuple: (list of ast.FunctionDef, list of (name, asname) tuples for the
+          imports, dictionary of function calls). If ``detailed`` is True,
+          the second element is a list of (local name, module, name, level)
+          bindings (see :func:`_getImportBindings`) and a fourth element is
+          added: a dictionary mapping function names and the sorted dotted
+          names of the attributes they call, followed by a fifth one: the list
+          of the class records (see :func:`_getClassRecord`) and a sixth one:
+          a dictionary mapping function names and their call sites (see
+          :func:`_collectCallSites`).
+
+    """
+    FunctionDef = ast.FunctionDef
+    functionDefs = []
+    importFromStatements = []
+    importStatements = []
+    functionCalls = dict()
+    attributeCalls = dict()
+    callSites = dict()
+    classes = []
+    for node in astParsedSource.body :
+        cls = node.__class__
+        if cls is FunctionDef :
+            assert node.name not in functionCalls
+            functionDefs.append(node)
+            calledFunctions = set()
+            if detailed :
+                calledAttributes = set()
+                sites = dict()
+                _collectCallSites(node, sites)
+                _splitCallSites(sites, calledFunctions, calledAttributes)
+                attributeCalls[node.name] = sorted(calledAttributes)
+                callSites[node.name] = dict([(x, tuple(y)) for (x, y)
+                                             in sites.items()])
+            else :
+                _collectCallNames(node, calledFunctions)
+            functionCalls[node.name] = sorted(calledFunctions)
+        elif cls is ast.ClassDef :
+            if detailed :
+                classes.append(_getClassRecord(node))
+        elif cls is ast.ImportFrom :
+            if detailed :
+                importFromStatements.extend(_getImportBindings(node))
+            else :
+                importFromStatements.extend([(x.name, x.asname)
+                                             for x in node.names])
+        elif cls is ast.Import :
+            if detailed :
+                importStatements.extend(_getImportBindings(node))
+            else :
+                importStatements.extend([(x.name, x.asname)
+                                         for x in node.names])
+    if detailed :
+        return (functionDefs, importFromStatements + importStatements,
+                functionCalls, attributeCalls, classes, callSites)
+    return (functionDefs, importFromStatements + importStatements,
+            functionCalls)
+
+### ** _getClassRecord(astClassDef)
+
+def _getClassRecord(astClassDef) :
+    """Extract the bases and the method calls of a class definition. Only the
+    methods defined directly in the class body are considered. Methods defined
+    several times (e.g. property getter and setter) are merged.
+
+    Args:
+        astClassDef (ast.ClassDef): Class definition
+
+    Returns:
+        tuple: (class name, list of dotted base names, methods) where
+          ``methods`` is a sorted list of (method name, list of called
+          functions, list of called attributes, name of the first argument,
+          line number, call sites) tuples. The first argument name (e.g.
+          ``"self"`` or ``"cls"``) is None for methods without arguments. The
+          call sites are described in :func:`_collectCallSites`.
+
+    """
+    bases = []
+    for base in astClassDef.bases :
+        if base.__class__ is ast.Name :
+            bases.append(base.id)
+        elif base.__class__ is ast.Attribute :
+            dottedName = _getDottedName(base)
+            if dottedName is not None :
+                bases.append(dottedName)
+    methods = dict()
+    for node in astClassDef.body :
+        if node.__class__ is not ast.FunctionDef :
+            continue
+        (calledFunctions, calledAttributes, firstArg, lineno, sites) = \
+            methods.get(node.name, (set(), set(), None, node.lineno, dict()))
+        _collectCallSites(node, sites)
+        _splitCallSites(sites, calledFunctions, calledAttributes)
+        isStatic = any([x.__class__ is ast.Name and x.id == "staticmethod"
+                        for x in node.decorator_list])
+        if node.args.args and not isStatic :
+            # ast.arg in Python 3, ast.Name in Python 2
+            arg = node.args.args[0]
+            firstArg = getattr(arg, "arg", None) or getattr(arg, "id", None)
+        methods[node.name] = (calledFunctions, calledAttributes, firstArg,
+                              lineno, sites)
+    return (astClassDef.name, bases,
+            [(x, sorted(methods[x][0]), sorted(methods[x][1]), methods[x][2],
+              methods[x][3],
+              dict([(y, tuple(z)) for (y, z) in methods[x][4].items()]))
+             for x in sorted(methods.keys())])
+
+### ** _getImportBindings(astImport)
+
+def _getImportBindings(astImport) :
+    """Get the names bound by an import statement
+
+    Args:
+        astImport (ast.Import or ast.ImportFrom): Import statement
+
+    Returns:
+        list of tuple: List of (local name, module, name, level) tuples. For
+          ``import a.b``, the binding is ``("a", "a", None, 0)``; for ``import
+          a.b as c``, ``("c", "a.b", None, 0)``; for ``from ..a import b as
+          c``, ``("c", "a", "b", 2)``. ``module`` is None for ``from . import
+          b``, and ``name`` is ``"*"`` for star imports.
+
+    """
+    o = []
+    if astImport.__class__ is ast.ImportFrom :
+        for alias in astImport.names :
+            o.append((alias.asname or alias.name, astImport.module, alias.name,
+                      astImport.level or 0))
+    else :
+        for alias in astImport.names :
+            if alias.asname is None :
+                head = alias.name.split(".")[0]
+                o.append((head, head, None, 0))
+            else :
+                o.append((alias.asname, alias.name, None, 0))
+    return o
+
+### ** getFunctionCalls(listFuncDef, csr = False)
+
+def getFunctionCalls(listFuncDef, csr = False) :
+    """Extract the function calls from a list of function definitions, and 
+    return them in a dictionary
+
+    Args:
+        listFuncDef (list of ast.FunctionDef): List of function definitions
+          (such as returned by :func:`getFunctionDef`)
+        csr (boolean): If True, return a :class:`CsrGraph` instead
+
+    Returns:
+        dict: Dictionary mapping function names (str) and the functions they 
+          call (list of str)
+
+    """
+    o = dict()
+    for f in listFuncDef :
+        assert f.name not in o
+        o[f.name] = _getFunctionCallsFromOne(f)
+    if csr :
+        return CsrGraph.fromRelations(o)
+    return o
+
+### ** filterLocalCalls(funcCallDict)
+
+def filterLocalCalls(funcCallDict) :
+    """Filter a dictionary of function calls to keep only functions which are 
+    defined locally. This is done by filtering the values of the dictionary 
+    (lists) and keeping only in those lists function names which are present
+    in the keys of the dictionary.
+
+    Args:
+        funcCallDict (dict or CsrGraph): Function calls dictionary, output from
+          :func:`getFunctionCalls`
+
+    Returns:
+        dict: A copy of the input dictionary, with the value lists filtered to
+          keep only function names present in the keys (a :class:`CsrGraph`
+          if the input is a :class:`CsrGraph`)
+
+    """
+    if isinstance(funcCallDict, CsrGraph) :
+        return funcCallDict.filterLocal()
+    o = funcCallDict.copy()
+    for k in o.keys() :
+        o[k] = [x for x in o[k] if x in funcCallDict]
+    return o
+
+### ** _cacheKey(source)
+
+def _cacheKey(source) :
+    """Compute the cache key of a source file content. The key depends on the
+    content, on the pydep version, on the cache format and on the Python
+    version (the latter determines both the ``ast`` output and the ``marshal``
+    format).
+
+    Args:
+        source (bytes): Content of the source file
+
+    Returns:
+        str: Hexadecimal digest
+
+    """
+    h = hashlib.sha1()
+    tag = "pydep-%s-%d-py%d.%d.%d\n" % ((__version__, CACHE_FORMAT) +
+                                       tuple(sys.version_info[:3]))
+    h.update(tag.encode("ascii"))
+    h.update(source)
+    return h.hexdigest()
+
+### ** _cachePath(cacheDir, key)
+
+def _cachePath(cacheDir, key) :
+    return os.path.join(cacheDir, key[:2], key[2:])
+
+### ** _initCacheDir(cacheDir)
+
+def _initCacheDir(cacheDir) :
+    """Create a cache directory if needed and mark it as a pydep cache (see
+    ``CACHE_MARKER``). An existing directory is only marked if it is empty or
+    only contains cache entries (e.g. those of an older pydep version).
+
+    Args:
+        cacheDir (str): Cache directory
+
+    Returns:
+        boolean: True if the directory is marked as a pydep cache
+
+    """
+    marker = os.path.join(cacheDir, CACHE_MARKER)
+    if os.path.isfile(marker) :
+        return True
+    try :
+        os.makedirs(cacheDir)
+    except OSError :
+        if not os.path.isdir(cacheDir) :
+            raise
+    for name in os.listdir(cacheDir) :
+        path = os.path.join(cacheDir, name)
+        if name == CACHE_MARKER :
+            continue
+        if not (_CACHE_DIR_NAME.match(name) and os.path.isdir(path)) :
+            return False
+        for entry in os.listdir(path) :
+            # Temporary files of _cacheStore() start with "tmp"
+            if not (_CACHE_ENTRY_NAME.match(entry) or entry.startswith("tmp")) :
+                return False
+    with open(marker, "wb") as fo :
+        fo.write(CACHE_MARKER_CONTENT)
+    return True
+
+### ** _cacheLoad(cacheDir, key)
+
+def _cacheLoad(cacheDir, key) :
+    """Load a record from the cache. A successful load refreshes the
+    modification time of the entry, which is used for LRU eviction by
+    :func:`pruneCache`.
+
+    Args:
+        cacheDir (str): Cache directory
+        key (str): Cache key, from :func:`_cacheKey`
+
+    Returns:
+        The cached record, or None if it is not in the cache
+
+    """
+    path = _cachePath(cacheDir, key)
+    try :
+        with open(path, "rb") as fi :
+            record = marshal.load(fi)
+        os.utime(path, None)
+    except (IOError, OSError, EOFError, ValueError, TypeError) :
+        return None
+    return record
+
+### ** _cacheStore(cacheDir, key, record)
+
+def _cacheStore(cacheDir, key, record) :
+    """Store a record in the cache. The entry is written to a temporary file
+    which is then renamed, so that concurrent workers never see partial
+    entries. Write errors are ignored, as read errors are in
+    :func:`_cacheLoad`.
+
+    Args:
+        cacheDir (str): Cache directory
+        key (str): Cache key, from :func:`_cacheKey`
+        record: Object to store (must be serializable by ``marshal``)
+
+    """
+    tmpPath = None
+    try :
+        _initCacheDir(cacheDir)
+        path = _cachePath(cacheDir, key)
+        entryDir = os.path.dirname(path)
+        try :
+            os.makedirs(entryDir)
+        except OSError :
+            if not os.path.isdir(entryDir) :
+                raise
+        (fd, tmpPath) = tempfile.mkstemp(dir = entryDir)
+        with os.fdopen(fd, "wb") as fo :
+            marshal.dump(record, fo)
+        os.rename(tmpPath, path)
+    except (IOError, OSError) :
+        # The entry is not stored (e.g. full or read-only disk, or entry
+        # stored by a concurrent worker on Windows): this is a cache miss
+        pass
+    finally :
+        if tmpPath is not None and os.path.exists(tmpPath) :
+            try :
+                os.remove(tmpPath)
+            except OSError :
+                pass
+
+### ** pruneCache(cacheDir, maxSize)
+
+def pruneCache(cacheDir, maxSize) :
+    """Remove the least recently used entries from the cache until its total
+    size is below a limit. Only the files following the layout of the cache
+    entries (see :func:`_cachePath`) are considered, and the directory must
+    be marked as a pydep cache (see :func:`_initCacheDir`).
+
+    Args:
+        cacheDir (str): Cache directory
+        maxSize (int): Maximum size of the cache, in bytes
+
+    Returns:
+        int: Number of removed entries
+
+    """
+    if not os.path.isfile(os.path.join(cacheDir, CACHE_MARKER)) :
+        raise Exception(cacheDir + " is not marked as a pydep cache (no " +
+                        CACHE_MARKER + "), refusing to prune it")
+    entries = []
+    totalSize = 0
+    for name in os.listdir(cacheDir) :
+        entryDir = os.path.join(cacheDir, name)
+        if not (_CACHE_DIR_NAME.match(name) and os.path.isdir(entryDir)) :
+            continue
+        for f in os.listdir(entryDir) :
+            if not _CACHE_ENTRY_NAME.match(f) :
+                continue
+            path = os.path.join(entryDir, f)
+            try :
+                stat = os.stat(path)
+            except OSError :
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            totalSize += stat.st_size
+    entries.sort()
+    nRemoved = 0
+    for (mtime, size, path) in entries :
+        if totalSize <= maxSize :
+            break
+        try :
+            os.remove(path)
+        except OSError :
+            continue
+        totalSize -= size
+        nRemoved += 1
+    return nRemoved
+
+### ** _extractFileRecord(filename, cacheDir = None)
+
+def _extractFileRecord(filename, cacheDir = None) :
+    """Extract the function calls from a source file, using the cache if
+    available. On a cache hit, the file is read and hashed but not parsed.
+
+    Args:
+        filename (str): Name of the source file
+        cacheDir (str): Cache directory. If None, no cache is used.
+
+    Returns:
+        tuple: (functions, bindings, classes) record. ``functions`` is a
+          sorted list of (function name, list of called functions, list of
+          called attributes, line number, call sites) tuples (the call sites
+          are described in :func:`_collectCallSites`), ``bindings`` is the list of import
+          bindings (see :func:`_getImportBindings`) and ``classes`` the list
+          of class records (see :func:`_getClassRecord`)
+
+    """
+    with open(filename, "rb") as fi :
+        source = fi.read()
+    return _extractSourceRecord(source, filename, cacheDir)
+
+### ** _extractSourceRecord(source, filename, cacheDir = None)
+
+def _extractSourceRecord(source, filename, cacheDir = None) :
+    """Extract the function calls from the content of a source file, using the
+    cache if available (see :func:`_extractFileRecord`)
+
+    Args:
+        source (bytes): Content of the source file
+        filename (str): Name of the source file, used in error messages
+        cacheDir (str): Cache directory. If None, no cache is used.
+
+    """
+    if cacheDir is not None :
+        key = _cacheKey(source)
+        record = _cacheLoad(cacheDir, key)
+        if record is not None :
+            return record
+    (functionDefs, bindings, functionCalls, attributeCalls, classes,
+     callSites) = extractModuleInfo(ast.parse(source, filename),
+                                    detailed = True)
+    lines = dict([(x.name, x.lineno) for x in functionDefs])
+    record = ([(x, functionCalls[x], attributeCalls[x], lines[x], callSites[x])
+               for x in sorted(functionCalls.keys())], bindings, classes)
+    if cacheDir is not None :
+        _cacheStore(cacheDir, key, record)
+    return record
+
+### ** _extractModuleTask(task)
+
+def _extractModuleTask(task) :
+    """Extract the record of one module of a package. This is the unit of work
+    sent to the worker processes by :func:`getPackageRelations`.
+
+    Args:
+        task (tuple): (filename, moduleName, cacheDir) tuple
+
+    Returns:
+        tuple: (moduleName, isPackage, record) tuple, where ``record`` is
+          the output of :func:`_extractFileRecord`
+
+    """
+    (filename, moduleName, cacheDir) = task
+    isPackage = os.path.basename(filename) == "__init__.py"
+    return (moduleName, isPackage, _extractFileRecord(filename, cacheDir))
+
+### ** _resolveImportBindings(moduleName, isPackage, bindings)
+
+def _resolveImportBindings(moduleName, isPackage, bindings) :
+    """Build the table mapping the names bound by the imports of a module to
+    the absolute dotted names they refer to
+
+    Args:
+        moduleName (str): Dotted name of the importing module
+        isPackage (boolean): True if the module is a package ``__init__``
+        bindings (list of tuple): Import bindings, see
+          :func:`_getImportBindings`
+
+    Returns:
+        tuple: (table, starModules) where ``table`` is a dictionary mapping
+          local names to absolute dotted names, and ``starModules`` is the
+          list of modules imported with ``from module import *``
+
+    """
+    table = dict()
+    starModules = []
+    for (localName, module, name, level) in bindings :
+        if level :
+            parts = moduleName.split(".") if moduleName else []
+            if not isPackage :
+                parts = parts[:-1]
+            parts = parts[:max(0, len(parts) - (level - 1))]
+            if module :
+                parts.append(module)
+            module = ".".join(parts)
+        if name is None :
+            table[localName] = module
+        elif name == "*" :
+            starModules.append(module)
+        elif module :
+            table[localName] = module + "." + name
+        else :
+            table[localName] = name
+    return (table, starModules)
+
+### ** _c3Merge(sequences)
+
+def _c3Merge(sequences) :
+    """Merge linearizations following the C3 algorithm
+
+    Args:
+        sequences (list of list): Linearizations of the bases, followed by the
+          list of the bases
+
+    Returns:
+        list: Merged linearization, or None if it is not consistent
+
+    """
+    sequences = [list(x) for x in sequences if x]
+    o = []
+    while sequences :
+        for sequence in sequences :
+            head = sequence[0]
+            if not any([head in x[1:] for x in sequences]) :
+                break
+        else :
+            return None
+        o.append(head)
+        sequences = [[y for y in x if y != head] for x in sequences]
+        sequences = [x for x in sequences if x]
+    return o
+
+### ** class _ClassIndex
+
+class _ClassIndex(object) :
+    """Index of the classes defined in a run, used to resolve method calls.
+    The method resolution order (C3 linearization, restricted to the bases
+    defined in the run) and the resulting method table of each class are
+    computed on first use and then cached, so that resolving a call site is
+    a dictionary lookup.
+
+    Attributes:
+        bases (dict): Mapping qualified class names and the qualified names
+          of their bases defined in the run
+        methods (dict): Mapping qualified class names and dictionaries
+          mapping their own method names and qualified method names
+
+    """
+
+    __slots__ = ["bases", "methods", "mroCache", "tableCache"]
+
+    def __init__(self) :
+        self.bases = dict()
+        self.methods = dict()
+        self.mroCache = dict()
+        self.tableCache = dict()
+
+    def getMro(self, className) :
+        """Get the method resolution order of a class (list of qualified
+        class names, starting with the class itself)
+        """
+        mro = self.mroCache.get(className)
+        if mro is None :
+            # Guard against inheritance cycles in broken code
+            self.mroCache[className] = [className]
+            bases = self.bases.get(className, [])
+            merged = _c3Merge([self.getMro(x) for x in bases] + [bases])
+            if merged is None :
+                merged = []
+                for base in bases :
+                    merged.extend([x for x in self.getMro(base)
+                                   if x not in merged])
+            mro = [className] + [x for x in merged if x != className]
+            self.mroCache[className] = mro
+        return mro
+
+    def getMethodTable(self, className) :
+        """Get the dictionary mapping all the method names available on a
+        class (including inherited ones) and their qualified names
+        """
+        table = self.tableCache.get(className)
+        if table is None :
+            table = dict()
+            for c in reversed(self.getMro(className)) :
+                table.update(self.methods.get(c, {}))
+            self.tableCache[className] = table
+        return table
+
+    def lookup(self, dottedName) :
+        """Resolve a dotted ``class.method`` name to the qualified name of the
+        method, or None if it is not a method of a known class
+        """
+        (className, dot, method) = dottedName.rpartition(".")
+        if className not in self.methods :
+            return None
+        return self.getMethodTable(className).get(method)
+
+### ** _bindName(dottedName, prefix, localNames, table, starModules, symbols)
+
+def _bindName(dottedName, prefix, localNames, table, starModules, symbols) :
+    """Get the absolute dotted name a (possibly dotted) name refers to in a
+    module, using the local definitions first, then the import table, then the
+    star imports
+
+    Returns:
+        str: Absolute dotted name, or None if the head of the name is not
+          bound
+
+    """
+    (head, dot, tail) = dottedName.partition(".")
+    if head in localNames :
+        return prefix + dottedName
+    target = table.get(head)
+    if target is not None :
+        return target + dot + tail
+    for starModule in starModules :
+        target = starModule + "." + dottedName
+        if (target in symbols or
+            (starModule + "." + head) in symbols) :
+            return target
+    return None
+
+### ** resolveCalls(modules, getMethods = False)
+
+def resolveCalls(modules, getMethods = False, weights = None) :
+    """Resolve the calls of a set of modules to the functions they define.
+    Calls to ``name(...)`` are resolved to the function of the same module
+    with this name, or through the imports of the module (``from a import
+    name``, ``from a import f as name``, ``from a import *``). Calls to
+    ``a.b.name(...)`` are resolved through the import binding of ``a``
+    (``import a.b``, ``import x.y as a``, ``from x import a``). Only calls to
+    functions defined in the modules are kept.
+
+    If ``getMethods`` is True, the methods of the top-level classes are also
+    included (named ``Class.method``). Calls to ``self.name(...)`` (or to the
+    first argument of the method, e.g. ``cls``) are resolved through the
+    method table of the class, which includes the methods inherited from the
+    bases defined in the modules, and ``Class.name(...)`` calls likewise.
+
+    The symbol index (all qualified function names) is built once, and the
+    import table of each module once, so that the resolution is linear in the
+    number of calls.
+
+    Args:
+        modules (list of tuple): List of (moduleName, isPackage, record)
+          tuples, see :func:`_extractModuleTask`. If a module name is the
+          empty string, its function names are not qualified.
+        getMethods (boolean): If True, also resolve the method calls
+        weights (dict): If not None, dictionary in which the weight of each
+          call is stored, keyed by (caller, called) pairs. The weight is a
+          (number of call sites, maximum loop depth) tuple; the call sites of
+          the different names resolving to the same function are summed.
+
+    Returns:
+        dict: Dictionary mapping qualified function names (str) and the
+          sorted qualified names of the functions they call (list of str)
+
+    """
+    symbols = set()
+    classIndex = _ClassIndex()
+    for (moduleName, isPackage, record) in modules :
+        _indexModuleSymbols(moduleName, record, getMethods, symbols,
+                            classIndex)
+    scopes = [_getModuleScope(moduleName, isPackage, record, getMethods,
+                              symbols, classIndex)
+              for (moduleName, isPackage, record) in modules]
+    o = dict()
+    for ((moduleName, isPackage, record), scope) in zip(modules, scopes) :
+        for (caller, callees) in _resolveModuleCalls(record, scope, getMethods,
+                                                     symbols, classIndex,
+                                                     weights) :
+            o[caller] = callees
+    return o
+
+### ** _indexModuleSymbols(moduleName, record, getMethods, symbols, classIndex)
+
+def _indexModuleSymbols(moduleName, record, getMethods, symbols, classIndex) :
+    """Add the qualified names of the functions (and methods) of a module to
+    the symbol index, and its classes to the class index (first step of
+    :func:`resolveCalls`)
+    """
+    prefix = moduleName + "." if moduleName else ""
+    for function in record[0] :
+        symbols.add(prefix + function[0])
+    if getMethods :
+        for (className, bases, methods) in record[2] :
+            qualifiedClass = prefix + className
+            classIndex.methods[qualifiedClass] = dict(
+                [(x[0], qualifiedClass + "." + x[0]) for x in methods])
+            symbols.update(classIndex.methods[qualifiedClass].values())
+
+### ** _getModuleScope(moduleName, isPackage, record, getMethods, symbols, classIndex)
+
+def _getModuleScope(moduleName, isPackage, record, getMethods, symbols,
+                    classIndex) :
+    """Get the name resolution scope of a module, and register the bases of
+    its classes in the class index (second step of :func:`resolveCalls`, once
+    all the symbols are indexed). Only the names of the functions, the
+    bindings and the names and bases of the classes of the record are used.
+
+    Returns:
+        tuple: (prefix, table, starModules, localNames) tuple
+
+    """
+    prefix = moduleName + "." if moduleName else ""
+    (table, starModules) = _resolveImportBindings(moduleName, isPackage,
+                                                  record[1])
+    localNames = set([x[0] for x in record[0]])
+    if getMethods :
+        localNames.update([x[0] for x in record[2]])
+        for (className, bases, methods) in record[2] :
+            qualifiedBases = []
+            for base in bases :
+                target = _bindName(base, prefix, localNames, table,
+                                   starModules, symbols)
+                if target in classIndex.methods :
+                    qualifiedBases.append(target)
+            classIndex.bases[prefix + className] = qualifiedBases
+    return (prefix, table, starModules, localNames)
+
+### ** _resolveModuleCalls(record, scope, getMethods, symbols, classIndex, weights)
+
+def _resolveModuleCalls(record, scope, getMethods, symbols, classIndex,
+                        weights = None) :
+    """Resolve the calls of the functions of a module (last step of
+    :func:`resolveCalls`). If ``weights`` is not None, the weights of the
+    calls are added to it (see :func:`resolveCalls`).
+
+    Yields:
+        tuple: (qualified function name, sorted list of the qualified names of
+          the functions it calls) pairs
+
+    """
+    (prefix, table, starModules, localNames) = scope
+    withWeights = weights is not None
+    callers = [(prefix + x[0], x[1], x[2], None, None,
+                x[4] if withWeights else None) for x in record[0]]
+    if getMethods :
+        for (className, bases, methods) in record[2] :
+            for method in methods :
+                callers.append((prefix + className + "." + method[0],
+                                method[1], method[2], method[3],
+                                prefix + className,
+                                method[5] if withWeights else None))
+    for (caller, calledFunctions, calledAttributes, firstArg,
+         className, sites) in callers :
+        callees = dict()
+        for called in calledFunctions :
+            target = _bindName(called, prefix, localNames, table,
+                               starModules, symbols)
+            if target in symbols :
+                callees.setdefault(target, []).append(called)
+        for called in calledAttributes :
+            (head, dot, tail) = called.partition(".")
+            if head == firstArg :
+                if "." not in tail :
+                    target = classIndex.getMethodTable(className).get(tail)
+                    if target is not None :
+                        callees.setdefault(target, []).append(called)
+                continue
+            target = _bindName(called, prefix, localNames, table,
+                               starModules, symbols)
+            if target is None :
+                continue
+            if target in symbols :
+                callees.setdefault(target, []).append(called)
+            elif getMethods :
+                target = classIndex.lookup(target)
+                if target is not None :
+                    callees.setdefault(target, []).append(called)
+        if withWeights :
+            for (target, names) in callees.items() :
+                weights[(caller, target)] = (
+                    sum([sites[x][0] for x in names]),
+                    max([sites[x][1] for x in names]))
+        yield (caller, sorted(callees.keys()))
+
+### ** _getPackageTasks(path, cacheDir)
+
+def _getPackageTasks(path, cacheDir = None) :
+    """Get the extraction tasks for the modules below a directory (see
+    :func:`_extractModuleTask`)
+    """
+    return [(f, getModuleName(f, path), cacheDir)
+            for f in findSourceFiles(path)]
+
+### ** _extractModules(tasks, jobs, profiler)
+
+def _extractModules(tasks, jobs = 1, profiler = None) :
+    """Run extraction tasks, in a pool of worker processes if ``jobs`` is not
+    1. The output is in the same order as the tasks.
+
+    Args:
+        tasks (list of tuple): List of (filename, moduleName, cacheDir) tuples
+        jobs (int): Number of worker processes. If 0 or None, use one process
+          per CPU.
+        profiler (Profiler): If not None, record the "extract" stage
+
+    Returns:
+        list of tuple: List of (moduleName, isPackage, record) tuples
+
+    """
+    if profiler is None :
+        profiler = Profiler(enabled = False)
+    if not jobs :
+        jobs = multiprocessing.cpu_count()
+    jobs = min(jobs, len(tasks))
+    with profiler.stage("extract") as counts :
+        counts["files"] = len(tasks)
+        counts["jobs"] = max(jobs, 1)
+        if jobs <= 1 :
+            return [_extractModuleTask(x) for x in tasks]
+        pool = multiprocessing.Pool(jobs)
+        try :
+            return pool.map(_extractModuleTask, tasks,
+                            max(1, len(tasks) // (jobs * 4)))
+        finally :
+            pool.close()
+            pool.join()
+
+### ** getPackageRelations(path, jobs, cacheDir, profiler, getMethods)
+
+def getPackageRelations(path, jobs = 1, cacheDir = None, profiler = None,
+                        getMethods = False, weights = None) :
+    """Extract the function calls between all the modules below a
+    directory. The files are parsed in a pool of worker processes, and the
+    calls are then resolved across modules with :func:`resolveCalls`. The
+    result does not depend on the number of jobs.
+
+    Args:
+        path (str): Root directory of the package
+        jobs (int): Number of worker processes. If 1, the files are parsed in
+          the current process. If 0 or None, use one process per CPU.
+        cacheDir (str): Directory of the per-file cache. If None, no cache is
+          used.
+        profiler (Profiler): If not None, record the "discover", "extract"
+          and "resolve" stages
+        getMethods (boolean): If True, also include the methods (see
+          :func:`resolveCalls`)
+        weights (dict): If not None, dictionary in which the weights of the
+          calls are stored (see :func:`resolveCalls`)
+
+    Returns:
+        dict: Dictionary mapping qualified function names (str) and the
+          functions they call (list of str)
+
+    """
+    if profiler is None :
+        profiler = Profiler(enabled = False)
+    with profiler.stage("discover") as counts :
+        tasks = _getPackageTasks(path, cacheDir)
+        counts["files"] = len(tasks)
+    modules = _extractModules(tasks, jobs, profiler)
+    with profiler.stage("resolve") as counts :
+        o = resolveCalls(modules, getMethods, weights)
+        counts["functions"] = len(o)
+    return o
+
+### ** findFunction(relations, name)
+
+def findFunction(relations, name) :
+    """Find the functions of a relations dictionary matching a name. A name
+    matches a function if it is equal to its qualified name or to a trailing
+    part of it (e.g. ``"summarize"`` or ``"core.summarize"`` for
+    ``"package.core.summarize"``).
+
+    Args:
+        relations (dict): Dictionary describing the function relations
+        name (str): Name to look for
+
+    Returns:
+        list of str: Sorted list of matching function names (the exact match
+          only if there is one)
+
+    """
+    if name in relations :
+        return [name]
+    suffix = "." + name
+    return sorted([x for x in relations.keys() if x.endswith(suffix)])
+
+### ** getNeighbourhood(relations, focus, depth, direction)
+
+def getNeighbourhood(relations, focus, depth = 2, direction = "both") :
+    """Extract the part of a call graph around a function, with a breadth-first
+    search bounded in depth
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations, output from :func:`filterLocalCalls` or
+          :func:`getRelationsFromSrc`
+        focus (str): Name of the function at the centre of the region
+        depth (int): Maximum number of calls between the focus function and
+          the functions of the region. If None, no limit.
+        direction (str): "callees" to follow the calls made by the focus
+          function, "callers" to follow the calls made to it, "both" for both
+
+    Returns:
+        dict: Relations between the functions of the region. All the
+          functions of the region are keys of the dictionary.
+
+    """
+    if direction not in ("callers", "callees", "both") :
+        raise Exception("Unknown direction: " + str(direction))
+    if not isinstance(relations, CsrGraph) :
+        relations = CsrGraph.fromRelations(relations)
+    if focus not in relations.ids :
+        raise Exception("Function not found: " + focus)
+    graphs = []
+    if direction in ("callees", "both") :
+        graphs.append(relations)
+    if direction in ("callers", "both") :
+        graphs.append(relations.reverse())
+    start = relations.ids[focus]
+    region = set([start])
+    for graph in graphs :
+        visited = set([start])
+        frontier = [start]
+        level = 0
+        while frontier and (depth is None or level < depth) :
+            nextFrontier = []
+            for i in frontier :
+                for j in graph.successors(i) :
+                    if j not in visited :
+                        visited.add(j)
+                        nextFrontier.append(j)
+            frontier = nextFrontier
+            level += 1
+        region.update(visited)
+    names = relations.names
+    o = dict()
+    for i in sorted(region) :
+        o[names[i]] = [names[j] for j in relations.successors(i) if j in region]
+    return o
+
+### ** getStronglyConnectedComponents(relations)
+
+def getStronglyConnectedComponents(relations) :
+    """Get the strongly connected components of a call graph, i.e. the groups
+    of mutually recursive functions. This is an iterative version of Tarjan's
+    algorithm (linear time, no recursion limit).
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+
+    Returns:
+        list of list of str: List of the components (sorted lists of function
+          names), in reverse topological order: a component comes after all
+          the components it calls. Functions without recursion are components
+          of size one.
+
+    """
+    if not isinstance(relations, CsrGraph) :
+        relations = CsrGraph.fromRelations(relations)
+    names = relations.names
+    offsets = relations.offsets
+    targets = relations.targets
+    nCallers = relations.nCallers
+    n = len(names)
+    index = array("i", [-1]) * n
+    low = array("i", [0]) * n
+    onStack = array("b", [0]) * n
+    stack = []
+    components = []
+    counter = 0
+    for root in range(n) :
+        if index[root] != -1 :
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack[root] = 1
+        work = [[root, offsets[root] if root < nCallers else 0]]
+        while work :
+            frame = work[-1]
+            v = frame[0]
+            end = offsets[v + 1] if v < nCallers else 0
+            if frame[1] < end :
+                w = targets[frame[1]]
+                frame[1] += 1
+                if index[w] == -1 :
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    onStack[w] = 1
+                    work.append([w, offsets[w] if w < nCallers else 0])
+                elif onStack[w] and index[w] < low[v] :
+                    low[v] = index[w]
+            else :
+                work.pop()
+                if work :
+                    u = work[-1][0]
+                    if low[v] < low[u] :
+                        low[u] = low[v]
+                if low[v] == index[v] :
+                    component = []
+                    while True :
+                        w = stack.pop()
+                        onStack[w] = 0
+                        component.append(names[w])
+                        if w == v :
+                            break
+                    components.append(sorted(component))
+    return components
+
+### ** getWeaklyConnectedComponents(relations, drawSingles)
+
+def getWeaklyConnectedComponents(relations, drawSingles = False) :
+    """Get the weakly connected components of a call graph, i.e. the groups of
+    functions linked by calls in either direction.
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        drawSingles (boolean): If False, do not return the functions which
+          are not calling nor called by another function
+
+    Returns:
+        list of list of str: List of the components (sorted lists of function
+          names), the largest first
+
+    """
+    if isinstance(relations, CsrGraph) :
+        relations = relations.toRelations()
+    parents = dict()
+    def find(f) :
+        root = f
+        while parents[root] != root :
+            root = parents[root]
+        while parents[f] != root :
+            (parents[f], f) = (root, parents[f])
+        return root
+    linked = set()
+    for caller in relations.keys() :
+        parents.setdefault(caller, caller)
+        for called in relations[caller] :
+            parents.setdefault(called, called)
+            linked.add(caller)
+            linked.add(called)
+            (a, b) = (find(caller), find(called))
+            if a != b :
+                parents[a] = b
+    components = dict()
+    for f in parents.keys() :
+        if drawSingles or f in linked :
+            components.setdefault(find(f), []).append(f)
+    o = [sorted(x) for x in components.values()]
+    o.sort(key = lambda x : (-len(x), x[0]))
+    return o
+
+### ** condenseRelations(relations, components = None)
+
+def condenseRelations(relations, components = None) :
+    """Collapse each group of mutually recursive functions into one node. The
+    resulting graph has no cycles (self-calls are dropped).
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        components (list of list of str): Strongly connected components of
+          the relations, output from :func:`getStronglyConnectedComponents`.
+          If None, they are computed.
+
+    Returns:
+        dict: Condensed relations. Functions which are not part of a cycle
+          keep their name; a cycle is named after its members, e.g.
+          ``"(f, g)"``.
+
+    """
+    if isinstance(relations, CsrGraph) :
+        relations = relations.toRelations()
+    if components is None :
+        components = getStronglyConnectedComponents(relations)
+    nodeNames = dict()
+    for component in components :
+        if len(component) == 1 :
+            nodeName = component[0]
+        else :
+            nodeName = "(" + ", ".join(component) + ")"
+        for f in component :
+            nodeNames[f] = nodeName
+    o = dict()
+    for caller in relations.keys() :
+        callees = o.setdefault(nodeNames[caller], set())
+        for called in relations[caller] :
+            if nodeNames[called] != nodeNames[caller] :
+                callees.add(nodeNames[called])
+    for called in nodeNames.values() :
+        o.setdefault(called, set())
+    for k in o.keys() :
+        o[k] = sorted(o[k])
+    return o
+
+### ** reduceRelations(relations, components = None)
+
+def reduceRelations(relations, components = None) :
+    """Compute the transitive reduction of a call graph: remove the calls from
+    f to g when g can also be reached from f through other calls. The
+    reduction is computed on the condensation of the graph (see
+    :func:`condenseRelations`), using the reachability sets of the components
+    stored as integer bitsets. Calls within a group of mutually recursive
+    functions are kept, as are all the calls representing a kept edge of the
+    condensation.
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        components (list of list of str): Strongly connected components of
+          the relations, output from :func:`getStronglyConnectedComponents`.
+          If None, they are computed.
+
+    Returns:
+        tuple: (reduced relations dictionary, number of removed calls)
+
+    """
+    if isinstance(relations, CsrGraph) :
+        relations = relations.toRelations()
+    if components is None :
+        components = getStronglyConnectedComponents(relations)
+    componentOf = dict()
+    for (i, component) in enumerate(components) :
+        for f in component :
+            componentOf[f] = i
+    # Components are in reverse topological order, so the reachability of
+    # the successors of a component is known when the component is processed
+    reach = []
+    kept = []
+    for (i, component) in enumerate(components) :
+        successors = set()
+        for f in component :
+            for called in relations.get(f, []) :
+                j = componentOf[called]
+                if j != i :
+                    successors.add(j)
+        covered = 0
+        for j in successors :
+            covered |= reach[j]
+        keptSuccessors = set()
+        direct = 0
+        for j in successors :
+            direct |= 1 << j
+            if not (covered >> j) & 1 :
+                keptSuccessors.add(j)
+        reach.append(covered | direct)
+        kept.append(keptSuccessors)
+    o = dict()
+    nRemoved = 0
+    for caller in relations.keys() :
+        i = componentOf[caller]
+        o[caller] = []
+        for called in relations[caller] :
+            j = componentOf[called]
+            if j == i or j in kept[i] :
+                o[caller].append(called)
+            else :
+                nRemoved += 1
+    return (o, nRemoved)
+
+### ** getLevelOfDetail(relations, maxNodes, maxEdges, weights, drawSingles)
+
+def getLevelOfDetail(relations, maxNodes = None, maxEdges = None,
+                     weights = None, drawSingles = False) :
+    """Simplify a call graph until it fits in a node and edge budget. The
+    following steps are applied in turn, until the graph is small enough:
+    the private helpers are collapsed into their callers (see
+    :func:`collapsePrivateHelpers`), the functions are grouped by module (see
+    :func:`groupByModule`), and only the calls with the most call sites are
+    kept (see :func:`keepHeaviestCalls`).
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        maxNodes (int): Maximum number of nodes, or None
+        maxEdges (int): Maximum number of edges, or None
+        weights (dict): Weights of the calls (see :func:`resolveCalls`), used
+          to rank them. If None, all calls have the same weight.
+        drawSingles (boolean): If True, the functions which are not calling
+          nor called by another function count as nodes
+
+    Returns:
+        tuple: (relations dictionary, weights dictionary or None, list of
+          str describing what was elided, clusters). If the functions were
+          grouped by module, clusters is a dictionary mapping package names
+          to their modules (to be drawn with the "clusters" dot option, see
+          :func:`iterDotContent`); otherwise it is None.
+
+    """
+    if isinstance(relations, CsrGraph) :
+        relations = relations.toRelations()
+    def fits(relations) :
+        return ((maxNodes is None or
+                 len(_getFuncFromRelations(relations, drawSingles)) <= maxNodes)
+                and (maxEdges is None or
+                     sum([len(x) for x in relations.values()]) <= maxEdges))
+    elided = []
+    clusters = None
+    if fits(relations) :
+        return (relations, weights, elided, clusters)
+    (relations, weights, nCollapsed) = collapsePrivateHelpers(relations,
+                                                              weights)
+    if nCollapsed :
+        elided.append("collapsed " + str(nCollapsed) +
+                      " private helpers into their callers")
+        if fits(relations) :
+            return (relations, weights, elided, clusters)
+    nFunctions = len(relations)
+    (relations, weights) = groupByModule(relations, weights)
+    if len(relations) < nFunctions :
+        elided.append("grouped " + str(nFunctions) + " functions into " +
+                      str(len(relations)) + " modules")
+        clusters = dict()
+        for module in relations.keys() :
+            if "." in module and not _isCondensed(module) :
+                clusters.setdefault(module.rsplit(".", 1)[0], []).append(module)
+        if fits(relations) :
+            return (relations, weights, elided, clusters)
+    nEdges = sum([len(x) for x in relations.values()])
+    nNodes = len(_getFuncFromRelations(relations, drawSingles))
+    (relations, weights) = keepHeaviestCalls(relations, weights, maxEdges,
+                                             maxNodes, drawSingles)
+    keptEdges = sum([len(x) for x in relations.values()])
+    keptNodes = len(_getFuncFromRelations(relations, drawSingles))
+    if keptEdges < nEdges :
+        elided.append("kept " + str(keptEdges) + " of " + str(nEdges) +
+                      " calls")
+    if maxNodes is not None and keptNodes < nNodes :
+        elided.append("kept " + str(keptNodes) + " of " + str(nNodes) +
+                      " nodes")
+    return (relations, weights, elided, clusters)
+
+### ** _mergeWeight(weights, edge, weight)
+
+def _mergeWeight(weights, edge, weight) :
+    """Add a (number of call sites, loop depth) weight to an edge of a weights
+    dictionary: the numbers of call sites are summed and the largest loop
+    depth is kept"""
+    if edge in weights :
+        (count, depth) = weights[edge]
+        weights[edge] = (count + weight[0], max(depth, weight[1]))
+    else :
+        weights[edge] = tuple(weight)
+
+### ** collapsePrivateHelpers(relations, weights)
+
+def collapsePrivateHelpers(relations, weights = None) :
+    """Remove the private helpers (functions whose name starts with an
+    underscore, except the main functions) which have callers, and make their
+    callers call their callees directly. Only the helpers whose removal does
+    not increase the number of calls are collapsed (e.g. the helpers with a
+    single caller or a single callee), so that the graph always shrinks. A
+    call through a helper weighs as many call sites as the calls to the
+    helper, at the sum of the two loop depths.
+
+    Args:
+        relations (dict): Dictionary describing the function relations
+        weights (dict): Weights of the calls, or None
+
+    Returns:
+        tuple: (relations dictionary, weights dictionary or None, number of
+          collapsed helpers)
+
+    """
+    callees = dict([(k, set(v)) for (k, v) in relations.items()])
+    callers = dict()
+    for (caller, called) in _iterEdges(relations) :
+        callees.setdefault(called, set())
+        callers.setdefault(called, set()).add(caller)
+    newWeights = None if weights is None else dict(weights)
+    nCollapsed = 0
+    for helper in sorted(callees.keys()) :
+        if not _isPrivate(helper) or _isMain(helper) :
+            continue
+        helperCallees = callees[helper] - set([helper])
+        helperCallers = callers.get(helper, set()) - set([helper])
+        nCallers = len(helperCallers)
+        nCallees = len(helperCallees)
+        if nCallers == 0 or nCallers * nCallees > nCallers + nCallees :
+            continue
+        del callees[helper]
+        del callers[helper]
+        for caller in helperCallers :
+            callees[caller].discard(helper)
+            callees[caller].update(helperCallees)
+        for called in helperCallees :
+            callers[called].discard(helper)
+            callers[called].update(helperCallers)
+        if newWeights is not None :
+            for caller in helperCallers :
+                (count, depth) = newWeights.pop((caller, helper), (1, 0))
+                for called in helperCallees :
+                    (_, depth2) = newWeights.get((helper, called), (1, 0))
+                    _mergeWeight(newWeights, (caller, called),
+                                 (count, depth + depth2))
+            for called in helperCallees :
+                newWeights.pop((helper, called), None)
+            newWeights.pop((helper, helper), None)
+        nCollapsed += 1
+    o = dict([(k, sorted(v)) for (k, v) in callees.items()])
+    if newWeights is not None :
+        newWeights = dict([(k, v) for (k, v) in newWeights.items()
+                           if k[0] in o and k[1] in o])
+    return (o, newWeights, nCollapsed)
+
+### ** groupByModule(relations, weights)
+
+def groupByModule(relations, weights = None) :
+    """Merge the functions of each module into one node, named after the
+    module (the qualified name of a function without its last part).
+    Functions with an unqualified name and the cycles condensed by
+    :func:`condenseRelations` are kept as they are. The weights of
+    the merged calls are combined (see :func:`_mergeWeight`) and the calls
+    within a module are dropped.
+
+    Args:
+        relations (dict): Dictionary describing the function relations
+        weights (dict): Weights of the calls, or None
+
+    Returns:
+        tuple: (relations dictionary, weights dictionary or None)
+
+    """
+    def moduleOf(f) :
+        return f if _isCondensed(f) else f.rsplit(".", 1)[0]
+    o = dict()
+    for f in _getFuncFromRelations(relations, True) :
+        o.setdefault(moduleOf(f), set())
+    newWeights = None if weights is None else dict()
+    for (caller, called) in _iterEdges(relations) :
+        edge = (moduleOf(caller), moduleOf(called))
+        if edge[0] == edge[1] and edge[0] != caller :
+            continue
+        o[edge[0]].add(edge[1])
+        if newWeights is not None :
+            _mergeWeight(newWeights, edge,
+                         weights.get((caller, called), (1, 0)))
+    return (dict([(k, sorted(v)) for (k, v) in o.items()]), newWeights)
+
+### ** keepHeaviestCalls(relations, weights, maxEdges, maxNodes, drawSingles)
+
+def keepHeaviestCalls(relations, weights = None, maxEdges = None,
+                      maxNodes = None, drawSingles = False) :
+    """Keep the calls with the most call sites (then the deepest in loops),
+    and the nodes with the heaviest kept calls
+
+    Args:
+        relations (dict): Dictionary describing the function relations
+        weights (dict): Weights of the calls, or None (all calls then have
+          the same weight, and the order of the names breaks the ties)
+        maxEdges (int): Maximum number of calls, or None
+        maxNodes (int): Maximum number of nodes, or None
+        drawSingles (boolean): If True, the functions which are not calling
+          nor called by another function count as nodes
+
+    Returns:
+        tuple: (relations dictionary, weights dictionary or None)
+
+    """
+    if weights is None :
+        weightOf = lambda edge : (1, 0)
+    else :
+        weightOf = lambda edge : weights.get(edge, (1, 0))
+    edges = sorted(_iterEdges(relations),
+                   key = lambda edge : (-weightOf(edge)[0], -weightOf(edge)[1],
+                                        edge))
+    if maxEdges is not None :
+        edges = edges[:maxEdges]
+    nodes = _getFuncFromRelations(relations, drawSingles)
+    if maxNodes is not None and len(nodes) > maxNodes :
+        score = dict([(f, 0) for f in nodes])
+        for edge in edges :
+            score[edge[0]] += weightOf(edge)[0]
+            score[edge[1]] += weightOf(edge)[0]
+        nodes = sorted(nodes, key = lambda f : (-score[f], f))[:maxNodes]
+        keptNodes = set(nodes)
+        edges = [x for x in edges if x[0] in keptNodes and x[1] in keptNodes]
+    o = dict([(f, []) for f in nodes])
+    for (caller, called) in sorted(edges) :
+        o.setdefault(caller, []).append(called)
+    if weights is not None :
+        weights = dict([(x, weights[x]) for x in edges if x in weights])
+    return (o, weights)
+
+### ** getDotOptions(parsedArgs)
+
+def getDotOptions(parsedArgs) :
+    """Produce a dictionary with dot options from parsed arguments.
+    """
+    options = dict()
+    options["nodeShape"] = parsedArgs.nodeShape
+    return options
+
+### ** iterDotSubgraphs(subgraphGroups, builtIn)
+
+def iterDotSubgraphs(subgraphGroups, builtIn = False) :
+    """Generate the dot content describing clusters of nodes, chunk by chunk
+
+    Args:
+        subgraphGroups (dict): Dictionary mapping cluster names (str) and the
+          dot identifiers of their elements (list of str)
+        builtIn (boolean): If False, skip the "built-in" cluster
+
+    Yields:
+        str: Chunks of dot content
+
+    """
+    for cluster in sorted(subgraphGroups.keys()) :
+        if (cluster != "built-in" or builtIn) :
+            yield "subgraph " + _dotId("cluster" + cluster) + " {\n"
+            yield "label = \"" + cluster + "\";"
+            for element in subgraphGroups[cluster] :
+                yield element + ";\n"
+            yield "}\n"
+
+### ** writeDotSubgraphs(subgraphGroups, builtIn)
+
+def writeDotSubgraphs(subgraphGroups, builtIn = False) :
+    return "".join(iterDotSubgraphs(subgraphGroups, builtIn))
+
+### ** _getFuncFromRelations(relations, getSingles = False)
+
+def _getFuncFromRelations(relations, getSingles = False) :
+    """Get the list of all functions present in a dictionary describing 
+    function call relations
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations, output from :func:`getFunctionCalls` or
+          :func:`filterLocalCalls`
+        getSingles (boolean): If False, do not return functions which are not 
+          calling nor called by another function
+
+    Returns:
+        list: List of function names
+
+    """
+    if isinstance(relations, (CsrGraph, SpilledEdges)) :
+        return relations.functions(getSingles)
+    allFunctions = set([])
+    if getSingles :
+        for caller in relations.keys() :
+            allFunctions.add(caller)
+            for called in relations[caller] :
+                allFunctions.add(called)
+    else :
+        for caller in relations.keys() :
+            for called in relations[caller] :
+                allFunctions.add(caller)
+                allFunctions.add(called)
+    return sorted(allFunctions)
+
+### ** _iterEdges(relations)
+
+def _iterEdges(relations) :
+    """Iterate over the (caller, called) pairs of a relations dictionary, of
+    a :class:`CsrGraph` or of a :class:`SpilledEdges`, in sorted caller order
+    """
+    if isinstance(relations, (CsrGraph, SpilledEdges)) :
+        for edge in relations.iterEdges() :
+            yield edge
+    else :
+        for caller in sorted(relations.keys()) :
+            for called in relations[caller] :
+                yield (caller, called)
+
+### ** _isPrivate(name), _isMain(name) and _isCondensed(name)
+
+def _isPrivate(name) :
+    """Test if a (possibly qualified) function name is private"""
+    return (not _isCondensed(name) and
+            name.rsplit(".", 1)[-1].startswith("_"))
+
+def _isMain(name) :
+    """Test if a (possibly qualified) function name is a main function"""
+    return name.rsplit(".", 1)[-1].startswith("_main")
+
+def _isCondensed(name) :
+    """Test if a node name is a cycle condensed by :func:`condenseRelations`"""
+    return name.startswith("(")
+
+### ** _dotId(name)
+
+DOT_KEYWORDS = set(["node", "edge", "graph", "digraph", "subgraph", "strict"])
+
+def _dotId(name) :
+    """Format a function name as a dot identifier, quoting it if it is not a
+    plain identifier (e.g. qualified names containing dots).
+
+    Args:
+        name (str): Function name
+
+    Returns:
+        str: Dot identifier
+
+    """
+    if (re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", name) and
+        name.lower() not in DOT_KEYWORDS) :
+        return name
+    return "\"" + name.replace("\"", "\\\"") + "\""
+
+### ** _dotNodeStyle(dotOptions, fillColor)
+
+def _dotNodeStyle(dotOptions, fillColor) :
+    return ("node[shape=" + dotOptions["nodeShape"] + "," +
+            "style=filled," +
+            "fillcolor=\"" + fillColor + "\"];\n")
+
+### ** _dotEdgeAttributes(weight)
+
+def _dotEdgeAttributes(weight) :
+    """Get the dot attributes of an edge with a (number of call sites, loop
+    depth) weight. The label gives the number of call sites, followed by the
+    loop depth if the call is made in a loop; the width grows with the
+    logarithm of the number of call sites and with the loop depth.
+    """
+    if weight is None :
+        return ""
+    (count, depth) = weight
+    label = str(count) + (" (loop " + str(depth) + ")" if depth else "")
+    penwidth = min(1 + math.log(count, 2) + depth, 8)
+    return " [penwidth=" + ("%g" % round(penwidth, 2)) + ",label=\"" + label + "\"]"
+
+### ** iterDotContent(relations, dotOptions, drawSingles, weights)
+
+def iterDotContent(relations, dotOptions = None, drawSingles = False,
+                   weights = None) :
+    """Generate the dot content describing function call relations, chunk by
+    chunk, without building the whole document in memory
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations, output from :func:`getFunctionCalls` or
+          :func:`filterLocalCalls`
+        dotOptions (dict): Dot options, from :func:`getDotOptions`. The
+          optional "clusters" entry maps cluster names to the functions to
+          draw in them, and the "label" entry is a caption of the graph.
+        drawSingles (boolean): If True, also draw the functions which are not
+          calling nor called by another function
+        weights (dict): If not None, weights of the calls (see
+          :func:`resolveCalls`), drawn as the width and label of the edges
+          (see :func:`_dotEdgeAttributes`)
+
+    Yields:
+        str: Chunks of dot content (one statement per chunk)
+
+    """
+    if dotOptions is None :
+        dotOptions = dict()
+    hasShape = "nodeShape" in dotOptions
+    yield "digraph G {\n"
+    yield "rankdir=LR;\n"
+    yield "subgraph cluster_1 {\n"
+    allFunctions = _getFuncFromRelations(relations, drawSingles)
+    if hasShape :
+        yield _dotNodeStyle(dotOptions, "#dfaf8f")
+    for f in allFunctions :
+        if _isPrivate(f) and not _isMain(f):
+            yield _dotId(f) + ";\n"
+    if hasShape :
+        yield _dotNodeStyle(dotOptions, "#7cb8bb")
+    for f in allFunctions :
+        if not _isPrivate(f) :
+            yield _dotId(f) + ";\n"
+    if hasShape :
+        yield _dotNodeStyle(dotOptions, "#9fc59f")
+    for f in allFunctions :
+        if _isMain(f) :
+            yield _dotId(f) + ";\n"
+    if "clusters" in dotOptions :
+        drawn = set(allFunctions)
+        clusters = dict()
+        for (cluster, elements) in sorted(dotOptions["clusters"].items()) :
+            clusters[cluster] = [_dotId(x) for x in elements if x in drawn]
+        for chunk in iterDotSubgraphs(clusters, True) :
+            yield chunk
+    if weights is None :
+        for (caller, called) in _iterEdges(relations) :
+            yield _dotId(caller) + " -> " + _dotId(called) + ";\n"
+    else :
+        for (caller, called) in _iterEdges(relations) :
+            yield (_dotId(caller) + " -> " + _dotId(called) +
+                   _dotEdgeAttributes(weights.get((caller, called))) + ";\n")
+    yield "}\n"
+    if "label" in dotOptions :
+        # Set after cluster_1 so that the cluster does not inherit it
+        yield ("label=\"" + dotOptions["label"].replace("\"", "\\\"") +
+               "\";\nlabelloc=b;\n")
+    yield "}\n"
+
+### ** writeDotContent(relations, stream, dotOptions, drawSingles, weights)
+
+def writeDotContent(relations, stream, dotOptions = None, drawSingles = False,
+                    weights = None) :
+    """Write the dot content describing function call relations to a stream,
+    as it is generated
+
+    Args:
+        relations (dict): Dictionary describing the function relations
+        stream (file): File-like object to write to
+        dotOptions (dict): Dot options, from :func:`getDotOptions`
+        drawSingles (boolean): If True, also draw the functions which are not
+          calling nor called by another function
+        weights (dict): If not None, weights of the calls (see
+          :func:`iterDotContent`)
+
+    """
+    write = stream.write
+    for chunk in iterDotContent(relations, dotOptions, drawSingles, weights) :
+        write(chunk)
+
+### ** makeDotFileContent(relations, dotOptions, drawSingles, weights)
+
+def makeDotFileContent(relations, dotOptions = None, drawSingles = False,
+                       weights = None) :
+    return "".join(iterDotContent(relations, dotOptions, drawSingles, weights))
+
+### ** writeJsonLines(relations, stream, dotOptions, drawSingles, weights)
+
+def writeJsonLines(relations, stream, dotOptions = None, drawSingles = False,
+                   weights = None) :
+    """Write function call relations as JSON Lines: one JSON object per line,
+    first the nodes (``{"type": "node", "id": ...}``) then the edges
+    (``{"type": "edge", "source": ..., "target": ...}``, with ``count`` and
+    ``loopDepth`` fields if ``weights`` is given)
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        stream (file): File-like object to write to
+        dotOptions (dict): Ignored, for compatibility with the other writers
+        drawSingles (boolean): If True, also write the functions which are not
+          calling nor called by another function
+        weights (dict): If not None, weights of the calls (see
+          :func:`resolveCalls`)
+
+    """
+    write = stream.write
+    for f in _getFuncFromRelations(relations, drawSingles) :
+        write(json.dumps({"type" : "node", "id" : f}, sort_keys = True))
+        write("\n")
+    for (caller, called) in _iterEdges(relations) :
+        edge = {"type" : "edge", "source" : caller, "target" : called}
+        if weights is not None and (caller, called) in weights :
+            (edge["count"], edge["loopDepth"]) = weights[(caller, called)]
+        write(json.dumps(edge, sort_keys = True))
+        write("\n")
+
+### ** writeGraphML(relations, stream, dotOptions, drawSingles, weights)
+
+def writeGraphML(relations, stream, dotOptions = None, drawSingles = False,
+                 weights = None) :
+    """Write function call relations as a GraphML document. If ``weights`` is
+    given, the edges have ``count`` and ``loopDepth`` data.
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        stream (file): File-like object to write to
+        dotOptions (dict): Ignored, for compatibility with the other writers
+        drawSingles (boolean): If True, also write the functions which are not
+          calling nor called by another function
+        weights (dict): If not None, weights of the calls (see
+          :func:`resolveCalls`)
+
+    """
+    write = stream.write
+    write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n")
+    write("<graphml xmlns=\"http://graphml.graphdrawing.org/xmlns\">\n")
+    if weights is not None :
+        for key in ["count", "loopDepth"] :
+            write("<key id=\"" + key + "\" for=\"edge\" attr.name=\"" + key +
+                  "\" attr.type=\"int\"/>\n")
+    write("<graph id=\"G\" edgedefault=\"directed\">\n")
+    for f in _getFuncFromRelations(relations, drawSingles) :
+        write("<node id=" + quoteattr(f) + "/>\n")
+    for (caller, called) in _iterEdges(relations) :
+        edge = ("<edge source=" + quoteattr(caller) + " target=" +
+                quoteattr(called))
+        weight = None if weights is None else weights.get((caller, called))
+        if weight is None :
+            write(edge + "/>\n")
+        else :
+            write(edge + "><data key=\"count\">" + str(weight[0]) +
+                  "</data><data key=\"loopDepth\">" + str(weight[1]) +
+                  "</data></edge>\n")
+    write("</graph>\n")
+    write("</graphml>\n")
+
+### ** writeBinaryEdgeList(relations, stream, dotOptions, drawSingles, weights)
+
+def writeBinaryEdgeList(relations, stream, dotOptions = None,
+                        drawSingles = False, weights = None) :
+    """Write function call relations as a compact binary edge list. All the
+    integers are unsigned 32-bit little-endian::
+
+        magic (8 bytes: "PYDEPEL\\x01", or "PYDEPEL\\x02" with weights)
+        number of nodes
+        for each node: length of the UTF-8 name, name
+        number of edges
+        for each edge: source node index, target node index
+        with weights, for each edge: number of call sites, loop depth
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        stream (file): Binary file-like object to write to. If it has a
+          ``buffer`` attribute (text streams in Python 3), the buffer is used.
+        dotOptions (dict): Ignored, for compatibility with the other writers
+        drawSingles (boolean): If True, also write the functions which are not
+          calling nor called by another function
+        weights (dict): If not None, weights of the calls (see
+          :func:`resolveCalls`). Missing weights are written as (0, 0).
+
+    """
+    stream = getattr(stream, "buffer", stream)
+    write = stream.write
+    nodes = _getFuncFromRelations(relations, drawSingles)
+    ids = dict(zip(nodes, range(len(nodes))))
+    write(EDGE_LIST_MAGIC if weights is None else EDGE_LIST_WEIGHTED_MAGIC)
+    write(struct.pack("<I", len(nodes)))
+    for f in nodes :
+        name = f.encode("utf-8")
+        write(struct.pack("<I", len(name)))
+        write(name)
+    if isinstance(relations, (CsrGraph, SpilledEdges)) :
+        nEdges = relations.nEdges()
+    else :
+        nEdges = sum([len(x) for x in relations.values()])
+    write(struct.pack("<I", nEdges))
+    chunk = []
+    for (caller, called) in _iterEdges(relations) :
+        chunk.append(ids[caller])
+        chunk.append(ids[called])
+        if len(chunk) >= 8192 :
+            write(struct.pack("<%dI" % len(chunk), *chunk))
+            chunk = []
+    if chunk :
+        write(struct.pack("<%dI" % len(chunk), *chunk))
+    if weights is None :
+        return
+    chunk = []
+    for edge in _iterEdges(relations) :
+        chunk.extend(weights.get(edge, (0, 0)))
+        if len(chunk) >= 8192 :
+            write(struct.pack("<%dI" % len(chunk), *chunk))
+            chunk = []
+    if chunk :
+        write(struct.pack("<%dI" % len(chunk), *chunk))
+
+### ** readBinaryEdgeList(stream, withWeights)
+
+def readBinaryEdgeList(stream, withWeights = False) :
+    """Read a binary edge list written by :func:`writeBinaryEdgeList`
+
+    Args:
+        stream (file): Binary file-like object to read from
+        withWeights (boolean): If True, also return the weights
+
+    Returns:
+        tuple: (list of node names, list of (source index, target index)
+          tuples). If ``withWeights`` is True, a third element is added: the
+          list of the (number of call sites, loop depth) tuples of the edges,
+          or None if the file has no weights.
+
+    """
+    stream = getattr(stream, "buffer", stream)
+    magic = stream.read(len(EDGE_LIST_MAGIC))
+    if magic not in (EDGE_LIST_MAGIC, EDGE_LIST_WEIGHTED_MAGIC) :
+        raise Exception("Not a pydep binary edge list")
+    (nNodes,) = struct.unpack("<I", stream.read(4))
+    nodes = []
+    for i in range(nNodes) :
+        (length,) = struct.unpack("<I", stream.read(4))
+        nodes.append(stream.read(length).decode("utf-8"))
+    (nEdges,) = struct.unpack("<I", stream.read(4))
+    values = struct.unpack("<%dI" % (2 * nEdges), stream.read(8 * nEdges))
+    edges = list(zip(values[0::2], values[1::2]))
+    if not withWeights :
+        return (nodes, edges)
+    weights = None
+    if magic == EDGE_LIST_WEIGHTED_MAGIC :
+        values = struct.unpack("<%dI" % (2 * nEdges), stream.read(8 * nEdges))
+        weights = list(zip(values[0::2], values[1::2]))
+    return (nodes, edges, weights)
+
+### ** Output formats
+
+OUTPUT_WRITERS = {
+    "dot" : writeDotContent,
+    "jsonl" : writeJsonLines,
+    "graphml" : writeGraphML,
+    "edgelist" : writeBinaryEdgeList
+}
+
+OUTPUT_EXTENSIONS = {
+    "dot" : ".dot",
+    "jsonl" : ".jsonl",
+    "graphml" : ".graphml",
+    "edgelist" : ".edgelist"
+}
+
+### ** writeRelations(relations, stream, outputFormat, dotOptions, drawSingles, weights)
+
+def writeRelations(relations, stream, outputFormat = "dot", dotOptions = None,
+                   drawSingles = False, weights = None) :
+    """Write function call relations to a stream in a given format
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        stream (file): File-like object to write to
+        outputFormat (str): One of the keys of ``OUTPUT_WRITERS`` ("dot",
+          "jsonl", "graphml" or "edgelist")
+        dotOptions (dict): Dot options, from :func:`getDotOptions`
+        drawSingles (boolean): If True, also write the functions which are not
+          calling nor called by another function
+        weights (dict): If not None, weights of the calls (see
+          :func:`resolveCalls`)
+
+    """
+    if outputFormat not in OUTPUT_WRITERS :
+        raise Exception("Unknown output format: " + str(outputFormat))
+    OUTPUT_WRITERS[outputFormat](relations, stream, dotOptions, drawSingles,
+                                 weights)
+
+### ** renderDot(content, imageFormat, output, engine, cacheDir, options, timeout)
+
+def renderDot(content, imageFormat = "png", output = None, engine = "dot",
+              cacheDir = None, options = None, timeout = None) :
+    """Render a dot content with Graphviz. The image goes straight from the
+    layout engine to its destination and is never held in memory. If a
+    render cache is given, the image is taken from it when the same content
+    was already rendered (see :func:`_renderCached`).
+
+    Args:
+        content (str or iterable of str): Dot content, or chunks of it (e.g.
+          from :func:`iterDotContent`)
+        imageFormat (str): Graphviz output format (``-T`` option, e.g. png,
+          svg or pdf)
+        output (str or file): Output file name, or stream. A stream with a
+          file descriptor is handed to the engine as its stdout; the image is
+          copied by blocks into other streams. If None, use sys.stdout
+        engine (str): Graphviz layout program
+        cacheDir (str): Render cache directory, or None
+        options (list of str): Additional command line options of the engine
+        timeout (float): If not None, the engine is killed after this number
+          of seconds and :class:`RenderTimeout` is raised. The image is then
+          written to a temporary file first, so that no partial image is
+          written to a stream.
+
+    Returns:
+        int: The return code of the engine (0 if a cache is used, since a
+          failure of the engine then raises an exception)
+
+    """
+    if cacheDir is not None :
+        _copyImage(_renderCached(content, imageFormat, engine, cacheDir,
+                                 timeout = timeout),
+                   output)
+        return 0
+    if timeout is not None and not isinstance(output, str) :
+        (fd, imagePath) = tempfile.mkstemp()
+        os.close(fd)
+        try :
+            status = renderDot(content, imageFormat, imagePath, engine,
+                               options = options, timeout = timeout)
+            if status == 0 :
+                _copyImage(imagePath, output)
+        finally :
+            os.remove(imagePath)
+        return status
+    program = _findProgram(engine)
+    if program is None :
+        raise Exception(engine + " (Graphviz) is missing, cannot render the "
+                        "graph")
+    command = [program, "-T" + imageFormat] + list(options or [])
+    if output is None :
+        output = sys.stdout
+    if isinstance(output, str) :
+        command += ["-o", output]
+        stdout = None
+    else :
+        try :
+            output.fileno()
+            output.flush()
+            stdout = output
+        except (AttributeError, IOError, ValueError) :
+            stdout = subprocess.PIPE
+    process = subprocess.Popen(command, stdin = subprocess.PIPE,
+                               stdout = stdout, bufsize = -1)
+    killed = []
+    if timeout is not None :
+        timer = threading.Timer(timeout, _killProcess, [process, killed])
+        timer.start()
+    try :
+        status = _runEngine(process, content, output, stdout)
+    finally :
+        if timeout is not None :
+            timer.cancel()
+    if killed and status != 0 :
+        raise RenderTimeout(engine + " did not finish in " + ("%g" % timeout) +
+                            " s")
+    return status
+
+### ** _runEngine(process, content, output, stdout)
+
+def _runEngine(process, content, output, stdout) :
+    """Feed a started Graphviz process with a dot content, copy its output if
+    it goes through a pipe, and wait for it (see :func:`renderDot`)"""
+    if stdout is subprocess.PIPE :
+        # Feed the engine from another thread to avoid a deadlock between its
+        # input and output pipes
+        feeder = threading.Thread(target = _feedProcess,
+                                  args = (process, content))
+        feeder.start()
+        output = getattr(output, "buffer", output)
+        for block in iter(lambda : process.stdout.read(65536), b"") :
+            output.write(block)
+        process.stdout.close()
+        feeder.join()
+    else :
+        _feedProcess(process, content)
+    return process.wait()
+
+### ** _killProcess(process, killed)
+
+def _killProcess(process, killed) :
+    """Kill a process if it is still running, and record it in the ``killed``
+    list (called by the timer of :func:`renderDot`)"""
+    if process.poll() is None :
+        try :
+            process.kill()
+        except OSError :
+            pass
+        killed.append(process)
+
+### ** chooseEngine(relations, engine, drawSingles)
+
+def chooseEngine(relations, engine = "auto", drawSingles = False) :
+    """Choose the Graphviz layout engine of a graph. The "auto" engine is
+    ``dot`` for graphs of up to ``AUTO_ENGINE_NODES`` nodes, and ``sfdp`` (if
+    available) for larger ones.
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        engine (str): Requested engine; anything else than "auto" is returned
+          as is
+        drawSingles (boolean): If True, the functions which are not calling
+          nor called by another function count as nodes
+
+    Returns:
+        str: Name of the layout engine
+
+    """
+    if engine != "auto" :
+        return engine
+    if (len(_getFuncFromRelations(relations, drawSingles)) > AUTO_ENGINE_NODES
+        and _findProgram("sfdp") is not None) :
+        return "sfdp"
+    return "dot"
+
+### ** renderWithFallback(relations, imageFormat, output, dotOptions, drawSingles, weights, engine, timeout, cacheDir, stderr)
+
+def renderWithFallback(relations, imageFormat = "png", output = None,
+                       dotOptions = None, drawSingles = False, weights = None,
+                       engine = "auto", timeout = None, cacheDir = None,
+                       stderr = None) :
+    """Render function call relations with a time limit. When the engine
+    times out, the render is retried with ``sfdp`` if ``dot`` was used, and
+    otherwise with the graph halved by :func:`getLevelOfDetail`, until it
+    succeeds.
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        imageFormat (str): Graphviz output format
+        output (str or file): Output file name or stream (see
+          :func:`renderDot`)
+        dotOptions (dict): Dot options, from :func:`getDotOptions`
+        drawSingles (boolean): If True, also draw the functions which are not
+          calling nor called by another function
+        weights (dict): Weights of the calls, or None (see
+          :func:`resolveCalls`)
+        engine (str): Layout engine, or "auto" (see :func:`chooseEngine`)
+        timeout (float): Time limit of each render, in seconds, or None
+        cacheDir (str): Render cache directory, or None
+        stderr (file): Stream for the retry messages. If None, use sys.stderr
+
+    Returns:
+        int: The return code of the engine
+
+    """
+    if stderr is None :
+        stderr = sys.stderr
+    if dotOptions is None :
+        dotOptions = dict()
+    engine = chooseEngine(relations, engine, drawSingles)
+    while True :
+        content = iterDotContent(relations, dotOptions, drawSingles, weights)
+        try :
+            return renderDot(content, imageFormat, output, engine,
+                             cacheDir = cacheDir, timeout = timeout)
+        except RenderTimeout as e :
+            nNodes = len(_getFuncFromRelations(relations, drawSingles))
+            if engine == "dot" and _findProgram("sfdp") is not None :
+                engine = "sfdp"
+                retry = engine
+            elif nNodes > 1 :
+                (relations, weights, elided, clusters) = getLevelOfDetail(
+                    relations, maxNodes = nNodes // 2, weights = weights,
+                    drawSingles = drawSingles)
+                dotOptions = dict(dotOptions)
+                if clusters :
+                    dotOptions["clusters"] = clusters
+                dotOptions["label"] = ((dotOptions["label"] + "; "
+                                        if "label" in dotOptions
+                                        else "pydep: ") + "; ".join(elided))
+                retry = "at most " + str(nNodes // 2) + " nodes"
+            else :
+                raise
+            stderr.write("pydep: " + str(e) + ", retrying with " + retry +
+                         "\n")
+
+### ** _feedProcess(process, content)
+
+def _feedProcess(process, content) :
+    """Write a dot content, or the chunks of it, to the stdin of a process
+    and close it. A broken pipe is ignored: the process exited early, which
+    is reported by its return code."""
+    try :
+        for chunk in _encodeChunks(content) :
+            process.stdin.write(chunk)
+        process.stdin.close()
+    except (IOError, OSError) :
+        pass
+
+### ** renderPacked(relations, imageFormat, output, dotOptions, drawSingles, weights, jobs, cacheDir)
+
+def renderPacked(relations, imageFormat = "png", output = None,
+                 dotOptions = None, drawSingles = False, weights = None,
+                 jobs = 1, cacheDir = None) :
+    """Render function call relations by laying out their weakly connected
+    components separately, with several ``dot`` processes running
+    concurrently, and packing the laid out pieces into one image with
+    ``gvpack`` and ``neato -n2`` (as in ``ccomps -x | dot | gvpack | neato
+    -s -n2``). The relations are rendered with a single ``dot`` process if they
+    have only one component or if ``gvpack`` or ``neato`` are missing.
+
+    Args:
+        relations (dict or CsrGraph): Dictionary describing the function
+          relations
+        imageFormat (str): Graphviz output format
+        output (str or file): Output file name or stream (see
+          :func:`renderDot`)
+        dotOptions (dict): Dot options, from :func:`getDotOptions`
+        drawSingles (boolean): If True, also draw the functions which are not
+          calling nor called by another function
+        weights (dict): Weights of the calls, or None (see
+          :func:`resolveCalls`)
+        jobs (int): Number of concurrent ``dot`` processes (0 for one per CPU)
+        cacheDir (str): Render cache directory, or None
+
+    Returns:
+        int: The return code of the last engine
+
+    """
+    if isinstance(relations, CsrGraph) :
+        relations = relations.toRelations()
+    components = getWeaklyConnectedComponents(relations, drawSingles)
+    if (len(components) < 2 or _findProgram("gvpack") is None or
+        _findProgram("neato") is None) :
+        return renderDot(iterDotContent(relations, dotOptions, drawSingles,
+                                        weights),
+                         imageFormat, output, cacheDir = cacheDir)
+    if cacheDir is not None :
+        render = lambda path : renderPacked(relations, imageFormat, path,
+                                            dotOptions, drawSingles, weights,
+                                            jobs)
+        content = iterDotContent(relations, dotOptions, drawSingles, weights)
+        _copyImage(_renderCached(content, imageFormat, "dot+gvpack",
+                                 cacheDir, render), output)
+        return 0
+    if not jobs :
+        jobs = multiprocessing.cpu_count()
+    batches = _balanceComponents(components, jobs)
+    def layout(batch) :
+        content = []
+        for component in batch :
+            pieceRelations = dict([(f, relations[f]) for f in component
+                                   if f in relations])
+            content.extend(iterDotContent(pieceRelations, dotOptions,
+                                          drawSingles, weights))
+        process = subprocess.Popen([_findProgram("dot"), "-Tdot"],
+                                   stdin = subprocess.PIPE,
+                                   stdout = subprocess.PIPE)
+        laidOut = process.communicate(b"".join(_encodeChunks(content)))[0]
+        return (process.returncode, laidOut)
+    if _findProgram("dot") is None :
+        raise Exception("dot (Graphviz) is missing, cannot render the graph")
+    pool = multiprocessing.pool.ThreadPool(len(batches))
+    try :
+        layouts = pool.map(layout, batches)
+    finally :
+        pool.close()
+        pool.join()
+    for (status, laidOut) in layouts :
+        if status != 0 :
+            return status
+    pack = subprocess.Popen([_findProgram("gvpack")], stdin = subprocess.PIPE,
+                            stdout = subprocess.PIPE)
+    packed = pack.communicate(b"".join([x[1] for x in layouts]))[0]
+    if pack.returncode != 0 :
+        return pack.returncode
+    return renderDot(packed, imageFormat, output, "neato", options = ["-s", "-n2"])
+
+### ** _balanceComponents(components, nBatches)
+
+def _balanceComponents(components, nBatches) :
+    """Distribute graph components into batches of similar sizes, assigning
+    each component (the largest first) to the smallest batch
+
+    Args:
+        components (list of list of str): Components, the largest first
+        nBatches (int): Maximum number of batches
+
+    Returns:
+        list of list: List of non-empty batches (lists of components)
+
+    """
+    batches = [[] for i in range(min(nBatches, len(components)))]
+    heap = [(0, i) for i in range(len(batches))]
+    for component in components :
+        (size, i) = heapq.heappop(heap)
+        batches[i].append(component)
+        heapq.heappush(heap, (size + len(component), i))
+    return batches
+
+### ** _encodeChunks(content)
+
+def _encodeChunks(content) :
+    """Iterate over a dot content, or the chunks of it, as bytes"""
+    if isinstance(content, (bytes, type(u""))) :
+        content = [content]
+    for chunk in content :
+        if not isinstance(chunk, bytes) :
+            chunk = chunk.encode("utf-8")
+        yield chunk
+
+### ** _renderCacheKey(content, imageFormat, engine)
+
+def _renderCacheKey(content, imageFormat, engine) :
+    """Compute the key of a rendered image in the render cache
+
+    Args:
+        content (bytes): Dot content
+        imageFormat (str): Graphviz output format
+        engine (str): Graphviz layout program
+
+    Returns:
+        str: Hexadecimal digest
+
+    """
+    h = hashlib.sha1()
+    tag = "pydep-render-%s-%s\n" % (engine, imageFormat)
+    h.update(tag.encode("utf-8"))
+    h.update(content)
+    return h.hexdigest()
+
+### ** _renderCached(content, imageFormat, engine, cacheDir, render, timeout)
+
+def _renderCached(content, imageFormat, engine, cacheDir, render = None,
+                  timeout = None) :
+    """Get the image rendered from a dot content in the render cache, running
+    the layout engine only if this content was never rendered with the same
+    engine and format. Using an entry refreshes its modification time, which
+    is used for LRU eviction by :func:`pruneCache`.
 
-def astParseFile(sourceFileName) :
-    """Parse a source file using the ``ast`` module
-    
     Args:
-        sourceFileName (str): Name of the source file to parse
+        content (str or iterable of str): Dot content, or chunks of it
+        imageFormat (str): Graphviz output format
+        engine (str): Graphviz layout program, used in the key
+        cacheDir (str): Render cache directory
+        render (function): If not None, function rendering the image into the
+          file name given as argument and returning the engine return code,
+          used instead of :func:`renderDot`
+        timeout (float): Time limit of the engine, or None (see
+          :func:`renderDot`)
 
     Returns:
-        ast.Module: Output from ``ast.parse`` (ast.Module object)
+        str: Path to the cached image
 
     """
-    with open(sourceFileName, "r") as fi :
-        source = fi.read()
-    return(ast.parse(source))
+    data = b"".join(_encodeChunks(content))
+    path = _cachePath(cacheDir, _renderCacheKey(data, imageFormat, engine))
+    try :
+        os.utime(path, None)
+        return path
+    except OSError :
+        pass
+    _initCacheDir(cacheDir)
+    entryDir = os.path.dirname(path)
+    try :
+        os.makedirs(entryDir)
+    except OSError :
+        if not os.path.isdir(entryDir) :
+            raise
+    (fd, tmpPath) = tempfile.mkstemp(dir = entryDir)
+    os.close(fd)
+    try :
+        if render is None :
+            status = renderDot(data, imageFormat, tmpPath, engine,
+                               timeout = timeout)
+        else :
+            status = render(tmpPath)
+        if status != 0 :
+            raise Exception(engine + " failed with status " + str(status))
+        os.rename(tmpPath, path)
+    finally :
+        if os.path.exists(tmpPath) :
+            os.remove(tmpPath)
+    return path
 
-### ** _getImportedModules(astParsedSource)
+### ** _copyImage(path, output)
 
-def _getImportedModules(astParsedSource) :
-    importFromStatements = [(x.names[0].name, x.names[0].asname)
-                            for x in astParsedSource.body if x.__class__ == ast.ImportFrom]
-    importStatements = [(x.names[0].name, x.names[0].asname)
-                        for x in astParsedSource.body if x.__class__ == ast.Import]
-    return(importFromStatements + importStatements)
-    
-### ** getFunctionDef(astParsedSource)
+def _copyImage(path, output) :
+    """Copy an image file to an output file name or stream (sys.stdout if
+    None)"""
+    if output is None :
+        output = sys.stdout
+    if isinstance(output, str) :
+        shutil.copyfile(path, output)
+        return
+    output = getattr(output, "buffer", output)
+    with open(path, "rb") as fi :
+        shutil.copyfileobj(fi, output)
 
-def getFunctionDef(astParsedSource) :
-    """Extract the function definitions from a parsed source file
+### ** viewDotContent(content)
+
+def viewDotContent(content, wait = True, imageFormat = "png",
+                   cacheDir = None, engine = "dot") :
+    """Display the rendered graph from a dot content, using ``ImageMagick``. 
+    ``Dot`` and ``ImageMagick`` should be installed for this to work. The
+    output of ``dot`` is piped directly into ``display``, or, if a render
+    cache is given, ``display`` reads the cached image.
 
     Args:
-        astParsedSource (ast.Module): Parsed source, output from 
-          :func:`astParseFile`
+        content (str or iterable of str): Dot content to be rendered, or
+          chunks of it
+        wait (boolean): If False, return as soon as the image is sent to the
+          ``display`` process
+        imageFormat (str): Image format passed from ``dot`` to ``display``
+        cacheDir (str): Render cache directory, or None (see
+          :func:`_renderCached`)
+        engine (str): Graphviz layout program
 
     Returns:
-        list of ast.FunctionDef: List of the function definitions 
-          (``ast.FunctionDef`` objects)
+        subprocess returncode: The returned value from the ``display`` process,
+          or the ``display`` process itself if ``wait`` is False.
 
     """
-    return([x for x in astParsedSource.body if x.__class__ == ast.FunctionDef])
+    dot = _findProgram(engine)
+    if dot is None or _findProgram("display") is None :
+        raise Exception("Dot or ImageMagick is missing, cannot display the graph")
+    if cacheDir is not None :
+        cached = _renderCached(content, imageFormat, engine, cacheDir)
+        with open(cached, "rb") as fi :
+            pDisplay = _startViewer(imageFormat, fi)
+        if not wait :
+            return pDisplay
+        return pDisplay.wait()
+    pDot = subprocess.Popen([dot, "-T" + imageFormat], stdin = subprocess.PIPE,
+                            stdout = subprocess.PIPE, bufsize = -1)
+    pDisplay = _startViewer(imageFormat, pDot.stdout)
+    # display now owns the read end of the pipe
+    pDot.stdout.close()
+    _feedProcess(pDot, content)
+    pDot.wait()
+    if not wait :
+        return pDisplay
+    return pDisplay.wait()
 
-### ** _getFunctionCallsFromOne(astFunctionDef)
+### ** _startViewer(imageFormat, stdin)
 
-def _getFunctionCallsFromOne(astFunctionDef) :
-    """Extract the function calls from a function definition
+def _startViewer(imageFormat, stdin) :
+    """Start an ImageMagick ``display`` process reading an image from its
+    stdin
 
     Args:
-        astFunctionDef (ast.FunctionDef): Function definition, 
-          ``ast.FunctionDef`` object
+        imageFormat (str): Image format
+        stdin (file): Stdin of the process (a file, a pipe or
+          subprocess.PIPE)
 
     Returns:
-        list: List of (unique) functions called in the function definition
+        subprocess.Popen: The ``display`` process
 
     """
-    calls = [x for x in ast.walk(astFunctionDef) if x.__class__ == ast.Call]
-    calledFunctions = set([x.func.id for x in calls if x.func.__class__ == ast.Name])
-    return list(calledFunctions)
+    display = _findProgram("display")
+    if display is None :
+        raise Exception("ImageMagick is missing, cannot display the graph")
+    # "png:cairo" is a Graphviz renderer, "png:-" the ImageMagick stdin
+    return subprocess.Popen([display, imageFormat.split(":")[0] + ":-"],
+                            stdin = stdin)
 
-### ** getFunctionCalls(listFuncDef)
+### ** _findProgram(program)
 
-def getFunctionCalls(listFuncDef) :
-    """Extract the function calls from a list of function definitions, and 
-    return them in a dictionary
+def _findProgram(program) :
+    """Locate a program on the PATH, without running it. The result is cached
+    for the lifetime of the process.
 
     Args:
-        listFuncDef (list of ast.FunctionDef): List of function definitions
-          (such as returned by :func:`getFunctionDef`)
+        program (str): Name of the program
 
     Returns:
-        dict: Dictionary mapping function names (str) and the functions they 
-          call (list of str)
+        str: Path to the program executable, or None if it was not found
 
     """
-    o = dict()
-    for f in listFuncDef :
-        assert f.name not in o.keys()
-        o[f.name] = _getFunctionCallsFromOne(f)
+    if program in _PROGRAM_PATHS :
+        return _PROGRAM_PATHS[program]
+    extensions = [""]
+    if os.name == "nt" :
+        extensions += os.environ.get("PATHEXT", ".EXE").split(os.pathsep)
+    found = None
+    for directory in os.environ.get("PATH", os.defpath).split(os.pathsep) :
+        for extension in extensions :
+            candidate = os.path.join(directory, program + extension)
+            if os.path.isfile(candidate) and os.access(candidate, os.X_OK) :
+                found = candidate
+                break
+        if found is not None :
+            break
+    _PROGRAM_PATHS[program] = found
+    return found
+
+### ** _isAvailable(program)
+
+def _isAvailable(program) :
+    """Function to test if a program can be called from Python, by looking for
+    it on the PATH (see :func:`_findProgram`).
+
+    Args:
+        program (str): Command to call the program to be tested
+
+    Returns:
+        boolean
+
+    """
+    return _findProgram(program) is not None
+
+
+### ** getRelationsFromSrc(filename, jobs, cacheDir, profiler, getMethods)
+
+def getRelationsFromSrc(filename, jobs = 1, cacheDir = None,
+                        profiler = None, getMethods = False, weights = None) :
+    """Get the local function call relations from a source file or from all
+    the modules below a directory
+
+    Args:
+        filename (str): Name of the source file or of the directory
+        jobs (int): Number of worker processes used for a directory
+        cacheDir (str): Directory of the per-file cache. If None, no cache is
+          used.
+        profiler (Profiler): If not None, record the extraction stages
+        getMethods (boolean): If True, also include the methods (see
+          :func:`resolveCalls`)
+        weights (dict): If not None, dictionary in which the weights of the
+          calls are stored (see :func:`resolveCalls`)
+
+    Returns:
+        dict: Local function calls dictionary, such as returned by
+          :func:`filterLocalCalls` (names are qualified by the module names for
+          a directory, see :func:`getPackageRelations`)
+
+    """
+    if os.path.isdir(filename) :
+        return getPackageRelations(filename, jobs, cacheDir, profiler,
+                                   getMethods, weights)
+    if profiler is None :
+        profiler = Profiler(enabled = False)
+    with profiler.stage("extract") as counts :
+        counts["files"] = 1
+        o = resolveCalls([("", False, _extractFileRecord(filename, cacheDir))],
+                         getMethods, weights)
+        counts["functions"] = len(o)
     return o
 
-### ** filterLocalCalls(funcCallDict)
+### ** expandInputs(patterns)
 
-def filterLocalCalls(funcCallDict) :
-    """Filter a dictionary of function calls to keep only functions which are 
-    defined locally. This is done by filtering the values of the dictionary 
-    (lists) and keeping only in those lists function names which are present
-    in the keys of the dictionary.
+def expandInputs(patterns) :
+    """Expand the glob patterns of a list of input paths. Patterns without a
+    match are kept as they are, empty entries and duplicates are removed.
 
     Args:
-        funcCallDict (dict): Function calls dictionary, output from
-          :func:`getFunctionCalls`
+        patterns (list of str): Input paths or glob patterns
 
     Returns:
-        dict: A copy of the input dictionary, with the value lists filtered to
-          keep only function names present in the keys
+        list of str: Input paths, in the order given
 
     """
-    o = funcCallDict.copy()
-    for k in o.keys() :
-        o[k] = [x for x in o[k] if x in o.keys()]
+    o = []
+    seen = set()
+    for pattern in patterns :
+        pattern = pattern.strip()
+        if not pattern :
+            continue
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for path in matches :
+            if path not in seen :
+                seen.add(path)
+                o.append(path)
     return o
 
-### ** getDotOptions(parsedArgs)
+### ** _commonRoot(filenames)
 
-def getDotOptions(parsedArgs) :
-    """Produce a dictionary with dot options from parsed arguments.
+def _commonRoot(filenames) :
+    """Get the deepest directory containing a list of source files and
+    directories
     """
-    options = dict()
-    options["nodeShape"] = parsedArgs.nodeShape
-    return options
+    dirs = []
+    for filename in filenames :
+        path = os.path.abspath(filename)
+        if not os.path.isdir(path) :
+            path = os.path.dirname(path)
+        dirs.append(path.split(os.sep))
+    return os.sep.join(os.path.commonprefix(dirs)) or os.sep
 
-### ** writeDotSubgraphs(subgraphGroups, builtIn)
+### ** _getBatchGroups(filenames, cacheDir, combine)
 
-def writeDotSubgraphs(subgraphGroups, builtIn = False) :
-    o = ""
-    for cluster in subgraphGroups.keys() :
-        if (cluster != "built-in" or builtIn) :
-            o += "subgraph cluster" + cluster + " {\n"
-            o += "label = \"" + cluster + "\";"
-            for element in subgraphGroups[cluster] :
-                o += element + ";\n"
-            o += "}\n"
-    return o
-        
+def _getBatchGroups(filenames, cacheDir = None, combine = True) :
+    """Get the extraction tasks for several inputs (see
+    :func:`getBatchRelations`)
 
-### ** _getFuncFromRelations(relations, getSingles = False)
+    Returns:
+        list of list: One list of (filename, moduleName, cacheDir) tasks per
+          input. The module names are relative to the common root of the
+          inputs if ``combine`` is True and there are several inputs.
 
-def _getFuncFromRelations(relations, getSingles = False) :
-    """Get the list of all functions present in a dictionary describing 
-    function call relations
+    """
+    combine = combine and len(filenames) > 1
+    root = _commonRoot(filenames) if combine else None
+    groups = []
+    for filename in filenames :
+        if combine :
+            files = (findSourceFiles(filename) if os.path.isdir(filename)
+                     else [filename])
+            groups.append([(f, getModuleName(f, root), cacheDir)
+                           for f in files])
+        elif os.path.isdir(filename) :
+            groups.append(_getPackageTasks(filename, cacheDir))
+        else :
+            groups.append([(filename, "", cacheDir)])
+    return groups
+
+### ** getBatchRelations(filenames, jobs, cacheDir, profiler, getMethods, combine)
+
+def getBatchRelations(filenames, jobs = 1, cacheDir = None, profiler = None,
+                      getMethods = False, combine = True, weights = None) :
+    """Get the local function call relations from several source files and
+    directories. All the files are parsed in a single extraction pass, sharing
+    the worker pool.
+
+    If ``combine`` is True, a single graph is built: the module names are
+    relative to the deepest directory containing all the inputs, and calls
+    between the inputs are resolved through their imports. Otherwise one graph
+    is built per input, as :func:`getRelationsFromSrc` would do.
 
     Args:
-        relations (dict): Dictionary describing the function relations, 
-          output from :func:`getFunctionCalls` or :func:`filterLocalCalls`
-        getSingles (boolean): If False, do not return functions which are not 
-          calling nor called by another function
+        filenames (list of str): Source files and directories
+        jobs (int): Number of worker processes
+        cacheDir (str): Directory of the per-file cache. If None, no cache is
+          used.
+        profiler (Profiler): If not None, record the extraction stages
+        getMethods (boolean): If True, also include the methods (see
+          :func:`resolveCalls`)
+        combine (boolean): If True, build a single graph
+        weights (list): If not None, list to which the dictionary of the
+          weights of the calls of each graph is appended (see
+          :func:`resolveCalls`)
 
     Returns:
-        list: List of function names
+        list of dict: List of local function calls dictionaries, one per input
+          or a single one if ``combine`` is True
 
     """
-    allFunctions = set([])
-    if getSingles :
-        for caller in relations.keys() :
-            allFunctions.add(caller)
-            for called in relations[caller] :
-                allFunctions.add(called)
+    if weights is not None :
+        nGraphs = 1 if combine else len(filenames)
+        weights.extend([dict() for i in range(nGraphs)])
+        weights = weights[-nGraphs:]
     else :
-        for caller in relations.keys() :
-            for called in relations[caller] :
-                allFunctions.add(caller)
-                allFunctions.add(called)
-    return list(allFunctions)
-                
-### ** makeDotFileContent(relations, dotOptions, drawSingles)
+        weights = [None] * len(filenames)
+    if len(filenames) == 1 :
+        return [getRelationsFromSrc(filenames[0], jobs, cacheDir, profiler,
+                                    getMethods, weights[0])]
+    if profiler is None :
+        profiler = Profiler(enabled = False)
+    with profiler.stage("discover") as counts :
+        groups = _getBatchGroups(filenames, cacheDir, combine)
+        tasks = [x for group in groups for x in group]
+        counts["files"] = len(tasks)
+    modules = _extractModules(tasks, jobs, profiler)
+    with profiler.stage("resolve") as counts :
+        if combine :
+            o = [resolveCalls(modules, getMethods, weights[0])]
+        else :
+            o = []
+            start = 0
+            for (group, groupWeights) in zip(groups, weights) :
+                o.append(resolveCalls(modules[start:start + len(group)],
+                                      getMethods, groupWeights))
+                start += len(group)
+        counts["functions"] = sum([len(x) for x in o])
+    return o
 
-def makeDotFileContent(relations, dotOptions = None, drawSingles = False) :
-    if dotOptions is None :
-        dotOptions = dict()
-    o = ""
-    o += "digraph G {\n"
-    o += "rankdir=LR;\n"
-    o += "subgraph cluster_1 {\n"
-    allFunctions = _getFuncFromRelations(relations, drawSingles)
-    if "nodeShape" in dotOptions.keys() :
-        o += ("node[shape=" + dotOptions["nodeShape"] + "," +
-              "style=filled," +
-              "fillcolor=\"" + "#dfaf8f" + "\"];\n")
-    for f in allFunctions :
-        if f.startswith("_") and not f.startswith("_main"):
-            o += f + ";\n"
-    if "nodeShape" in dotOptions.keys() :
-        o += ("node[shape=" + dotOptions["nodeShape"] + "," +
-              "style=filled," +
-              "fillcolor=\"" + "#7cb8bb" + "\"];\n")
-    for f in allFunctions :
-        if not f.startswith("_") :
-            o += f + ";\n"
-    if "nodeShape" in dotOptions.keys() :
-        o += ("node[shape=" + dotOptions["nodeShape"] + "," +
-              "style=filled," +
-              "fillcolor=\"" + "#9fc59f" + "\"];\n")
-    for f in allFunctions :
-        if f.startswith("_main") :
-            o += f + ";\n"
-    for caller in relations.keys() :
-        for called in relations[caller] :
-            o += caller + " -> " + called + ";\n"
-    o += "}\n"        
-    o += "}\n"
-    return(o)
+### ** _iterExtractModules(tasks, jobs)
 
-### ** viewDotContent(content)
+def _iterExtractModules(tasks, jobs = 1) :
+    """Run extraction tasks like :func:`_extractModules`, yielding the records
+    one by one in the order of the tasks instead of returning them all
+    """
+    if not jobs :
+        jobs = multiprocessing.cpu_count()
+    jobs = min(jobs, len(tasks))
+    if jobs <= 1 :
+        for task in tasks :
+            yield _extractModuleTask(task)
+        return
+    pool = multiprocessing.Pool(jobs)
+    try :
+        for module in pool.imap(_extractModuleTask, tasks,
+                                max(1, min(16, len(tasks) // (jobs * 4)))) :
+            yield module
+    finally :
+        pool.close()
+        pool.join()
 
-def viewDotContent(content) :
-    """Display the rendered graph from a dot content, using ``ImageMagick``. 
-    ``Dot`` and ``ImageMagick`` should be installed for this to work.
+### ** getStreamingRelations(filenames, jobs, cacheDir, profiler, getMethods, maxMemory, tmpDir)
+
+def getStreamingRelations(filenames, jobs = 1, cacheDir = None,
+                          profiler = None, getMethods = False,
+                          maxMemory = 64 * 1024 * 1024, tmpDir = None) :
+    """Get the local function call relations of source files and directories
+    with a bounded memory use. This gives the same graph as
+    :func:`getBatchRelations` (combined), in two passes:
+
+    - each file is parsed and its record (see :func:`_extractFileRecord`) is
+      appended to a temporary file; only the function names, imports and
+      class bases are kept in memory;
+    - once all the names are known, the records are read back one by one and
+      their calls are resolved into a :class:`SpilledEdges`, which spills
+      sorted runs of edges to the disk when ``maxMemory`` is reached.
 
     Args:
-        content (str): Dot content to be rendered
+        filenames (list of str): Source files and directories
+        jobs (int): Number of worker processes
+        cacheDir (str): Directory of the per-file cache. If None, no cache is
+          used.
+        profiler (Profiler): If not None, record the stages
+        getMethods (boolean): If True, also include the methods
+        maxMemory (int): Approximate memory allowed for the buffered edges,
+          in bytes
+        tmpDir (str): Directory for the temporary files. If None, use the
+          default temporary directory
 
     Returns:
-        subprocess returncode: The returned value from the ``display`` process.
+        SpilledEdges: The call edges. Its :meth:`SpilledEdges.close` method
+          should be called to remove the temporary files.
 
     """
-    if not (_isAvailable("dot") and _isAvailable("display")) :
-        raise Exception("Dot or ImageMagick is missing, cannot display the graph")
-    commandLineDot = ["dot", "-Tpng"]
-    pDot = subprocess.Popen(commandLineDot, stdout = subprocess.PIPE,
-                            stdin = subprocess.PIPE)
-    commandLineDisplay = ["display", "-"]
-    pDisplay = subprocess.Popen(commandLineDisplay, stdin = subprocess.PIPE)
-    pDisplay.communicate(input = pDot.communicate(content)[0])
-    return pDisplay.wait()
+    if profiler is None :
+        profiler = Profiler(enabled = False)
+    with profiler.stage("discover") as counts :
+        tasks = [x for group in _getBatchGroups(filenames, cacheDir)
+                 for x in group]
+        counts["files"] = len(tasks)
+    edges = SpilledEdges(maxMemory, tmpDir)
+    try :
+        recordsPath = os.path.join(edges.directory, "records")
+        symbols = set()
+        classIndex = _ClassIndex()
+        skeletons = []
+        with profiler.stage("extract") as counts :
+            counts["files"] = len(tasks)
+            with open(recordsPath, "wb") as fo :
+                for (moduleName, isPackage, record) in \
+                    _iterExtractModules(tasks, jobs) :
+                    _indexModuleSymbols(moduleName, record, getMethods,
+                                        symbols, classIndex)
+                    marshal.dump(record, fo)
+                    skeleton = ([(x[0],) for x in record[0]], record[1],
+                                [(x[0], x[1], ()) for x in record[2]])
+                    skeletons.append((moduleName, isPackage, skeleton))
+            counts["functions"] = len(symbols)
+        with profiler.stage("resolve") as counts :
+            scopes = [_getModuleScope(moduleName, isPackage, skeleton,
+                                      getMethods, symbols, classIndex)
+                      for (moduleName, isPackage, skeleton) in skeletons]
+            del skeletons
+            with open(recordsPath, "rb") as fi :
+                for scope in scopes :
+                    record = marshal.load(fi)
+                    for (caller, callees) in _resolveModuleCalls(
+                            record, scope, getMethods, symbols, classIndex) :
+                        edges.add(caller, callees)
+            os.remove(recordsPath)
+            counts["edges"] = edges.nEdges()
+            counts["runs"] = len(edges.runs)
+    except :
+        edges.close()
+        raise
+    return edges
 
-### ** _isAvailable(program)
+### ** getBatchOutputName(filename, root, outputFormat)
 
-def _isAvailable(program) :
-    """Function to test if a program can be called from Python. Based on a post
-    from stackoverflow: http://stackoverflow.com/questions/11210104/check-if-a-program-exists-from-a-python-script
-    The function tries to execute: program --help.
+def getBatchOutputName(filename, root, outputFormat = "dot") :
+    """Get the name of the output file of one input in batch mode. The name is
+    built from the path of the input relative to ``root``, so that inputs with
+    the same base name do not overwrite each other.
 
     Args:
-        program (str): Command to call the program to be tested
+        filename (str): Input file or directory
+        root (str): Common root of the inputs
+        outputFormat (str): Output format
 
     Returns:
-        boolean
+        str: Output file name (without directory)
 
     """
-    try:
-        devnull = open(os.devnull, "w")
-        a = subprocess.Popen([program, "--help"], stdout = devnull,
-                         stderr = devnull)
-        a.communicate()
-        a.wait()
-    except OSError as e:
-        if e.errno == os.errno.ENOENT:
-            return False
-    return True
-
+    relPath = os.path.relpath(os.path.abspath(filename), root)
+    if relPath == os.curdir :
+        relPath = os.path.basename(os.path.abspath(filename))
+    name = os.path.splitext(relPath)[0] if relPath.endswith(".py") else relPath
+    name = name.strip(os.sep).replace(os.sep, ".")
+    return name + OUTPUT_EXTENSIONS.get(outputFormat, "." + outputFormat)
 
-### ** makeDotFromSrc(filename)
+### ** makeDotFromSrc(filename, dotOptions, drawSingles, jobs)
 
-def makeDotFromSrc(filename, dotOptions = None, drawSingles = False) :
+def makeDotFromSrc(filename, dotOptions = None, drawSingles = False, jobs = 1,
+                   cacheDir = None, getMethods = False) :
     """Prepare the dot content describing a source file dependency graph
 
     Args:
-        filename (str): Name of the source file
+        filename (str): Name of the source file. If this is a directory, all
+          the modules below it are analysed (see :func:`getPackageRelations`)
+        jobs (int): Number of worker processes used for a directory
+        cacheDir (str): Directory of the per-file cache. If None, no cache is
+          used.
+        getMethods (boolean): If True, also include the methods
 
     Returns:
         str: Dot content describing the dependency graph
 
     """
-    parsedSource = astParseFile(filename)
-    functionDefs = getFunctionDef(parsedSource)
-    functionCalls = filterLocalCalls(getFunctionCalls(functionDefs))
+    functionCalls = getRelationsFromSrc(filename, jobs, cacheDir,
+                                        getMethods = getMethods)
     if dotOptions is None :
         dotOptions = {"nodeShape" : "box"}
     dotContent = makeDotFileContent(functionCalls,
@@ -276,6 +3644,586 @@ def makeDotFromSrc(filename, dotOptions = None, drawSingles = False) :
                                     drawSingles)
     return dotContent
 
+### * Git revisions
+
+### ** class _GitBlobReader
+
+class _GitBlobReader(object) :
+    """Read blobs from the object store of a git repository through a single
+    ``git cat-file --batch`` process, instead of one process per blob
+    """
+
+    def __init__(self, cwd) :
+        self.process = subprocess.Popen(["git", "cat-file", "--batch"],
+                                        stdin = subprocess.PIPE,
+                                        stdout = subprocess.PIPE, cwd = cwd)
+
+    def read(self, sha) :
+        """Get the content (bytes) of a blob"""
+        self.process.stdin.write(sha.encode("ascii") + b"\n")
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().split()
+        if len(header) != 3 :
+            raise Exception("Git object not found: " + sha)
+        size = int(header[2])
+        content = self.process.stdout.read(size)
+        self.process.stdout.read(1)
+        return content
+
+    def close(self) :
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process.wait()
+
+### ** _runGit(args, cwd)
+
+def _runGit(args, cwd = None) :
+    """Run a git command and return its output (bytes)"""
+    try :
+        process = subprocess.Popen(["git"] + args, stdout = subprocess.PIPE,
+                                   stderr = subprocess.PIPE, cwd = cwd)
+    except OSError :
+        raise Exception("git is not available")
+    (out, err) = process.communicate()
+    if process.returncode != 0 :
+        raise Exception("git " + " ".join(args) + " failed: " +
+                        err.decode("utf-8", "replace").strip())
+    return out
+
+### ** listTreeFiles(rev, paths, cwd)
+
+def listTreeFiles(rev, paths, cwd = None) :
+    """List the Python source files of a git revision, without checking it
+    out. Hidden and ``__pycache__`` directories are skipped, as in
+    :func:`findSourceFiles`, and so are the symbolic links.
+
+    Args:
+        rev (str): Git revision (commit, branch, tag...)
+        paths (list of str): Paths relative to the top level of the
+          repository. An empty string stands for the whole repository.
+        cwd (str): Top level directory of the repository
+
+    Returns:
+        dict: Dictionary mapping the file paths (relative to the top level,
+          with ``/`` separators) and their blob SHA-1
+
+    """
+    args = ["ls-tree", "-r", "-z", rev, "--"] + [x for x in paths if x]
+    o = dict()
+    for entry in _runGit(args, cwd).split(b"\0") :
+        if not entry :
+            continue
+        (info, path) = entry.decode("utf-8").split("\t", 1)
+        (mode, objectType, sha) = info.split()
+        if (mode not in ("100644", "100755") or objectType != "blob" or
+            not path.endswith(".py")) :
+            continue
+        dirs = path.split("/")[:-1]
+        if any([x.startswith(".") or x == "__pycache__" for x in dirs]) :
+            continue
+        o[path] = sha
+    return o
+
+### ** _getTreeTasks(paths, treeFiles, topName)
+
+def _getTreeTasks(paths, treeFiles, topName) :
+    """Get the (path, moduleName) pairs of the files of a git tree below some
+    input paths, named as :func:`_getBatchGroups` would name them on disk
+
+    Args:
+        paths (list of str): Input paths relative to the top level
+        treeFiles (dict): Output of :func:`listTreeFiles`
+        topName (str): Name of the top level directory
+
+    Returns:
+        list of tuple: Sorted list of (path, moduleName) pairs
+
+    """
+    def isDir(path) :
+        return path not in treeFiles
+    def below(path) :
+        if not path :
+            return sorted(treeFiles.keys())
+        if not isDir(path) :
+            return [path]
+        return sorted([x for x in treeFiles.keys()
+                       if x.startswith(path + "/")])
+    def moduleName(path, root) :
+        relPath = posixpath.relpath(path, root) if root else path
+        parts = posixpath.splitext(relPath)[0].split("/")
+        if parts[-1] == "__init__" :
+            parts = parts[:-1]
+        if posixpath.join(root, "__init__.py") in treeFiles :
+            parts = [posixpath.basename(root) if root else topName] + parts
+        return ".".join(parts)
+    if len(paths) == 1 :
+        if not isDir(paths[0]) :
+            return [(paths[0], "")]
+        return [(x, moduleName(x, paths[0])) for x in below(paths[0])]
+    dirs = [(x if isDir(x) else posixpath.dirname(x)).split("/")
+            for x in paths]
+    root = "/".join(os.path.commonprefix(dirs))
+    o = dict()
+    for path in paths :
+        for x in below(path) :
+            o[x] = moduleName(x, root)
+    return sorted(o.items())
+
+### ** getRevisionRelations(paths, revs, cwd, cacheDir, getMethods, profiler)
+
+def getRevisionRelations(paths, revs, cwd = None, cacheDir = None,
+                         getMethods = False, profiler = None) :
+    """Get the local function call relations of several git revisions,
+    reading the files from the object store. Each distinct blob is parsed
+    only once: the files which did not change between the revisions are
+    reused.
+
+    Args:
+        paths (list of str): Files or directories to analyse (paths on disk,
+          inside the repository)
+        revs (list of str): Git revisions
+        cwd (str): Directory inside the repository. If None, use the current
+          directory.
+        cacheDir (str): Directory of the per-file cache. If None, no cache is
+          used.
+        getMethods (boolean): If True, also include the methods
+        profiler (Profiler): If not None, record the stages
+
+    Returns:
+        tuple: (list of relations dictionaries, one per revision, number of
+          files which differ between the first and the last revision)
+
+    """
+    if profiler is None :
+        profiler = Profiler(enabled = False)
+    with profiler.stage("discover") as counts :
+        top = _runGit(["rev-parse", "--show-toplevel"], cwd)
+        top = top.decode("utf-8").strip()
+        relPaths = []
+        for path in paths :
+            relPath = os.path.relpath(os.path.abspath(path), top)
+            relPaths.append("" if relPath == os.curdir else
+                            relPath.replace(os.sep, "/"))
+        trees = [listTreeFiles(x, relPaths, top) for x in revs]
+        counts["files"] = sum([len(x) for x in trees])
+        changed = set(trees[0].items()) ^ set(trees[-1].items())
+        nChanged = len(set([x[0] for x in changed]))
+        counts["changed"] = nChanged
+    with profiler.stage("extract") as counts :
+        records = dict()
+        reader = _GitBlobReader(top)
+        try :
+            allModules = []
+            for tree in trees :
+                modules = []
+                for (path, moduleName) in _getTreeTasks(
+                        relPaths, tree, os.path.basename(top)) :
+                    sha = tree[path]
+                    if sha not in records :
+                        records[sha] = _extractSourceRecord(reader.read(sha),
+                                                            path, cacheDir)
+                    isPackage = posixpath.basename(path) == "__init__.py"
+                    modules.append((moduleName, isPackage, records[sha]))
+                allModules.append(modules)
+        finally :
+            reader.close()
+        counts["parsed"] = len(records)
+    with profiler.stage("resolve") :
+        o = [resolveCalls(x, getMethods) for x in allModules]
+    return (o, nChanged)
+
+### ** diffRelations(oldRelations, newRelations, drawSingles)
+
+def diffRelations(oldRelations, newRelations, drawSingles = False) :
+    """Compare two call graphs
+
+    Args:
+        oldRelations (dict): Relations of the old version
+        newRelations (dict): Relations of the new version
+        drawSingles (boolean): If True, also include the functions which are
+          not calling nor called by another function
+
+    Returns:
+        tuple: (nodes, edges) where ``nodes`` is a sorted list of (function
+          name, status) pairs and ``edges`` a sorted list of ((caller,
+          called), status) pairs. The status is one of "added", "removed",
+          "changed" (functions whose calls changed) and "same".
+
+    """
+    oldNodes = set(_getFuncFromRelations(oldRelations, drawSingles))
+    newNodes = set(_getFuncFromRelations(newRelations, drawSingles))
+    oldEdges = set(_iterEdges(oldRelations))
+    newEdges = set(_iterEdges(newRelations))
+    edges = []
+    changedNodes = set()
+    for edge in sorted(oldEdges | newEdges) :
+        if edge not in oldEdges :
+            edges.append((edge, "added"))
+        elif edge not in newEdges :
+            edges.append((edge, "removed"))
+        else :
+            edges.append((edge, "same"))
+            continue
+        changedNodes.add(edge[0])
+    nodes = []
+    for name in sorted(oldNodes | newNodes) :
+        if name not in oldNodes :
+            nodes.append((name, "added"))
+        elif name not in newNodes :
+            nodes.append((name, "removed"))
+        elif name in changedNodes :
+            nodes.append((name, "changed"))
+        else :
+            nodes.append((name, "same"))
+    return (nodes, edges)
+
+### ** writeDotDiff(oldRelations, newRelations, stream, dotOptions, drawSingles)
+
+DIFF_COLORS = {
+    "added" : "#2e8b57",
+    "removed" : "#cc3333",
+    "changed" : "#d19a00",
+    "same" : "#808080"
+}
+
+DIFF_FILL_COLORS = {
+    "added" : "#9fc59f",
+    "removed" : "#dca3a3",
+    "changed" : "#f0dfaf",
+    "same" : "#ffffff"
+}
+
+def writeDotDiff(oldRelations, newRelations, stream, dotOptions = None,
+                 drawSingles = False) :
+    """Write the dot content of the difference between two call graphs. Added
+    functions and calls are green, removed ones red (and dashed), functions
+    whose calls changed are yellow.
+
+    Args:
+        oldRelations (dict): Relations of the old version
+        newRelations (dict): Relations of the new version
+        stream (file): File-like object to write to
+        dotOptions (dict): Dot options, from :func:`getDotOptions`
+        drawSingles (boolean): If True, also draw the functions which are not
+          calling nor called by another function
+
+    """
+    if dotOptions is None :
+        dotOptions = dict()
+    (nodes, edges) = diffRelations(oldRelations, newRelations, drawSingles)
+    write = stream.write
+    write("digraph G {\n")
+    write("rankdir=LR;\n")
+    write("node[shape=" + dotOptions.get("nodeShape", "box") +
+          ",style=filled];\n")
+    for (name, status) in nodes :
+        write(_dotId(name) + " [fillcolor=\"" + DIFF_FILL_COLORS[status] +
+              "\",color=\"" + DIFF_COLORS[status] + "\"" +
+              (",style=\"filled,dashed\"" if status == "removed" else "") +
+              "];\n")
+    for ((caller, called), status) in edges :
+        attributes = "color=\"" + DIFF_COLORS[status] + "\""
+        if status == "added" :
+            attributes += ",penwidth=2"
+        elif status == "removed" :
+            attributes += ",style=dashed"
+        write(_dotId(caller) + " -> " + _dotId(called) + " [" + attributes +
+              "];\n")
+    write("}\n")
+
+### ** writeJsonDiff(oldRelations, newRelations, stream, dotOptions, drawSingles)
+
+def writeJsonDiff(oldRelations, newRelations, stream, dotOptions = None,
+                  drawSingles = False) :
+    """Write the difference between two call graphs as JSON Lines, in the
+    format of :func:`writeJsonLines` with an additional ``status`` field
+    (see :func:`diffRelations`)
+    """
+    (nodes, edges) = diffRelations(oldRelations, newRelations, drawSingles)
+    write = stream.write
+    for (name, status) in nodes :
+        write(json.dumps({"type" : "node", "id" : name, "status" : status},
+                         sort_keys = True))
+        write("\n")
+    for ((caller, called), status) in edges :
+        write(json.dumps({"type" : "edge", "source" : caller,
+                          "target" : called, "status" : status},
+                         sort_keys = True))
+        write("\n")
+
+DIFF_WRITERS = {
+    "dot" : writeDotDiff,
+    "jsonl" : writeJsonDiff
+}
+
+### * Analysis server
+
+### ** _renderRelations(relations, outputFormat, dotOptions, drawSingles)
+
+def _renderRelations(relations, outputFormat = "dot", dotOptions = None,
+                     drawSingles = False) :
+    """Write function call relations to bytes, see :func:`writeRelations`"""
+    if outputFormat == "edgelist" or sys.version_info[0] < 3 :
+        stream = io.BytesIO()
+    else :
+        stream = io.StringIO()
+    writeRelations(relations, stream, outputFormat, dotOptions, drawSingles)
+    o = stream.getvalue()
+    if not isinstance(o, bytes) :
+        o = o.encode("utf-8")
+    return o
+
+### ** answerQuery(index, words, outputFormat, dotOptions, drawSingles)
+
+def answerQuery(index, words, outputFormat = "dot", dotOptions = None,
+                drawSingles = False) :
+    """Answer one request of the analysis server. The index is refreshed
+    before each query, so that the answer reflects the files on disk.
+
+    The requests are:
+
+    - ``PING``: answer ``pong``
+    - ``REFRESH``: refresh the index, answer the number of files parsed again
+    - ``GRAPH [FORMAT]``: whole graph
+    - ``FOCUS FUNC [DEPTH [DIRECTION [FORMAT]]]``: neighbourhood of a function
+      (see :func:`getNeighbourhood`)
+    - ``CALLERS FUNC`` and ``CALLEES FUNC``: functions calling or called by a
+      function, one per line
+    - ``SHUTDOWN``: stop the server
+
+    Args:
+        index (SourceIndex): Index of the analysed sources
+        words (list of str): Request words
+        outputFormat (str): Default output format for the graphs
+        dotOptions (dict): Dot options, from :func:`getDotOptions`. If None,
+          use box nodes.
+        drawSingles (boolean): If True, also write the isolated functions
+
+    Returns:
+        bytes: Answer, or None for ``SHUTDOWN``
+
+    """
+    if dotOptions is None :
+        dotOptions = {"nodeShape" : "box"}
+    command = words[0].upper()
+    if command == "PING" :
+        return b"pong\n"
+    if command == "SHUTDOWN" :
+        return None
+    nChanged = index.refresh()
+    if command == "REFRESH" :
+        return (str(nChanged) + "\n").encode("ascii")
+    if command == "GRAPH" :
+        if len(words) > 1 :
+            outputFormat = words[1]
+        return _renderRelations(index.graph.relations(), outputFormat,
+                                dotOptions, drawSingles)
+    if command == "FOCUS" and len(words) > 1 :
+        depth = int(words[2]) if len(words) > 2 else 2
+        direction = words[3] if len(words) > 3 else "both"
+        if len(words) > 4 :
+            outputFormat = words[4]
+        graph = index.graph.focus(words[1], depth, direction)
+        return _renderRelations(graph.relations(), outputFormat, dotOptions,
+                                drawSingles)
+    if command in ("CALLERS", "CALLEES") and len(words) == 2 :
+        matches = findFunction(index.graph.functions, words[1])
+        if len(matches) != 1 :
+            raise Exception("Function not found or ambiguous: " + words[1])
+        if command == "CALLEES" :
+            names = index.graph[matches[0]].callees
+        else :
+            names = sorted([x.name for x in index.graph.functions.values()
+                            if matches[0] in x.callees])
+        return "".join([x + "\n" for x in names]).encode("utf-8")
+    raise Exception("Invalid request: " + " ".join(words))
+
+### ** serveIndex(index, socketPath, outputFormat, dotOptions, drawSingles)
+
+def serveIndex(index, socketPath, outputFormat = "dot", dotOptions = None,
+               drawSingles = False) :
+    """Answer requests about an index over a Unix domain socket, until a
+    ``SHUTDOWN`` request is received.
+
+    Each request is a line of words (see :func:`answerQuery`). Each answer
+    starts with a header line, ``OK <length>`` followed by ``length`` bytes,
+    or ``ERR <message>``. Several requests can be sent on one connection.
+
+    Args:
+        index (SourceIndex): Index of the analysed sources
+        socketPath (str): Path of the socket. A stale socket left at this
+          path is removed (see :func:`_removeStaleSocket`).
+        outputFormat (str): Default output format for the graphs
+        dotOptions (dict): Dot options, from :func:`getDotOptions`
+        drawSingles (boolean): If True, also write the isolated functions
+
+    """
+    if not hasattr(socket, "AF_UNIX") :
+        raise Exception("Unix domain sockets are not available")
+    _removeStaleSocket(socketPath)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try :
+        server.bind(socketPath)
+        server.listen(8)
+        running = True
+        while running :
+            (connection, address) = server.accept()
+            try :
+                running = _serveConnection(index, connection, outputFormat,
+                                           dotOptions, drawSingles)
+            except (socket.error, IOError) :
+                # A client which hung up is dropped, the server keeps running
+                pass
+            finally :
+                connection.close()
+    finally :
+        server.close()
+        if os.path.exists(socketPath) :
+            os.remove(socketPath)
+
+def _removeStaleSocket(socketPath) :
+    """Remove a socket left at a path by a server which is not running
+    anymore. Anything else than a socket, or a socket on which a server
+    answers, raises an exception."""
+    if not os.path.exists(socketPath) :
+        return
+    if not stat.S_ISSOCK(os.stat(socketPath).st_mode) :
+        raise Exception(socketPath + " exists and is not a socket")
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try :
+        client.connect(socketPath)
+    except socket.error :
+        # Nobody is listening: the socket is stale
+        os.remove(socketPath)
+        return
+    finally :
+        client.close()
+    raise Exception("a server is already running on " + socketPath)
+
+def _serveConnection(index, connection, outputFormat, dotOptions,
+                     drawSingles) :
+    """Answer the requests of one connection. Return False after a
+    ``SHUTDOWN`` request, True otherwise.
+    """
+    stream = connection.makefile("rb")
+    try :
+        while True :
+            line = stream.readline()
+            if not line :
+                return True
+            try :
+                words = line.decode("utf-8", "replace").split()
+                if not words :
+                    continue
+                answer = answerQuery(index, words, outputFormat, dotOptions,
+                                     drawSingles)
+            except Exception as e :
+                # The request words are unicode on Python 2
+                message = (u"%s" % (e,)).replace("\n", " ")
+                connection.sendall(("ERR " + message + "\n").encode("utf-8"))
+                continue
+            if answer is None :
+                connection.sendall(b"OK 0\n")
+                return False
+            connection.sendall(("OK " + str(len(answer)) + "\n")
+                               .encode("ascii") + answer)
+    finally :
+        stream.close()
+
+### ** queryServer(socketPath, words)
+
+def queryServer(socketPath, words) :
+    """Send a request to a running ``pydep --serve`` process
+
+    Args:
+        socketPath (str): Path of the server socket
+        words (list of str): Request words (see :func:`answerQuery`)
+
+    Returns:
+        bytes: Answer of the server
+
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try :
+        client.connect(socketPath)
+        client.sendall((" ".join(words) + "\n").encode("utf-8"))
+        stream = client.makefile("rb")
+        try :
+            header = stream.readline().decode("utf-8").rstrip("\n")
+            if not header.startswith("OK ") :
+                raise Exception(header[4:] if header.startswith("ERR ")
+                                else "No answer from the server")
+            size = int(header[3:])
+            o = stream.read(size)
+        finally :
+            stream.close()
+    finally :
+        client.close()
+    return o
+
+### * Watch mode
+
+### ** watchIndex(index, onChange, interval, debounce, maxPolls, stderr)
+
+def watchIndex(index, onChange, interval = 1.0, debounce = 0.3,
+               maxPolls = None, stderr = None) :
+    """Poll the files of an index and call a function each time the call
+    graph changes. The files are only stat-ed while polling; when one of them
+    changes, the watcher waits until the files have been stable for
+    ``debounce`` seconds (so that a burst of saves triggers a single update),
+    then re-parses the modified files only. ``onChange`` is not called if the
+    relations are the same as before (e.g. after an edit inside a function
+    body which does not change its calls).
+
+    Args:
+        index (SourceIndex): Index of the watched sources
+        onChange (function): Function called with the relations dictionary,
+          once at the start and then after each change of the graph
+        interval (float): Polling interval, in seconds
+        debounce (float): Time without changes to wait for before updating
+          the graph, in seconds
+        maxPolls (int): Number of polls before returning. If None, watch
+          until interrupted.
+        stderr (file): Stream for the error messages (e.g. a syntax error in
+          a file being edited). If None, use sys.stderr
+
+    Returns:
+        int: Number of times ``onChange`` was called
+
+    """
+    if stderr is None :
+        stderr = sys.stderr
+    stamps = index.stamps()
+    index.refresh()
+    relations = index.graph.relations()
+    onChange(relations)
+    nCalls = 1
+    nPolls = 0
+    while maxPolls is None or nPolls < maxPolls :
+        time.sleep(interval)
+        nPolls += 1
+        try :
+            current = index.stamps()
+            if current == stamps :
+                continue
+            while True :
+                time.sleep(debounce)
+                settled = index.stamps()
+                if settled == current :
+                    break
+                current = settled
+            stamps = current
+            index.refresh()
+        except (OSError, IOError, SyntaxError) as e :
+            stderr.write("pydep: " + str(e) + "\n")
+            continue
+        newRelations = index.graph.relations()
+        if newRelations != relations :
+            relations = newRelations
+            onChange(relations)
+            nCalls += 1
+    return nCalls
+
 ### * Main-related functions
 
 ### ** _makeParser()
@@ -293,22 +4241,155 @@ def _makeParser() :
         "is a dot file to be processed with graphviz.",
         epilog =
         "For more information about the node options, please refer to the Dot "
-        "documentation (add url here).")
+        "documentation (add url here). Arguments can also be read from a file, "
+        "one per line, with @FILE.",
+        fromfile_prefix_chars = "@")
     parser.add_argument(dest = "inputModule", metavar = "MODULE.PY",
-                        nargs = 1,
-                        help = "A Python module file",
+                        nargs = "+",
+                        help = "Python module files, directories to analyse as "
+                        "packages, or glob patterns. Several inputs are "
+                        "combined into a single graph unless --output-dir is "
+                        "given",
                         type = str)
+    parser.add_argument("--diff", nargs = 2, default = None,
+                        metavar = ("REV1", "REV2"),
+                        help = "Compare the call graphs of the inputs at two "
+                        "git revisions, read from the repository without "
+                        "checking them out (dot or jsonl format)")
+    parser.add_argument("--max-memory", dest = "maxMemory", type = int,
+                        default = None, metavar = "MB",
+                        help = "Bound the memory used by the call edges: "
+                        "stream them through sorted runs in a temporary "
+                        "directory once MB megabytes are used (for very "
+                        "large trees)")
+    parser.add_argument("--serve", type = str, default = None,
+                        metavar = "SOCKET",
+                        help = "Keep the analysed inputs in memory and answer "
+                        "requests on the Unix socket SOCKET, re-parsing only "
+                        "the files which changed")
+    parser.add_argument("--client", type = str, default = None,
+                        metavar = "SOCKET",
+                        help = "Send a request to a --serve process; the "
+                        "positional arguments are the request words (e.g. "
+                        "GRAPH, FOCUS FUNC, CALLERS FUNC, REFRESH, SHUTDOWN)")
+    parser.add_argument("-o", "--output", type = str, default = None,
+                        metavar = "FILE",
+                        help = "Write the graph to FILE instead of stdout")
+    parser.add_argument("-w", "--watch", action = "store_true",
+                        help = "Keep running and update the output (or the "
+                        "--quickView window) each time the call graph of "
+                        "the inputs changes")
+    parser.add_argument("--interval", type = float, default = 1.0,
+                        metavar = "SECONDS",
+                        help = "Polling interval of --watch (default: 1)")
+    parser.add_argument("--debounce", type = float, default = 0.3,
+                        metavar = "SECONDS",
+                        help = "Wait until the files have not changed for "
+                        "this time before updating the --watch output "
+                        "(default: 0.3)")
+    parser.add_argument("-d", "--output-dir", dest = "outputDir", type = str,
+                        default = None, metavar = "DIR",
+                        help = "Write one graph per input in DIR instead of a "
+                        "combined graph on stdout")
     parser.add_argument("--nodeShape", type = str, default = "box",
                         help = "Node shape (default: box)")
+    parser.add_argument("-j", "--jobs", type = int, default = 1,
+                        help = "Number of worker processes used to parse the "
+                        "files of a package or of several inputs (default: 1, "
+                        "0 for one per CPU)")
+    parser.add_argument("--cache-dir", dest = "cacheDir", type = str,
+                        default = None, metavar = "DIR",
+                        help = "Cache the functions and calls extracted from "
+                        "each file in DIR, keyed by file content")
+    parser.add_argument("--cache-size", dest = "cacheSize", type = int,
+                        default = 64, metavar = "MB",
+                        help = "Maximum size of the cache, in MB. The least "
+                        "recently used entries are removed (default: 64)")
+    parser.add_argument("--render-cache", dest = "renderCache", type = str,
+                        default = None, metavar = "DIR",
+                        help = "Keep the images rendered by -T and "
+                        "--quickView in DIR, keyed by dot content, engine "
+                        "and format, and reuse them for unchanged graphs")
+    parser.add_argument("--render-cache-size", dest = "renderCacheSize",
+                        type = int, default = 256, metavar = "MB",
+                        help = "Maximum size of the render cache, in MB. The "
+                        "least recently used images are removed (default: "
+                        "256)")
+    parser.add_argument("--profile", type = str, default = None,
+                        metavar = "FILE",
+                        help = "Write a JSON report with the wall time, CPU "
+                        "time, memory peak and counts of each stage to FILE "
+                        "(- for stderr)")
+    parser.add_argument("--focus", type = str, default = None,
+                        metavar = "FUNC",
+                        help = "Only draw the functions around FUNC (qualified "
+                        "name, or a unique trailing part of it)")
+    parser.add_argument("--depth", type = int, default = 2,
+                        help = "Maximum call distance from the --focus "
+                        "function (default: 2)")
+    parser.add_argument("--direction", choices = ["callers", "callees", "both"],
+                        default = "both",
+                        help = "Follow the calls made by the --focus function "
+                        "(callees), made to it (callers) or both (default)")
+    parser.add_argument("--condense", action = "store_true",
+                        help = "Draw each group of mutually recursive "
+                        "functions as a single node")
+    parser.add_argument("--reduce", action = "store_true",
+                        help = "Remove the calls implied by other paths "
+                        "(transitive reduction) and report how many were "
+                        "removed on stderr")
+    parser.add_argument("-f", "--format", dest = "outputFormat",
+                        choices = ["dot", "jsonl", "graphml", "edgelist"],
+                        default = "dot",
+                        help = "Output format: dot (default), JSON Lines, "
+                        "GraphML or binary edge list")
+    parser.add_argument("-T", dest = "imageFormat", type = str,
+                        default = None, metavar = "FORMAT",
+                        help = "Render the graph with Graphviz dot to the "
+                        "image format FORMAT (e.g. png, svg, pdf) instead of "
+                        "writing the dot source; with --quickView, the format "
+                        "sent to the viewer (default: png)")
+    parser.add_argument("--engine", type = str, default = "auto",
+                        choices = ["auto", "dot", "neato", "fdp", "sfdp",
+                                   "twopi", "circo"],
+                        help = "Graphviz layout engine of -T and --quickView "
+                        "(default: auto, i.e. dot up to %d nodes and sfdp "
+                        "above)" % AUTO_ENGINE_NODES)
+    parser.add_argument("--timeout", type = float, default = None,
+                        metavar = "SECONDS",
+                        help = "Kill the layout engine of -T and --quickView "
+                        "after SECONDS, and retry with sfdp, then with a "
+                        "graph halved by the --max-nodes steps, until the "
+                        "render finishes in time")
+    parser.add_argument("--pack", action = "store_true",
+                        help = "With -T or --quickView, lay out the "
+                        "disconnected parts of the graph separately, with -j "
+                        "concurrent dot processes, and pack them into one "
+                        "image (requires gvpack and neato)")
     parser.add_argument("-q", "--quickView", action = "store_true",
                         help = "Provide a simple display of the dot file through "
                         "ImageMagick and remove the dot file")
     parser.add_argument("-s", "--drawSingles", action = "store_true",
                         help = "Draw functions which are not calling nor called by "
                         "another function")
-    # parser.add_argument("-m", "--getMethods", action = "store_true",
-    #                     help = "Also output method calls",
-    #                     default = False)
+    parser.add_argument("-m", "--getMethods", action = "store_true",
+                        help = "Also output method calls",
+                        default = False)
+    parser.add_argument("--max-nodes", dest = "maxNodes", type = int,
+                        default = None, metavar = "N",
+                        help = "Simplify the graph until it has at most N "
+                        "nodes: collapse the private helpers into their "
+                        "callers, then group the functions by module, then "
+                        "keep the calls with the most call sites. What was "
+                        "elided is reported on stderr and in the dot label")
+    parser.add_argument("--max-edges", dest = "maxEdges", type = int,
+                        default = None, metavar = "N",
+                        help = "Simplify the graph until it has at most N "
+                        "calls (see --max-nodes)")
+    parser.add_argument("-W", "--weights", action = "store_true",
+                        help = "Weight the calls by their number of call sites "
+                        "and loop nesting depth (edge width and label in dot, "
+                        "count and loopDepth in the other formats)")
     # parser.add_argument("-a", "--all", action = "store_true",
     #                     help = "Output all function calls, not only calls between "
     #                     "functions of the module")
@@ -340,11 +4421,385 @@ def _main(args = None, stdout = None, stderr = None) :
         stdout = sys.stdout
     if stderr is None :
         stderr = sys.stderr
+    if args.quickView and args.outputFormat != "dot" :
+        parser.error("--quickView requires the dot output format")
+    if args.imageFormat is not None and args.outputFormat != "dot" :
+        parser.error("-T requires the dot output format")
+    if args.quickView and args.outputDir is not None :
+        parser.error("--quickView cannot be used with --output-dir")
+    if args.output is not None and args.outputDir is not None :
+        parser.error("--output cannot be used with --output-dir")
+    if args.watch and args.outputDir is not None :
+        parser.error("--watch cannot be used with --output-dir")
+    if args.client is not None :
+        try :
+            answer = queryServer(args.client, args.inputModule)
+        except (Exception, socket.error) as e :
+            parser.exit(1, "pydep: " + str(e) + "\n")
+        getattr(stdout, "buffer", stdout).write(answer)
+        return
+    for (option, name) in [(args.renderCache, "--render-cache"),
+                           (args.pack, "--pack"),
+                           (args.engine != "auto", "--engine"),
+                           (args.timeout is not None, "--timeout")] :
+        if option and args.imageFormat is None and not args.quickView :
+            parser.error(name + " requires -T or --quickView")
+    if args.pack :
+        for (option, name) in [(args.engine != "auto", "--engine"),
+                               (args.timeout is not None, "--timeout")] :
+            if option :
+                parser.error(name + " cannot be used with --pack")
+    if args.imageFormat is not None :
+        for (option, name) in [(args.serve, "--serve"), (args.diff, "--diff")] :
+            if option :
+                parser.error("-T cannot be used with " + name)
+    budgets = args.maxNodes is not None or args.maxEdges is not None
+    if budgets :
+        for (option, name) in [(args.serve, "--serve"), (args.diff, "--diff"),
+                               (args.maxMemory, "--max-memory")] :
+            if option :
+                parser.error("--max-nodes and --max-edges cannot be used "
+                             "with " + name)
+    for (cacheDir, name) in [(args.cacheDir, "--cache-dir"),
+                             (args.renderCache, "--render-cache")] :
+        if cacheDir is not None and not _initCacheDir(cacheDir) :
+            parser.error(name + " " + cacheDir + " is not empty and is not a "
+                         "pydep cache")
+    if (args.cacheDir is not None and args.renderCache is not None and
+        os.path.realpath(args.cacheDir) == os.path.realpath(args.renderCache)) :
+        parser.error("--render-cache and --cache-dir must be different "
+                     "directories")
+    if args.weights :
+        for (option, name) in [(args.serve, "--serve"), (args.watch, "--watch"),
+                               (args.diff, "--diff"),
+                               (args.maxMemory, "--max-memory")] :
+            if option :
+                parser.error("--weights cannot be used with " + name)
+    inputs = expandInputs(args.inputModule)
+    if not inputs :
+        parser.error("no input file")
+    if args.profile not in (None, "-") :
+        sources = set([os.path.realpath(x) for x in inputs])
+        if (args.profile.endswith(".py") or
+            os.path.realpath(args.profile) in sources) :
+            parser.error("--profile " + args.profile + " would overwrite a "
+                         "Python source file")
     # Main logic
-    dotContent = makeDotFromSrc(args.inputModule[0],
-                                getDotOptions(args),
-                                args.drawSingles)
-    if args.quickView :
-        viewDotContent(dotContent)
+    profiler = Profiler(enabled = args.profile is not None)
+    if args.serve is not None :
+        try :
+            _removeStaleSocket(args.serve)
+        except Exception as e :
+            parser.exit(1, "pydep: " + str(e) + "\n")
+        index = SourceIndex(inputs, args.jobs, args.cacheDir, args.getMethods)
+        index.refresh(profiler)
+        stderr.write("pydep: serving " + str(len(index.graph)) + " functions on " +
+                     args.serve + "\n")
+        serveIndex(index, args.serve, args.outputFormat, getDotOptions(args),
+                   args.drawSingles)
+        _writeProfile(args, profiler, stderr)
+        return
+    if args.watch :
+        _watch(inputs, args, parser, profiler, stdout, stderr)
+        return
+    if args.diff is not None :
+        _diff(inputs, args, parser, profiler, stdout, stderr)
+        return
+    if args.maxMemory is not None :
+        _stream(inputs, args, parser, profiler, stdout, stderr)
+        return
+    # The budgets rank the calls by weight, even if they are not drawn
+    weights = [] if args.weights or budgets else None
+    results = getBatchRelations(inputs, args.jobs, args.cacheDir, profiler,
+                                args.getMethods,
+                                combine = args.outputDir is None,
+                                weights = weights)
+    if weights is None :
+        weights = [None] * len(results)
+    if args.outputDir is None :
+        outputs = [(args.output, results[0])]
+    else :
+        root = _commonRoot(inputs)
+        outputs = [(os.path.join(args.outputDir,
+                                 getBatchOutputName(x, root,
+                                                    args.imageFormat or
+                                                    args.outputFormat)), y)
+                   for (x, y) in zip(inputs, results)]
+        if not os.path.isdir(args.outputDir) :
+            os.makedirs(args.outputDir)
+    for ((outputPath, relations), outputWeights) in zip(outputs, weights) :
+        _processRelations(relations, args, parser, profiler, stdout, stderr,
+                          outputPath, weights = outputWeights)
+    _pruneCaches(args, profiler)
+    _writeProfile(args, profiler, stderr)
+
+### ** _stream(inputs, args, parser, profiler, stdout, stderr)
+
+def _stream(inputs, args, parser, profiler, stdout, stderr) :
+    """Run the --max-memory mode of the command line"""
+    for (option, name) in [(args.focus, "--focus"), (args.condense, "--condense"),
+                           (args.reduce, "--reduce"),
+                           (args.outputDir, "--output-dir"),
+                           (args.pack, "--pack"),
+                           (args.timeout is not None, "--timeout")] :
+        if option :
+            parser.error("--max-memory cannot be used with " + name)
+    edges = getStreamingRelations(inputs, args.jobs, args.cacheDir, profiler,
+                                  args.getMethods,
+                                  args.maxMemory * 1024 * 1024)
+    try :
+        _processRelations(edges, args, parser, profiler, stdout, stderr,
+                          args.output)
+    finally :
+        edges.close()
+    _pruneCaches(args, profiler)
+    _writeProfile(args, profiler, stderr)
+
+### ** _diff(inputs, args, parser, profiler, stdout, stderr)
+
+def _diff(inputs, args, parser, profiler, stdout, stderr) :
+    """Run the --diff mode of the command line"""
+    if args.outputFormat not in DIFF_WRITERS :
+        parser.error("--diff requires the dot or jsonl output format")
+    for (option, name) in [(args.focus, "--focus"), (args.condense, "--condense"),
+                           (args.reduce, "--reduce"),
+                           (args.outputDir, "--output-dir"),
+                           (args.engine != "auto", "--engine"),
+                           (args.renderCache, "--render-cache"),
+                           (args.timeout is not None, "--timeout"),
+                           (args.pack, "--pack")] :
+        if option :
+            parser.error("--diff cannot be used with " + name)
+    try :
+        ((oldRelations, newRelations), nChanged) = getRevisionRelations(
+            inputs, args.diff, None, args.cacheDir, args.getMethods, profiler)
+    except SyntaxError :
+        # Parse errors are reported as in the other modes
+        raise
+    except Exception as e :
+        parser.exit(1, "pydep: " + str(e) + "\n")
+    stderr.write("pydep: " + str(nChanged) + " files changed between " +
+                 args.diff[0] + " and " + args.diff[1] + "\n")
+    writer = DIFF_WRITERS[args.outputFormat]
+    with profiler.stage("write") :
+        if args.quickView :
+            stream = io.BytesIO() if sys.version_info[0] < 3 else io.StringIO()
+            writer(oldRelations, newRelations, stream, getDotOptions(args),
+                   args.drawSingles)
+            viewDotContent(stream.getvalue())
+        elif args.output is not None :
+            with open(args.output, "w") as fo :
+                writer(oldRelations, newRelations, fo, getDotOptions(args),
+                       args.drawSingles)
+        else :
+            writer(oldRelations, newRelations, stdout, getDotOptions(args),
+                   args.drawSingles)
+    _writeProfile(args, profiler, stderr)
+
+### ** _watch(inputs, args, parser, profiler, stdout, stderr)
+
+def _watch(inputs, args, parser, profiler, stdout, stderr) :
+    """Run the --watch mode of the command line"""
+    index = SourceIndex(inputs, args.jobs, args.cacheDir, args.getMethods)
+    viewers = []
+    def onChange(relations) :
+        viewer = _processRelations(relations, args, parser, profiler, stdout,
+                                   stderr, args.output, wait = False)
+        while viewers :
+            _stopProcess(viewers.pop())
+        if viewer is not None :
+            viewers.append(viewer)
+        stdout.flush()
+        stderr.write("pydep: " + time.strftime("%H:%M:%S") + " updated, " +
+                     str(len(relations)) + " functions\n")
+    try :
+        watchIndex(index, onChange, args.interval, args.debounce,
+                   stderr = stderr)
+    except KeyboardInterrupt :
+        pass
+    finally :
+        for viewer in viewers :
+            _stopProcess(viewer)
+    _writeProfile(args, profiler, stderr)
+
+### ** _pruneCaches(args, profiler)
+
+def _pruneCaches(args, profiler) :
+    """Apply the size limits of the extraction and render caches"""
+    if args.cacheDir is not None :
+        with profiler.stage("pruneCache") as counts :
+            counts["removed"] = pruneCache(args.cacheDir,
+                                           args.cacheSize * 1024 * 1024)
+    if args.renderCache is not None :
+        with profiler.stage("pruneRenderCache") as counts :
+            counts["removed"] = pruneCache(args.renderCache,
+                                           args.renderCacheSize * 1024 * 1024)
+
+### ** _writeProfile(args, profiler, stderr)
+
+def _writeProfile(args, profiler, stderr) :
+    """Write the report of the --profile option, if it was given"""
+    if args.profile == "-" :
+        profiler.write(stderr)
+    elif args.profile is not None :
+        with open(args.profile, "w") as fo :
+            profiler.write(fo)
+
+### ** _stopProcess(process)
+
+def _stopProcess(process) :
+    """Terminate a child process if it is still running"""
+    if process.poll() is None :
+        try :
+            process.terminate()
+        except OSError :
+            pass
+    process.wait()
+
+### ** _processRelations(relations, args, parser, profiler, stdout, stderr, outputPath, wait)
+
+def _processRelations(relations, args, parser, profiler, stdout, stderr,
+                      outputPath = None, wait = True, weights = None) :
+    """Apply the graph options of the command line to the relations of one
+    output, and write or display them
+
+    Args:
+        relations (dict): Function call relations
+        args (argparse.Namespace): Parsed arguments
+        parser (argparse.ArgumentParser): Parser, used to report errors
+        profiler (Profiler): Profiler recording the stages
+        stdout (file): Stream for the output if ``outputPath`` is None
+        stderr (file): Stream for the messages
+        outputPath (str): Output file. It is replaced atomically, so that a
+          viewer watching it never sees a partial graph. If None, write to
+          ``stdout``
+        wait (boolean): If False, do not wait for the --quickView window to
+          be closed
+        weights (dict): Weights of the calls, or None (see
+          :func:`resolveCalls`). The edges merged by --condense are not
+          weighted. They are only drawn with --weights.
+
+    Returns:
+        subprocess.Popen: The --quickView display process if ``wait`` is
+          False, None otherwise
+
+    """
+    if args.focus is not None :
+        matches = findFunction(relations, args.focus)
+        if len(matches) != 1 :
+            parser.error("--focus " + args.focus + " matches " +
+                         (", ".join(matches) if matches else "no function"))
+        with profiler.stage("focus") as counts :
+            relations = getNeighbourhood(relations, matches[0], args.depth,
+                                         args.direction)
+            counts["functions"] = len(relations)
+    if args.condense :
+        with profiler.stage("condense") as counts :
+            relations = condenseRelations(relations)
+            counts["nodes"] = len(relations)
+    if args.reduce :
+        with profiler.stage("reduce") as counts :
+            (relations, nRemoved) = reduceRelations(relations)
+            counts["removed"] = nRemoved
+        stderr.write("pydep: --reduce removed " + str(nRemoved) + " calls" +
+                     (" in " + os.path.basename(outputPath) if args.outputDir
+                      else "") + "\n")
+    dotOptions = getDotOptions(args)
+    if args.maxNodes is not None or args.maxEdges is not None :
+        with profiler.stage("levelOfDetail") as counts :
+            (relations, weights, elided, clusters) = getLevelOfDetail(
+                relations, args.maxNodes, args.maxEdges, weights,
+                args.drawSingles)
+            counts["nodes"] = len(relations)
+        if clusters :
+            dotOptions["clusters"] = clusters
+        if elided :
+            dotOptions["label"] = "pydep: " + "; ".join(elided)
+            stderr.write(dotOptions["label"] +
+                         (" in " + os.path.basename(outputPath)
+                          if args.outputDir else "") + "\n")
+    if not args.weights :
+        weights = None
+    imageFormat = args.imageFormat or "png"
+    def render(output) :
+        if args.pack :
+            return renderPacked(relations, imageFormat, output,
+                                dotOptions, args.drawSingles, weights,
+                                args.jobs, args.renderCache)
+        return renderWithFallback(relations, imageFormat, output, dotOptions,
+                                  args.drawSingles, weights, args.engine,
+                                  args.timeout, args.renderCache, stderr)
+    if args.quickView and args.pack :
+        with profiler.stage("render") :
+            viewer = _startViewer(imageFormat, subprocess.PIPE)
+            try :
+                status = render(viewer.stdin)
+            finally :
+                viewer.stdin.close()
+        if status != 0 :
+            _stopProcess(viewer)
+            raise Exception("Graphviz failed with status " + str(status))
+        if not wait :
+            return viewer
+        viewer.wait()
+    elif args.quickView and args.timeout is not None :
+        with profiler.stage("render") :
+            (fd, imagePath) = tempfile.mkstemp()
+            os.close(fd)
+            try :
+                status = render(imagePath)
+                if status != 0 :
+                    raise Exception("Graphviz failed with status "
+                                    + str(status))
+                with open(imagePath, "rb") as fi :
+                    viewer = _startViewer(imageFormat, fi)
+            finally :
+                os.remove(imagePath)
+        if not wait :
+            return viewer
+        viewer.wait()
+    elif args.quickView :
+        with profiler.stage("dot") :
+            dotContent = makeDotFileContent(relations, dotOptions,
+                                            args.drawSingles, weights)
+        with profiler.stage("render") :
+            viewer = viewDotContent(dotContent, wait, imageFormat,
+                                    args.renderCache,
+                                    chooseEngine(relations, args.engine,
+                                                 args.drawSingles))
+        if not wait :
+            return viewer
+    elif args.imageFormat is not None :
+        with profiler.stage("render") :
+            if outputPath is None :
+                status = render(stdout)
+            else :
+                tmpPath = outputPath + ".tmp"
+                try :
+                    status = render(tmpPath)
+                    if status == 0 :
+                        os.rename(tmpPath, outputPath)
+                finally :
+                    if os.path.exists(tmpPath) :
+                        os.remove(tmpPath)
+        if status != 0 :
+            raise Exception("Graphviz failed with status " + str(status))
+    elif outputPath is None :
+        with profiler.stage("write") :
+            writeRelations(relations, stdout, args.outputFormat,
+                           dotOptions, args.drawSingles, weights)
     else :
-        stdout.write(dotContent)
+        mode = "wb" if args.outputFormat == "edgelist" else "w"
+        with profiler.stage("write") :
+            tmpPath = outputPath + ".tmp"
+            try :
+                with open(tmpPath, mode) as fo :
+                    writeRelations(relations, fo, args.outputFormat,
+                                   dotOptions, args.drawSingles,
+                                   weights)
+                os.rename(tmpPath, outputPath)
+            except :
+                if os.path.exists(tmpPath) :
+                    os.remove(tmpPath)
+                raise
+    return None
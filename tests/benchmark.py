@@ -0,0 +1,319 @@
+### * Description
+
+# Benchmark script for pyDep module
+
+### ** Usage
+
+# python benchmark.py                  # run, print and append to the history
+# python benchmark.py --compare        # also compare with the previous run
+# python benchmark.py --functions 2000 --calls 10 --repeat 5
+
+### * Setup
+
+### ** Import
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import re
+import json
+import time
+import random
+import argparse
+import tempfile
+import timeit
+import platform
+import subprocess
+import pydep as mod
+
+### ** Parameters
+
+INPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "inputFiles")
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "benchmark_history.json")
+BUILT_INS = ["len", "range", "sorted", "str", "int", "isinstance", "open"]
+STAGES = ["astParseFile", "getFunctionDef", "getFunctionCalls",
+          "filterLocalCalls", "makeDotFileContent"]
+
+### * Functions
+
+### ** makeSyntheticModule(nFunctions, nCalls, seed)
+
+def makeSyntheticModule(nFunctions, nCalls, seed = 0) :
+    """Generate the source of a module with a given number of functions, each
+    of them containing a given number of calls. About a quarter of the calls
+    are made to built-in functions, the others to functions of the module.
+    Calls are spread over plain statements, loops and conditionals.
+
+    Args:
+        nFunctions (int): Number of functions
+        nCalls (int): Number of calls per function
+        seed (int): Seed of the random generator
+
+    Returns:
+        str: Source code of the module
+
+    """
+    rng = random.Random(seed)
+    names = ["func%d" % i for i in range(nFunctions)]
+    if nFunctions > 0 :
+        names[0] = "_main"
+    lines = []
+    for name in names :
+        lines.append("def %s(x) :" % name)
+        lines.append("    y = 0")
+        for i in range(nCalls) :
+            if rng.random() < 0.25 :
+                called = rng.choice(BUILT_INS)
+            else :
+                called = rng.choice(names)
+            kind = i % 3
+            if kind == 0 :
+                lines.append("    y += %s(x)" % called)
+            elif kind == 1 :
+                lines.append("    for i in range(x) :")
+                lines.append("        y += %s(i)" % called)
+            else :
+                lines.append("    if x > %d :" % i)
+                lines.append("        return %s(x - 1)" % called)
+        lines.append("    return y")
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+### ** replicateModule(filename, times)
+
+def replicateModule(filename, times) :
+    """Concatenate several copies of a module, renaming the functions of each
+    copy (and the calls between them) so that the function names stay unique.
+
+    Args:
+        filename (str): Source file to replicate
+        times (int): Number of copies
+
+    Returns:
+        str: Source code of the replicated module
+
+    """
+    with open(filename, "r") as fi :
+        source = fi.read()
+    names = set(re.findall(r"^def (\w+)", source, re.MULTILINE))
+    pattern = re.compile(r"\b(" + "|".join(sorted(names)) + r")\b")
+    copies = []
+    for i in range(times) :
+        suffix = "_%d" % i
+        copies.append(pattern.sub(lambda m : m.group(1) + suffix, source))
+    return "\n".join(copies)
+
+### ** timeStages(source, repeat)
+
+def timeStages(source, repeat = 3) :
+    """Time each stage of the pydep pipeline on a module source. Each stage is
+    timed separately on the output of the previous one, and the best of
+    ``repeat`` runs is kept.
+
+    Args:
+        source (str): Source code of the module
+        repeat (int): Number of runs per stage
+
+    Returns:
+        dict: Dictionary mapping stage names and their best time (seconds)
+
+    """
+    (fd, filename) = tempfile.mkstemp(suffix = ".py")
+    with os.fdopen(fd, "w") as fo :
+        fo.write(source)
+    try :
+        parsed = mod.astParseFile(filename)
+        funcDefs = mod.getFunctionDef(parsed)
+        funcCalls = mod.getFunctionCalls(funcDefs)
+        localCalls = mod.filterLocalCalls(funcCalls)
+        dotOptions = {"nodeShape" : "box"}
+        stages = {
+            "astParseFile" : lambda : mod.astParseFile(filename),
+            "getFunctionDef" : lambda : mod.getFunctionDef(parsed),
+            "getFunctionCalls" : lambda : mod.getFunctionCalls(funcDefs),
+            "filterLocalCalls" : lambda : mod.filterLocalCalls(funcCalls),
+            "makeDotFileContent" :
+            lambda : mod.makeDotFileContent(localCalls, dotOptions)
+        }
+        o = dict()
+        for stage in STAGES :
+            o[stage] = min(timeit.repeat(stages[stage], number = 1,
+                                         repeat = repeat))
+    finally :
+        os.remove(filename)
+    return o
+
+### ** makeCases(args)
+
+def makeCases(args) :
+    """Build the list of benchmark cases
+
+    Args:
+        args (argparse.Namespace): Parsed arguments
+
+    Returns:
+        list of tuple: List of (case name, module source) tuples
+
+    """
+    cases = []
+    cases.append(("synthetic_%dx%d" % (args.functions, args.calls),
+                  makeSyntheticModule(args.functions, args.calls, args.seed)))
+    for name in ["genbank", "flow"] :
+        filename = os.path.join(INPUT_DIR, name + ".py")
+        source = replicateModule(filename, args.replicate)
+        try :
+            compile(source, filename, "exec")
+        except SyntaxError :
+            # genbank.py is written for Python 2
+            continue
+        cases.append(("%s_x%d" % (name, args.replicate), source))
+    return cases
+
+### ** _gitRevision()
+
+def _gitRevision() :
+    try :
+        p = subprocess.Popen(["git", "rev-parse", "--short", "HEAD"],
+                             stdout = subprocess.PIPE,
+                             stderr = open(os.devnull, "w"),
+                             cwd = os.path.dirname(os.path.abspath(__file__)))
+        revision = p.communicate()[0].decode("ascii").strip()
+    except OSError :
+        return None
+    return revision or None
+
+### ** loadHistory(filename) and saveHistory(filename, history)
+
+def loadHistory(filename) :
+    if not os.path.isfile(filename) :
+        return []
+    with open(filename, "r") as fi :
+        return json.load(fi)
+
+def saveHistory(filename, history) :
+    with open(filename, "w") as fo :
+        json.dump(history, fo, indent = 1, sort_keys = True)
+
+### ** compareRuns(previous, current, threshold)
+
+def compareRuns(previous, current, threshold) :
+    """Compare the stage timings of two runs
+
+    Args:
+        previous (dict): Reference run, from the history
+        current (dict): New run
+        threshold (float): Relative slow-down above which a stage is flagged
+          (e.g. 0.1 for 10%)
+
+    Returns:
+        list of tuple: List of (case, stage, previous time, current time,
+          ratio) tuples for the flagged stages
+
+    """
+    o = []
+    for case in sorted(current["results"].keys()) :
+        if case not in previous["results"] :
+            continue
+        for stage in STAGES :
+            before = previous["results"][case].get(stage)
+            after = current["results"][case].get(stage)
+            if not before or after is None :
+                continue
+            ratio = after / before
+            if ratio > 1 + threshold :
+                o.append((case, stage, before, after, ratio))
+    return o
+
+### * Main-related functions
+
+### ** _makeParser()
+
+def _makeParser() :
+    """Build the parser for the benchmark script
+
+    Returns:
+        argparse.ArgumentParser: Argument parser object
+
+    """
+    parser = argparse.ArgumentParser(
+        description = "Time each stage of the pydep pipeline on synthetic and "
+        "replicated modules, and keep the results in a JSON history.")
+    parser.add_argument("--functions", type = int, default = 1000,
+                        help = "Number of functions in the synthetic module "
+                        "(default: 1000)")
+    parser.add_argument("--calls", type = int, default = 10,
+                        help = "Number of calls per synthetic function "
+                        "(default: 10)")
+    parser.add_argument("--seed", type = int, default = 0,
+                        help = "Seed for the synthetic module (default: 0)")
+    parser.add_argument("--replicate", type = int, default = 20,
+                        help = "Number of copies of genbank.py and flow.py "
+                        "(default: 20)")
+    parser.add_argument("--repeat", type = int, default = 3,
+                        help = "Number of runs per stage, the best one is kept "
+                        "(default: 3)")
+    parser.add_argument("--history", type = str, default = HISTORY_FILE,
+                        help = "JSON history file (default: "
+                        "tests/benchmark_history.json)")
+    parser.add_argument("--compare", action = "store_true",
+                        help = "Compare with the previous run of the history "
+                        "made with the same Python version, and exit with "
+                        "status 1 if a stage is slower than the threshold")
+    parser.add_argument("--threshold", type = float, default = 0.1,
+                        help = "Relative slow-down flagged as a regression "
+                        "(default: 0.1)")
+    parser.add_argument("--noSave", action = "store_true",
+                        help = "Do not append the run to the history")
+    return parser
+
+### ** _main(args = None, stdout = None)
+
+def _main(args = None, stdout = None) :
+    """Main function, entry point for the benchmark script
+
+    Args:
+        args (list): List of command line arguments. If None, the arguments are
+          taken from the command line
+        stdout (file): stdout stream. If None, use sys.stdout
+
+    Returns:
+        int: Exit status (1 if regressions were found)
+
+    """
+    parser = _makeParser()
+    args = parser.parse_args(args)
+    if stdout is None :
+        stdout = sys.stdout
+    run = {"time" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+           "python" : platform.python_version(),
+           "pydep" : mod.__version__,
+           "revision" : _gitRevision(),
+           "results" : dict()}
+    for (case, source) in makeCases(args) :
+        run["results"][case] = timeStages(source, args.repeat)
+        for stage in STAGES :
+            stdout.write("%-20s %-20s %9.2f ms\n" %
+                         (case, stage, run["results"][case][stage] * 1000))
+    history = loadHistory(args.history)
+    status = 0
+    if args.compare :
+        previous = [x for x in history if x["python"] == run["python"]]
+        if not previous :
+            stdout.write("No previous run to compare with\n")
+        else :
+            regressions = compareRuns(previous[-1], run, args.threshold)
+            for (case, stage, before, after, ratio) in regressions :
+                stdout.write("REGRESSION %s %s: %.2f ms -> %.2f ms (x%.2f)\n" %
+                             (case, stage, before * 1000, after * 1000, ratio))
+            if regressions :
+                status = 1
+    if not args.noSave :
+        history.append(run)
+        saveHistory(args.history, history)
+    return status
+
+if __name__ == "__main__" :
+    sys.exit(_main())
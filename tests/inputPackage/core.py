@@ -0,0 +1,17 @@
+import os
+import inputPackage.utils
+from . import utils as u
+from .sub.helpers import clean, normalize as norm
+from .sub import helpers
+
+def run(data) :
+    data = norm(clean(data))
+    return summarize(data)
+
+def summarize(data) :
+    total = u.total(data)
+    return inputPackage.utils.mean(data, total)
+
+def report(data) :
+    os.path.join("a", "b")
+    return helpers.describe(summarize(data))
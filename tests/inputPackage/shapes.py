@@ -0,0 +1,44 @@
+from .utils import mean
+
+class Shape(object) :
+
+    def __init__(self, points) :
+        self.points = points
+        self.check()
+
+    def check(self) :
+        if not self.points :
+            raise ValueError("empty shape")
+
+    def area(self) :
+        return 0
+
+    def name(self) :
+        return "shape"
+
+    def describe(self) :
+        return "%s: %.2f" % (self.name(), self.area())
+
+class Polygon(Shape) :
+
+    def area(self) :
+        return mean(self.points) * len(self.points)
+
+    def name(self) :
+        return "polygon"
+
+class Square(Polygon) :
+
+    @classmethod
+    def fromSide(cls, side) :
+        return cls([side] * 4)
+
+    @staticmethod
+    def unit(points) :
+        return points.area()
+
+    def summary(self) :
+        return self.describe() + makeSquare().name()
+
+def makeSquare() :
+    return Square.fromSide(1)
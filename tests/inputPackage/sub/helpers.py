@@ -0,0 +1,11 @@
+from ..utils import *
+
+def clean(data) :
+    return [x for x in data if x is not None]
+
+def normalize(data) :
+    m = mean(data)
+    return [x / m for x in data]
+
+def describe(value) :
+    return "%.2f" % value
@@ -0,0 +1,7 @@
+def total(data) :
+    return sum(data)
+
+def mean(data, total = None) :
+    if total is None :
+        total = sum(data)
+    return float(total) / len(data)
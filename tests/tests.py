@@ -22,7 +22,15 @@ sys.path.append("..")
 import os
 import StringIO
 import ast
+import tempfile
+import shutil
+import time
+import json
+import random
+import io
+import xml.dom.minidom
 import pydep as mod
+import benchmark
 
 ### ** Parameters
 
@@ -31,6 +39,9 @@ import pydep as mod
 MY_TEST_MODULE = "inputFiles/exampleModule.py"
 if not os.path.isfile(MY_TEST_MODULE) :
     MY_TEST_MODULE = os.path.join("tests", MY_TEST_MODULE)
+MY_TEST_PACKAGE = os.path.dirname(MY_TEST_MODULE)
+MY_TEST_PACKAGE_2 = os.path.join(os.path.dirname(MY_TEST_PACKAGE),
+                                 "inputPackage")
 MTM_BODY_LENGTH = 9
 MTM_N_FUNCDEFS = 9
 MTM_N_CALLS = [2, 2, 1, 3, 2, 1, 2, 0, 0]
@@ -67,9 +78,9 @@ class TestMakeParser(unittest.TestCase) :
         self.assertEqual(result.inputModule, ["myMod01.py"])
 
     def test_inputModule_two(self) :
-        commandLine = ["myMod01.py", "myModTooMuch.py"]
-        with self.assertRaises(SystemExit) :
-            result = self.parser.parse_args(commandLine)
+        commandLine = ["myMod01.py", "myMod02.py"]
+        result = self.parser.parse_args(commandLine)
+        self.assertEqual(result.inputModule, ["myMod01.py", "myMod02.py"])
                     
 ### *** test_nodeShape
 
@@ -95,6 +106,26 @@ class TestMakeParser(unittest.TestCase) :
         result = self.parser.parse_args(commandLine)
         self.assertFalse(result.quickView)
 
+    def test_getMethods_default(self) :
+        commandLine = ["myMod01.py"]
+        result = self.parser.parse_args(commandLine)
+        self.assertFalse(result.getMethods)
+
+    def test_getMethods_true(self) :
+        commandLine = ["myMod01.py", "-m"]
+        result = self.parser.parse_args(commandLine)
+        self.assertTrue(result.getMethods)
+
+    def test_jobs_default(self) :
+        commandLine = ["myMod01.py"]
+        result = self.parser.parse_args(commandLine)
+        self.assertEqual(result.jobs, 1)
+
+    def test_jobs_four(self) :
+        commandLine = ["myPackage", "-j", "4"]
+        result = self.parser.parse_args(commandLine)
+        self.assertEqual(result.jobs, 4)
+
     def test_quickView_true(self) :
         commandLine = ["myMod01.py", "-q"]
         result = self.parser.parse_args(commandLine)
@@ -192,6 +223,40 @@ class TestGetFunctionCalls(unittest.TestCase) :
         expected = ["fib", "Exception"]
         self.assertItemsEqual(result, expected)
 
+### ** class TestExtractModuleInfo
+
+class TestExtractModuleInfo(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.astSource = mod.astParseFile(MY_TEST_MODULE)
+        self.info = mod.extractModuleInfo(self.astSource)
+
+### *** Test
+
+    def test_functionDefs_000(self) :
+        result = [x.name for x in self.info[0]]
+        expected = [x.name for x in mod.getFunctionDef(self.astSource)]
+        self.assertListEqual(result, expected)
+
+    def test_functionCalls_000(self) :
+        result = self.info[2]
+        expected = mod.getFunctionCalls(mod.getFunctionDef(self.astSource))
+        self.assertDictEqual(result, expected)
+
+    def test_imports_000(self) :
+        astSource = ast.parse("import os\nfrom sys import argv as a\n")
+        result = mod.extractModuleInfo(astSource)[1]
+        expected = [("argv", "a"), ("os", None)]
+        self.assertListEqual(result, expected)
+
+    def test_nestedCalls_000(self) :
+        astSource = ast.parse("def f(x) :\n    return g(h(x), [k(y) for y in x])\n")
+        result = mod.extractModuleInfo(astSource)[2]["f"]
+        expected = ["g", "h", "k"]
+        self.assertListEqual(result, expected)
+
 ### ** class TestFilterLocalCalls
 
 class TestFilterLocalCalls(unittest.TestCase) :
@@ -221,6 +286,1806 @@ class TestFilterLocalCalls(unittest.TestCase) :
         expected = []
         self.assertItemsEqual(result, expected)
 
+### ** class TestCsrGraph
+
+class TestCsrGraph(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.astSource = mod.astParseFile(MY_TEST_MODULE)
+        self.funcDefs = mod.getFunctionDef(self.astSource)
+        self.funcCalls = mod.getFunctionCalls(self.funcDefs)
+        self.graph = mod.getFunctionCalls(self.funcDefs, csr = True)
+
+### *** Test
+
+    def test_roundTrip_000(self) :
+        self.assertDictEqual(self.graph.toRelations(), self.funcCalls)
+
+    def test_filterLocal_000(self) :
+        result = mod.filterLocalCalls(self.graph).toRelations()
+        expected = mod.filterLocalCalls(self.funcCalls)
+        self.assertDictEqual(result, expected)
+
+    def test_functions_000(self) :
+        for getSingles in [True, False] :
+            result = mod._getFuncFromRelations(self.graph, getSingles)
+            expected = mod._getFuncFromRelations(self.funcCalls, getSingles)
+            self.assertListEqual(result, expected)
+
+    def test_reverse_000(self) :
+        reverse = mod.filterLocalCalls(self.graph).reverse().toRelations()
+        self.assertItemsEqual(reverse["validateDNAstring"],
+                              ["makeDNAcomplement", "makeDNAreverseComplement",
+                               "transcribeDNA"])
+
+    def test_dotContent_000(self) :
+        result = mod.makeDotFileContent(mod.filterLocalCalls(self.graph))
+        expected = mod.makeDotFileContent(mod.filterLocalCalls(self.funcCalls))
+        self.assertEqual(result, expected)
+
+    def test_nEdges_000(self) :
+        self.assertEqual(self.graph.nEdges(), sum(MTM_N_CALLS))
+
+### ** class TestFindSourceFiles
+
+class TestFindSourceFiles(unittest.TestCase) :
+
+### *** Test
+
+    def test_findSourceFiles_000(self) :
+        result = [os.path.basename(x)
+                  for x in mod.findSourceFiles(MY_TEST_PACKAGE)]
+        expected = ["exampleModule.py", "flow.py", "genbank.py"]
+        self.assertListEqual(result, expected)
+
+### ** class TestGetModuleName
+
+class TestGetModuleName(unittest.TestCase) :
+
+### *** Test
+
+    def test_moduleName_000(self) :
+        result = mod.getModuleName(os.path.join("root", "a", "b.py"), "root")
+        self.assertEqual(result, "a.b")
+
+    def test_moduleName_init(self) :
+        result = mod.getModuleName(os.path.join("root", "a", "__init__.py"),
+                                   "root")
+        self.assertEqual(result, "a")
+
+### ** class TestGetPackageRelations
+
+class TestGetPackageRelations(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.relations = mod.getPackageRelations(MY_TEST_PACKAGE)
+
+### *** Test
+
+    def test_qualifiedNames_000(self) :
+        result = self.relations["exampleModule.sensibleFib"]
+        expected = ["exampleModule.fib"]
+        self.assertListEqual(result, expected)
+
+    def test_allModules_000(self) :
+        result = set([x.rsplit(".", 1)[0] for x in self.relations.keys()])
+        expected = set(["exampleModule", "flow", "genbank"])
+        self.assertSetEqual(result, expected)
+
+    def test_parallel_000(self) :
+        result = mod.getPackageRelations(MY_TEST_PACKAGE, jobs = 2)
+        self.assertDictEqual(result, self.relations)
+
+    def test_parallel_dot_000(self) :
+        result = mod.makeDotFromSrc(MY_TEST_PACKAGE, jobs = 2)
+        expected = mod.makeDotFromSrc(MY_TEST_PACKAGE, jobs = 1)
+        self.assertEqual(result, expected)
+
+### ** class TestCache
+
+class TestCache(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.cacheDir = tempfile.mkdtemp()
+
+    def tearDown(self) :
+        shutil.rmtree(self.cacheDir)
+
+    def _cacheFiles(self) :
+        return [os.path.join(d, f) for (d, dirs, files) in os.walk(self.cacheDir)
+                for f in files if f != mod.CACHE_MARKER]
+
+### *** Test
+
+    def test_storeLoad_000(self) :
+        record = [("f", ["g", "h"]), ("g", [])]
+        key = mod._cacheKey(b"def f() : pass")
+        mod._cacheStore(self.cacheDir, key, record)
+        self.assertEqual(mod._cacheLoad(self.cacheDir, key), record)
+
+    def test_loadMissing_000(self) :
+        key = mod._cacheKey(b"def f() : pass")
+        self.assertIsNone(mod._cacheLoad(self.cacheDir, key))
+
+    def test_key_content_000(self) :
+        self.assertNotEqual(mod._cacheKey(b"a = 1"), mod._cacheKey(b"a = 2"))
+
+    def test_packageRelations_000(self) :
+        expected = mod.getPackageRelations(MY_TEST_PACKAGE)
+        cold = mod.getPackageRelations(MY_TEST_PACKAGE, cacheDir = self.cacheDir)
+        warm = mod.getPackageRelations(MY_TEST_PACKAGE, cacheDir = self.cacheDir)
+        self.assertDictEqual(cold, expected)
+        self.assertDictEqual(warm, expected)
+        self.assertEqual(len(self._cacheFiles()), 3)
+
+    def test_prune_000(self) :
+        for i in range(4) :
+            mod._cacheStore(self.cacheDir, mod._cacheKey(str(i).encode()),
+                            [("f" * 100, [])])
+        oldest = self._cacheFiles()[0]
+        os.utime(oldest, (time.time() - 100, time.time() - 100))
+        size = sum([os.path.getsize(x) for x in self._cacheFiles()])
+        nRemoved = mod.pruneCache(self.cacheDir, size - 1)
+        self.assertEqual(nRemoved, 1)
+        self.assertFalse(os.path.exists(oldest))
+
+    def test_prune_otherFiles_000(self) :
+        mod._cacheStore(self.cacheDir, mod._cacheKey(b"a"), [("f", [])])
+        others = [os.path.join(self.cacheDir, "data.bin"),
+                  os.path.join(self.cacheDir, "ab", "notes.txt")]
+        os.mkdir(os.path.dirname(others[1]))
+        for other in others :
+            with open(other, "w") as fo :
+                fo.write("x" * 1000)
+        self.assertEqual(mod.pruneCache(self.cacheDir, 0), 1)
+        self.assertEqual(sorted(self._cacheFiles()), sorted(others))
+        for other in others :
+            self.assertTrue(os.path.exists(other))
+        self.assertTrue(os.path.exists(os.path.join(self.cacheDir,
+                                                    mod.CACHE_MARKER)))
+
+    def test_prune_unmarked_000(self) :
+        with open(os.path.join(self.cacheDir, "data.bin"), "w") as fo :
+            fo.write("x" * 1000)
+        self.assertFalse(mod._initCacheDir(self.cacheDir))
+        with self.assertRaises(Exception) :
+            mod.pruneCache(self.cacheDir, 0)
+        self.assertTrue(os.path.exists(os.path.join(self.cacheDir,
+                                                    "data.bin")))
+        sys.stderr = StringIO.StringIO()
+        try :
+            with self.assertRaises(SystemExit) :
+                mod._main([MY_TEST_MODULE, "--cache-dir", self.cacheDir,
+                           "--cache-size", "0"], stdout = StringIO.StringIO())
+        finally :
+            sys.stderr = sys.__stderr__
+        self.assertTrue(os.path.exists(os.path.join(self.cacheDir,
+                                                    "data.bin")))
+
+    def test_initCacheDir_oldCache_000(self) :
+        # Caches of older versions have no marker but only contain entries
+        mod._cacheStore(self.cacheDir, mod._cacheKey(b"a"), [("f", [])])
+        os.remove(os.path.join(self.cacheDir, mod.CACHE_MARKER))
+        self.assertTrue(mod._initCacheDir(self.cacheDir))
+        self.assertEqual(mod.pruneCache(self.cacheDir, 0), 1)
+
+    def test_store_error_000(self) :
+        with self.assertRaises(ValueError) :
+            mod._cacheStore(self.cacheDir, mod._cacheKey(b"a"), [object()])
+        self.assertEqual(self._cacheFiles(), [])
+
+    def test_store_writeError_000(self) :
+        def dump(record, fo) :
+            raise IOError(28, "No space left on device")
+        marshalDump = mod.marshal.dump
+        mod.marshal.dump = dump
+        try :
+            mod._cacheStore(self.cacheDir, mod._cacheKey(b"a"), [1])
+        finally :
+            mod.marshal.dump = marshalDump
+        self.assertEqual(self._cacheFiles(), [])
+        self.assertIsNone(mod._cacheLoad(self.cacheDir, mod._cacheKey(b"a")))
+        # The cache directory cannot be created
+        filename = os.path.join(self.cacheDir, "file")
+        with open(filename, "w") as fo :
+            fo.write("")
+        mod._cacheStore(filename, mod._cacheKey(b"a"), [1])
+
+### ** class TestBenchmark
+
+class TestBenchmark(unittest.TestCase) :
+
+### *** Test
+
+    def test_syntheticModule_000(self) :
+        astSource = ast.parse(benchmark.makeSyntheticModule(50, 4))
+        funcCalls = mod.getFunctionCalls(mod.getFunctionDef(astSource))
+        self.assertEqual(len(funcCalls), 50)
+        self.assertTrue(all([len(x) > 0 for x in funcCalls.values()]))
+        self.assertIn("_main", funcCalls)
+
+    def test_compareRuns_000(self) :
+        previous = {"results" : {"a" : {"getFunctionDef" : 1.0}}}
+        current = {"results" : {"a" : {"getFunctionDef" : 1.5}}}
+        result = benchmark.compareRuns(previous, current, 0.1)
+        self.assertEqual([x[:2] for x in result], [("a", "getFunctionDef")])
+
+### ** class TestGetImportedModules
+
+class TestGetImportedModules(unittest.TestCase) :
+
+### *** Test
+
+    def test_allNames_000(self) :
+        astSource = ast.parse("from x import a, b as c\nimport y, z\n")
+        result = mod._getImportedModules(astSource)
+        expected = [("a", None), ("b", "c"), ("y", None), ("z", None)]
+        self.assertListEqual(result, expected)
+
+### ** class TestResolveImportBindings
+
+class TestResolveImportBindings(unittest.TestCase) :
+
+### *** Test
+
+    def test_absolute_000(self) :
+        astSource = ast.parse("import a.b\nimport c.d as e\nfrom f import g as h\n")
+        bindings = mod.extractModuleInfo(astSource, detailed = True)[1]
+        result = mod._resolveImportBindings("pkg.mod", False, bindings)[0]
+        expected = {"a" : "a", "e" : "c.d", "h" : "f.g"}
+        self.assertDictEqual(result, expected)
+
+    def test_relative_000(self) :
+        astSource = ast.parse("from . import a\nfrom ..b import c\nfrom .d import *\n")
+        bindings = mod.extractModuleInfo(astSource, detailed = True)[1]
+        (table, starModules) = mod._resolveImportBindings("pkg.sub.mod", False,
+                                                          bindings)
+        self.assertDictEqual(table, {"a" : "pkg.sub.a", "c" : "pkg.b.c"})
+        self.assertListEqual(starModules, ["pkg.sub.d"])
+
+    def test_relative_package_000(self) :
+        astSource = ast.parse("from .a import b\n")
+        bindings = mod.extractModuleInfo(astSource, detailed = True)[1]
+        result = mod._resolveImportBindings("pkg.sub", True, bindings)[0]
+        self.assertDictEqual(result, {"b" : "pkg.sub.a.b"})
+
+### ** class TestResolveCalls
+
+class TestResolveCalls(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.relations = mod.getPackageRelations(MY_TEST_PACKAGE_2)
+
+### *** Test
+
+    def test_fromImportAs_000(self) :
+        result = self.relations["inputPackage.core.run"]
+        expected = ["inputPackage.core.summarize",
+                    "inputPackage.sub.helpers.clean",
+                    "inputPackage.sub.helpers.normalize"]
+        self.assertListEqual(result, expected)
+
+    def test_moduleAttributes_000(self) :
+        result = self.relations["inputPackage.core.summarize"]
+        expected = ["inputPackage.utils.mean", "inputPackage.utils.total"]
+        self.assertListEqual(result, expected)
+
+    def test_starImport_000(self) :
+        result = self.relations["inputPackage.sub.helpers.normalize"]
+        self.assertListEqual(result, ["inputPackage.utils.mean"])
+
+    def test_singleModule_000(self) :
+        astSource = mod.astParseFile(MY_TEST_MODULE)
+        expected = mod.filterLocalCalls(mod.getFunctionCalls(
+            mod.getFunctionDef(astSource)))
+        result = mod.getRelationsFromSrc(MY_TEST_MODULE)
+        self.assertDictEqual(result, expected)
+
+### ** class TestGetMethods
+
+class TestGetMethods(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.relations = mod.getPackageRelations(MY_TEST_PACKAGE_2,
+                                                 getMethods = True)
+
+### *** Test
+
+    def test_noMethods_000(self) :
+        relations = mod.getPackageRelations(MY_TEST_PACKAGE_2)
+        self.assertNotIn("inputPackage.shapes.Shape.describe", relations)
+
+    def test_selfCall_000(self) :
+        result = self.relations["inputPackage.shapes.Shape.__init__"]
+        self.assertListEqual(result, ["inputPackage.shapes.Shape.check"])
+
+    def test_inheritedSelfCall_000(self) :
+        result = self.relations["inputPackage.shapes.Square.summary"]
+        expected = ["inputPackage.shapes.Shape.describe",
+                    "inputPackage.shapes.makeSquare"]
+        self.assertListEqual(result, expected)
+
+    def test_classCall_000(self) :
+        result = self.relations["inputPackage.shapes.makeSquare"]
+        self.assertListEqual(result, ["inputPackage.shapes.Square.fromSide"])
+
+    def test_staticMethod_000(self) :
+        result = self.relations["inputPackage.shapes.Square.unit"]
+        self.assertListEqual(result, [])
+
+    def test_mro_diamond_000(self) :
+        index = mod._ClassIndex()
+        index.bases = {"D" : ["B", "C"], "B" : ["A"], "C" : ["A"], "A" : []}
+        self.assertListEqual(index.getMro("D"), ["D", "B", "C", "A"])
+
+    def test_methodTable_000(self) :
+        index = mod._ClassIndex()
+        index.bases = {"B" : ["A"], "A" : []}
+        index.methods = {"A" : {"f" : "A.f", "g" : "A.g"}, "B" : {"g" : "B.g"}}
+        self.assertDictEqual(index.getMethodTable("B"),
+                             {"f" : "A.f", "g" : "B.g"})
+        self.assertEqual(index.lookup("B.f"), "A.f")
+
+### ** class TestGetNeighbourhood
+
+class TestGetNeighbourhood(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.relations = mod.getRelationsFromSrc(MY_TEST_MODULE)
+
+### *** Test
+
+    def test_findFunction_000(self) :
+        relations = {"a.b.f" : [], "a.c.f" : [], "a.c.g" : []}
+        self.assertListEqual(mod.findFunction(relations, "g"), ["a.c.g"])
+        self.assertListEqual(mod.findFunction(relations, "f"),
+                             ["a.b.f", "a.c.f"])
+        self.assertListEqual(mod.findFunction(relations, "c.f"), ["a.c.f"])
+
+    def test_callees_000(self) :
+        result = mod.getNeighbourhood(self.relations, "transcribeDNA", 1,
+                                      "callees")
+        self.assertItemsEqual(result.keys(), ["transcribeDNA",
+                                              "validateDNAstring",
+                                              "makeDNAcomplement"])
+        self.assertItemsEqual(result["makeDNAcomplement"],
+                              ["validateDNAstring"])
+
+    def test_callees_depth_000(self) :
+        result = mod.getNeighbourhood(self.relations, "transcribeDNA", None,
+                                      "callees")
+        self.assertIn("isValidDNAstring", result)
+
+    def test_callers_000(self) :
+        result = mod.getNeighbourhood(self.relations, "validateDNAstring", 1,
+                                      "callers")
+        self.assertItemsEqual(result.keys(), ["validateDNAstring",
+                                              "makeDNAcomplement",
+                                              "makeDNAreverseComplement",
+                                              "transcribeDNA"])
+        self.assertListEqual(result["validateDNAstring"], [])
+
+    def test_both_000(self) :
+        result = mod.getNeighbourhood(self.relations, "validateDNAstring", 1)
+        self.assertIn("isValidDNAstring", result)
+        self.assertIn("transcribeDNA", result)
+        self.assertNotIn("fib", result)
+
+    def test_main_focus_000(self) :
+        stdout = StringIO.StringIO()
+        mod._main([MY_TEST_MODULE, "--focus", "fib", "--depth", "1"],
+                  stdout = stdout)
+        self.assertIn("sensibleFib -> fib;", stdout.getvalue())
+        self.assertNotIn("transcribeDNA", stdout.getvalue())
+
+### ** class TestStronglyConnectedComponents
+
+class TestStronglyConnectedComponents(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.relations = {"a" : ["b"], "b" : ["a", "c"], "c" : ["c", "d"],
+                          "d" : []}
+
+    def _reachable(self, relations, start) :
+        seen = set([start])
+        todo = [start]
+        while todo :
+            for x in relations.get(todo.pop(), []) :
+                if x not in seen :
+                    seen.add(x)
+                    todo.append(x)
+        return seen
+
+### *** Test
+
+    def test_components_000(self) :
+        result = mod.getStronglyConnectedComponents(self.relations)
+        self.assertListEqual(result, [["d"], ["c"], ["a", "b"]])
+
+    def test_components_random_000(self) :
+        rng = random.Random(1)
+        names = ["f%d" % i for i in range(40)]
+        relations = dict([(x, rng.sample(names, 2)) for x in names])
+        result = mod.getStronglyConnectedComponents(relations)
+        reach = dict([(x, self._reachable(relations, x)) for x in names])
+        for component in result :
+            for x in names :
+                sameComponent = (component[0] in reach[x] and
+                                 x in reach[component[0]])
+                self.assertEqual(sameComponent, x in component)
+
+    def test_components_deep_000(self) :
+        n = 5 * sys.getrecursionlimit()
+        relations = dict([("f%d" % i, ["f%d" % (i + 1)]) for i in range(n)])
+        result = mod.getStronglyConnectedComponents(relations)
+        self.assertEqual(len(result), n + 1)
+
+    def test_condense_000(self) :
+        result = mod.condenseRelations(self.relations)
+        expected = {"(a, b)" : ["c"], "c" : ["d"], "d" : []}
+        self.assertDictEqual(result, expected)
+
+    def test_condense_components_000(self) :
+        components = mod.getStronglyConnectedComponents(self.relations)
+        result = mod.condenseRelations(self.relations, components)
+        self.assertDictEqual(result, mod.condenseRelations(self.relations))
+
+    def test_main_condense_000(self) :
+        stdout = StringIO.StringIO()
+        mod._main([MY_TEST_MODULE, "--condense"], stdout = stdout)
+        self.assertNotIn("fib -> fib;", stdout.getvalue())
+
+### ** class TestReduceRelations
+
+class TestReduceRelations(unittest.TestCase) :
+
+### *** Test
+
+    def test_reduce_000(self) :
+        relations = {"a" : ["b", "c"], "b" : ["c"], "c" : []}
+        (result, nRemoved) = mod.reduceRelations(relations)
+        self.assertDictEqual(result, {"a" : ["b"], "b" : ["c"], "c" : []})
+        self.assertEqual(nRemoved, 1)
+
+    def test_reduce_cycle_000(self) :
+        relations = {"a" : ["b", "d"], "b" : ["c"], "c" : ["b", "d"], "d" : []}
+        (result, nRemoved) = mod.reduceRelations(relations)
+        expected = {"a" : ["b"], "b" : ["c"], "c" : ["b", "d"], "d" : []}
+        self.assertDictEqual(result, expected)
+        self.assertEqual(nRemoved, 1)
+
+    def test_reduce_reachability_000(self) :
+        rng = random.Random(2)
+        names = ["f%d" % i for i in range(30)]
+        relations = dict([(x, rng.sample(names, 3)) for x in names])
+        (result, nRemoved) = mod.reduceRelations(relations)
+        scc = TestStronglyConnectedComponents("test_components_000")
+        for x in names :
+            self.assertSetEqual(scc._reachable(result, x),
+                                scc._reachable(relations, x))
+
+    def test_main_reduce_000(self) :
+        stdout = StringIO.StringIO()
+        stderr = StringIO.StringIO()
+        mod._main([MY_TEST_MODULE, "--reduce"], stdout = stdout,
+                  stderr = stderr)
+        self.assertNotIn("makeDNAreverseComplement -> validateDNAstring;",
+                         stdout.getvalue())
+        self.assertIn("removed 2 calls", stderr.getvalue())
+
+### ** class TestDotId
+
+class TestDotId(unittest.TestCase) :
+
+### *** Test
+
+    def test_plain_000(self) :
+        self.assertEqual(mod._dotId("fib"), "fib")
+
+    def test_qualified_000(self) :
+        self.assertEqual(mod._dotId("mod.fib"), "\"mod.fib\"")
+
+    def test_keyword_000(self) :
+        self.assertEqual(mod._dotId("node"), "\"node\"")
+
+### ** class TestDotContent
+
+class TestDotContent(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.relations = {"f1" : [], "f2" : ["f1"], "_f3" : ["f2", "_f3"]}
+        self.dotOptions = {"nodeShape" : "box"}
+
+### *** Test
+
+    def test_makeDotFileContent_000(self) :
+        result = mod.makeDotFileContent(self.relations)
+        expected = ("digraph G {\nrankdir=LR;\nsubgraph cluster_1 {\n"
+                    "_f3;\nf1;\nf2;\n"
+                    "_f3 -> f2;\n_f3 -> _f3;\nf2 -> f1;\n}\n}\n")
+        self.assertEqual(result, expected)
+
+    def test_writeDotContent_000(self) :
+        stream = StringIO.StringIO()
+        mod.writeDotContent(self.relations, stream, self.dotOptions, True)
+        expected = mod.makeDotFileContent(self.relations, self.dotOptions, True)
+        self.assertEqual(stream.getvalue(), expected)
+
+    def test_iterDotContent_000(self) :
+        chunks = mod.iterDotContent(self.relations, self.dotOptions)
+        self.assertEqual(next(chunks), "digraph G {\n")
+
+    def test_writeDotSubgraphs_000(self) :
+        result = mod.writeDotSubgraphs({"A" : ["f1", "f2"], "built-in" : ["len"]})
+        expected = "subgraph clusterA {\nlabel = \"A\";f1;\nf2;\n}\n"
+        self.assertEqual(result, expected)
+
+### ** class TestWriters
+
+class TestWriters(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.relations = {"f1" : [], "f2" : ["f1"], "f3" : ["f2", "f3"],
+                          "f4" : []}
+
+### *** Test
+
+    def test_jsonLines_000(self) :
+        stream = StringIO.StringIO()
+        mod.writeJsonLines(self.relations, stream)
+        lines = [json.loads(x) for x in stream.getvalue().splitlines()]
+        nodes = [x["id"] for x in lines if x["type"] == "node"]
+        edges = [(x["source"], x["target"]) for x in lines
+                 if x["type"] == "edge"]
+        self.assertListEqual(nodes, ["f1", "f2", "f3"])
+        self.assertListEqual(edges, [("f2", "f1"), ("f3", "f2"), ("f3", "f3")])
+
+    def test_graphML_000(self) :
+        stream = StringIO.StringIO()
+        mod.writeGraphML(self.relations, stream, drawSingles = True)
+        document = xml.dom.minidom.parseString(stream.getvalue())
+        self.assertEqual(len(document.getElementsByTagName("node")), 4)
+        self.assertEqual(len(document.getElementsByTagName("edge")), 3)
+
+    def test_binaryEdgeList_000(self) :
+        stream = io.BytesIO()
+        mod.writeBinaryEdgeList(self.relations, stream)
+        stream.seek(0)
+        (nodes, edges) = mod.readBinaryEdgeList(stream)
+        self.assertListEqual(nodes, ["f1", "f2", "f3"])
+        self.assertListEqual(edges, [(1, 0), (2, 1), (2, 2)])
+
+    def test_binaryEdgeList_csr_000(self) :
+        stream = io.BytesIO()
+        mod.writeBinaryEdgeList(mod.CsrGraph.fromRelations(self.relations),
+                                stream)
+        expected = io.BytesIO()
+        mod.writeBinaryEdgeList(self.relations, expected)
+        self.assertEqual(stream.getvalue(), expected.getvalue())
+
+    def test_writeRelations_000(self) :
+        stream = StringIO.StringIO()
+        mod.writeRelations(self.relations, stream, "dot")
+        self.assertEqual(stream.getvalue(),
+                         mod.makeDotFileContent(self.relations))
+
+    def test_main_format_000(self) :
+        stdout = StringIO.StringIO()
+        mod._main([MY_TEST_MODULE, "-f", "jsonl"], stdout = stdout)
+        self.assertIn("\"source\": \"sensibleFib\"", stdout.getvalue())
+
+### ** class TestBatch
+
+class TestBatch(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self) :
+        shutil.rmtree(self.tmpDir)
+
+### *** Test
+
+    def test_expandInputs_000(self) :
+        pattern = os.path.join(MY_TEST_PACKAGE_2, "*.py")
+        result = mod.expandInputs([pattern, "", MY_TEST_MODULE,
+                                   MY_TEST_MODULE])
+        expected = sorted([os.path.join(MY_TEST_PACKAGE_2, x) for x in
+                           ["__init__.py", "core.py", "shapes.py",
+                            "utils.py"]]) + [MY_TEST_MODULE]
+        self.assertListEqual(result, expected)
+
+    def test_expandInputs_noMatch_000(self) :
+        self.assertListEqual(mod.expandInputs(["missing*.py"]),
+                             ["missing*.py"])
+
+    def test_getBatchRelations_separate_000(self) :
+        inputs = [MY_TEST_MODULE, MY_TEST_PACKAGE_2]
+        result = mod.getBatchRelations(inputs, combine = False)
+        expected = [mod.getRelationsFromSrc(x) for x in inputs]
+        self.assertEqual(result, expected)
+
+    def test_getBatchRelations_combined_000(self) :
+        inputs = [os.path.join(MY_TEST_PACKAGE_2, x) for x in
+                  ["core.py", "utils.py"]]
+        result = mod.getBatchRelations(inputs)
+        self.assertEqual(len(result), 1)
+        package = mod.getRelationsFromSrc(MY_TEST_PACKAGE_2)
+        self.assertIn("inputPackage.utils.total",
+                      result[0]["inputPackage.core.summarize"])
+        for name in result[0].keys() :
+            self.assertEqual(set(result[0][name]) - set(package[name]), set())
+
+    def test_getBatchRelations_jobs_000(self) :
+        inputs = [MY_TEST_MODULE, MY_TEST_PACKAGE_2]
+        self.assertEqual(mod.getBatchRelations(inputs, jobs = 2),
+                         mod.getBatchRelations(inputs, jobs = 1))
+
+    def test_main_outputDir_000(self) :
+        outputDir = os.path.join(self.tmpDir, "out")
+        mod._main([MY_TEST_MODULE, MY_TEST_PACKAGE_2, "-d", outputDir],
+                  stdout = StringIO.StringIO())
+        result = sorted(os.listdir(outputDir))
+        self.assertListEqual(result, ["inputFiles.exampleModule.dot",
+                                      "inputPackage.dot"])
+        with open(os.path.join(outputDir, result[0]), "r") as fi :
+            self.assertEqual(fi.read(), mod.makeDotFromSrc(MY_TEST_MODULE))
+
+    def test_main_listFile_000(self) :
+        listFile = os.path.join(self.tmpDir, "inputs.txt")
+        with open(listFile, "w") as fo :
+            fo.write(MY_TEST_MODULE + "\n")
+        stdout = StringIO.StringIO()
+        mod._main(["@" + listFile], stdout = stdout)
+        self.assertEqual(stdout.getvalue(), mod.makeDotFromSrc(MY_TEST_MODULE))
+
+### ** class TestServer
+
+class TestServer(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.tmpDir = tempfile.mkdtemp()
+        self.package = os.path.join(self.tmpDir, "inputPackage")
+        shutil.copytree(MY_TEST_PACKAGE_2, self.package,
+                        ignore = shutil.ignore_patterns("*.pyc",
+                                                        "__pycache__"))
+        self.index = mod.SourceIndex([self.package])
+
+    def tearDown(self) :
+        shutil.rmtree(self.tmpDir)
+
+### *** Test
+
+    def test_refresh_000(self) :
+        self.assertEqual(self.index.refresh(), 6)
+        self.assertEqual(self.index.graph.relations(),
+                         mod.getRelationsFromSrc(self.package))
+        self.assertEqual(self.index.refresh(), 0)
+
+    def test_refresh_changed_000(self) :
+        self.index.refresh()
+        filename = os.path.join(self.package, "utils.py")
+        with open(filename, "a") as fo :
+            fo.write("\ndef variance(x) :\n    return mean(x) ** 2\n")
+        self.assertEqual(self.index.refresh(), 1)
+        self.assertListEqual(
+            list(self.index.graph["inputPackage.utils.variance"].callees),
+            ["inputPackage.utils.mean"])
+
+    def test_refresh_touched_000(self) :
+        self.index.refresh()
+        filename = os.path.join(self.package, "utils.py")
+        os.utime(filename, (1, 1))
+        self.assertEqual(self.index.refresh(), 0)
+
+    def test_answerQuery_000(self) :
+        self.index.refresh()
+        self.assertEqual(mod.answerQuery(self.index, ["ping"]), b"pong\n")
+        self.assertEqual(mod.answerQuery(self.index, ["CALLERS", "summarize"]),
+                         b"inputPackage.core.report\ninputPackage.core.run\n")
+        self.assertEqual(mod.answerQuery(self.index, ["GRAPH"]),
+                         mod.makeDotFromSrc(self.package).encode("utf-8"))
+        self.assertIsNone(mod.answerQuery(self.index, ["SHUTDOWN"]))
+        self.assertRaises(Exception, mod.answerQuery, self.index, ["BAD"])
+
+    @unittest.skipUnless(hasattr(mod.socket, "AF_UNIX"), "no Unix sockets")
+    def test_serveIndex_000(self) :
+        import threading
+        socketPath = os.path.join(self.tmpDir, "pydep.sock")
+        self.index.refresh()
+        server = threading.Thread(target = mod.serveIndex,
+                                  args = (self.index, socketPath, "jsonl"))
+        server.start()
+        try :
+            for i in range(100) :
+                if os.path.exists(socketPath) :
+                    break
+                time.sleep(0.01)
+            result = mod.queryServer(socketPath, ["CALLEES", "run"])
+            self.assertEqual(len(result.splitlines()), 3)
+            self.assertRaises(Exception, mod.queryServer, socketPath,
+                              ["CALLERS", "missing"])
+            stdout = StringIO.StringIO()
+            mod._main(["--client", socketPath, "GRAPH"], stdout = stdout)
+            self.assertIn('"type": "edge"', stdout.getvalue())
+            # The socket of a running server is not replaced
+            self.assertRaises(Exception, mod._removeStaleSocket, socketPath)
+            # Invalid requests and clients hanging up do not stop the server
+            client = mod.socket.socket(mod.socket.AF_UNIX,
+                                       mod.socket.SOCK_STREAM)
+            client.connect(socketPath)
+            client.sendall(b"\xff\xfe GRAPH\n")
+            stream = client.makefile("rb")
+            self.assertTrue(stream.readline().startswith(b"ERR "))
+            stream.close()
+            client.close()
+            for i in range(3) :
+                client = mod.socket.socket(mod.socket.AF_UNIX,
+                                           mod.socket.SOCK_STREAM)
+                client.connect(socketPath)
+                client.sendall(b"GRAPH\n")
+                client.close()
+            self.assertEqual(mod.queryServer(socketPath, ["PING"]), b"pong\n")
+        finally :
+            mod.queryServer(socketPath, ["SHUTDOWN"])
+            server.join()
+        self.assertFalse(os.path.exists(socketPath))
+
+    @unittest.skipUnless(hasattr(mod.socket, "AF_UNIX"), "no Unix sockets")
+    def test_main_serveProfile_000(self) :
+        import threading
+        socketPath = os.path.join(self.tmpDir, "pydep.sock")
+        profile = os.path.join(self.tmpDir, "profile.json")
+        server = threading.Thread(target = mod._main,
+                                  args = ([self.package, "--serve", socketPath,
+                                           "--profile", profile],),
+                                  kwargs = {"stderr" : StringIO.StringIO()})
+        server.start()
+        try :
+            for i in range(100) :
+                if os.path.exists(socketPath) :
+                    break
+                time.sleep(0.01)
+            self.assertFalse(os.path.exists(profile))
+        finally :
+            mod.queryServer(socketPath, ["SHUTDOWN"])
+            server.join()
+        with open(profile, "r") as fi :
+            self.assertTrue(len(json.load(fi)["stages"]) > 0)
+
+    @unittest.skipUnless(hasattr(mod.socket, "AF_UNIX"), "no Unix sockets")
+    def test_removeStaleSocket_000(self) :
+        socketPath = os.path.join(self.tmpDir, "pydep.sock")
+        stale = mod.socket.socket(mod.socket.AF_UNIX, mod.socket.SOCK_STREAM)
+        stale.bind(socketPath)
+        stale.close()
+        mod._removeStaleSocket(socketPath)
+        self.assertFalse(os.path.exists(socketPath))
+
+    @unittest.skipUnless(hasattr(mod.socket, "AF_UNIX"), "no Unix sockets")
+    def test_serveIndex_regularFile_000(self) :
+        filename = os.path.join(self.tmpDir, "notes.txt")
+        with open(filename, "w") as fo :
+            fo.write("keep me\n")
+        self.assertRaises(Exception, mod.serveIndex, self.index, filename)
+        sys.stderr = StringIO.StringIO()
+        try :
+            with self.assertRaises(SystemExit) :
+                mod._main([self.package, "--serve", filename],
+                          stderr = StringIO.StringIO())
+        finally :
+            sys.stderr = sys.__stderr__
+        with open(filename, "r") as fi :
+            self.assertEqual(fi.read(), "keep me\n")
+
+### ** class TestWatch
+
+class TestWatch(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.tmpDir = tempfile.mkdtemp()
+        self.module = os.path.join(self.tmpDir, "module.py")
+        with open(self.module, "w") as fo :
+            fo.write("def f(x) :\n    return g(x)\n\ndef g(x) :\n    return x\n")
+        self.index = mod.SourceIndex([self.module])
+
+    def tearDown(self) :
+        shutil.rmtree(self.tmpDir)
+
+    def _append(self, text) :
+        with open(self.module, "a") as fo :
+            fo.write(text)
+
+### *** Test
+
+    def test_stamps_000(self) :
+        stamps = self.index.stamps()
+        self.assertListEqual(list(stamps.keys()), [self.module])
+        self.assertEqual(stamps, self.index.stamps())
+        self._append("\n")
+        self.assertNotEqual(stamps, self.index.stamps())
+
+    def test_main_watchProfile_000(self) :
+        class InterruptedStream(StringIO.StringIO) :
+            # Stop the watcher after the first update, as Ctrl-C would
+            def flush(self) :
+                raise KeyboardInterrupt()
+        profile = os.path.join(self.tmpDir, "profile.json")
+        mod._main([self.module, "--watch", "--profile", profile],
+                  stdout = InterruptedStream(), stderr = StringIO.StringIO())
+        with open(profile, "r") as fi :
+            result = [x["name"] for x in json.load(fi)["stages"]]
+        self.assertIn("write", result)
+
+    def test_watchIndex_unchanged_000(self) :
+        calls = []
+        result = mod.watchIndex(self.index, calls.append, interval = 0,
+                                debounce = 0, maxPolls = 2)
+        self.assertEqual(result, 1)
+        self.assertEqual(calls, [{"f" : ["g"], "g" : []}])
+
+    def test_watchIndex_changed_000(self) :
+        calls = []
+        def onChange(relations) :
+            calls.append(relations)
+            if len(calls) == 1 :
+                # Same calls, the graph does not change
+                self._append("\n# comment\n")
+        mod.watchIndex(self.index, onChange, interval = 0, debounce = 0,
+                       maxPolls = 1)
+        self.assertEqual(len(calls), 1)
+        self._append("\ndef h(x) :\n    return f(x)\n")
+        mod.watchIndex(self.index, calls.append, interval = 0, debounce = 0,
+                       maxPolls = 1)
+        self.assertEqual(calls[-1], {"f" : ["g"], "g" : [], "h" : ["f"]})
+
+    def test_watchIndex_syntaxError_000(self) :
+        calls = []
+        stderr = StringIO.StringIO()
+        def onChange(relations) :
+            calls.append(relations)
+            self._append("\ndef broken(:\n")
+        result = mod.watchIndex(self.index, onChange, interval = 0,
+                                debounce = 0, maxPolls = 1, stderr = stderr)
+        self.assertEqual(result, 1)
+        self.assertIn("pydep: ", stderr.getvalue())
+
+    def test_main_output_000(self) :
+        output = os.path.join(self.tmpDir, "graph.dot")
+        mod._main([self.module, "-o", output], stdout = StringIO.StringIO())
+        with open(output, "r") as fi :
+            self.assertEqual(fi.read(), mod.makeDotFromSrc(self.module))
+        self.assertListEqual(sorted(os.listdir(self.tmpDir)),
+                             ["graph.dot", "module.py"])
+
+### ** class TestDiff
+
+class TestDiff(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.tmpDir = tempfile.mkdtemp()
+        self.package = os.path.join(self.tmpDir, "inputPackage")
+        shutil.copytree(MY_TEST_PACKAGE_2, self.package,
+                        ignore = shutil.ignore_patterns("*.pyc",
+                                                        "__pycache__"))
+
+    def tearDown(self) :
+        shutil.rmtree(self.tmpDir)
+
+    def _git(self, *args) :
+        mod._runGit(["-c", "user.name=test", "-c", "user.email=test@test"] +
+                    list(args), self.tmpDir)
+
+    def _commitTwoRevisions(self) :
+        self._git("init", "-q")
+        self._git("add", "-A")
+        self._git("commit", "-q", "-m", "first")
+        self.oldRelations = mod.getRelationsFromSrc(self.package)
+        with open(os.path.join(self.package, "utils.py"), "a") as fo :
+            fo.write("\ndef variance(x) :\n    return mean(x) ** 2\n")
+        with open(os.path.join(self.package, "core.py"), "a") as fo :
+            fo.write("\nfrom .utils import variance\n\n"
+                     "def spread(x) :\n    return variance(x)\n")
+        self._git("add", "-A")
+        self._git("commit", "-q", "-m", "second")
+        self.newRelations = mod.getRelationsFromSrc(self.package)
+
+### *** Test
+
+    def test_diffRelations_000(self) :
+        old = {"f" : ["g", "h"], "g" : [], "h" : []}
+        new = {"f" : ["g"], "g" : ["k"], "k" : []}
+        (nodes, edges) = mod.diffRelations(old, new)
+        self.assertListEqual(nodes, [("f", "changed"), ("g", "changed"),
+                                     ("h", "removed"), ("k", "added")])
+        self.assertListEqual(edges, [(("f", "g"), "same"),
+                                     (("f", "h"), "removed"),
+                                     (("g", "k"), "added")])
+
+    def test_writeJsonDiff_000(self) :
+        stream = StringIO.StringIO()
+        mod.writeJsonDiff({"f" : ["g"], "g" : []}, {"f" : [], "g" : []},
+                          stream)
+        result = [json.loads(x) for x in stream.getvalue().splitlines()]
+        self.assertEqual(result[-1], {"type" : "edge", "source" : "f",
+                                      "target" : "g", "status" : "removed"})
+
+    def test_writeDotDiff_000(self) :
+        stream = StringIO.StringIO()
+        mod.writeDotDiff({"f" : ["g"], "g" : []}, {"f" : ["h"], "h" : []},
+                         stream)
+        result = stream.getvalue()
+        self.assertIn('f -> g [color="#cc3333",style=dashed];', result)
+        self.assertIn('f -> h [color="#2e8b57",penwidth=2];', result)
+
+    @unittest.skipUnless(mod._isAvailable("git"), "git is missing")
+    def test_getRevisionRelations_000(self) :
+        self._commitTwoRevisions()
+        profiler = mod.Profiler()
+        (result, nChanged) = mod.getRevisionRelations(
+            [self.package], ["HEAD~1", "HEAD"], self.tmpDir,
+            profiler = profiler)
+        self.assertEqual(result, [self.oldRelations, self.newRelations])
+        self.assertEqual(nChanged, 2)
+        # Unchanged files are only parsed once
+        self.assertEqual(profiler.stages[1]["parsed"], 8)
+
+    @unittest.skipUnless(mod._isAvailable("git"), "git is missing")
+    def test_main_diff_000(self) :
+        self._commitTwoRevisions()
+        stdout = StringIO.StringIO()
+        stderr = StringIO.StringIO()
+        cwd = os.getcwd()
+        os.chdir(self.tmpDir)
+        try :
+            mod._main(["inputPackage", "--diff", "HEAD~1", "HEAD", "-f",
+                       "jsonl"], stdout = stdout, stderr = stderr)
+        finally :
+            os.chdir(cwd)
+        added = [json.loads(x) for x in stdout.getvalue().splitlines()
+                 if '"added"' in x]
+        self.assertListEqual([x.get("id", x.get("source")) for x in added],
+                             ["inputPackage.core.spread",
+                              "inputPackage.utils.variance",
+                              "inputPackage.core.spread",
+                              "inputPackage.utils.variance"])
+        self.assertIn("2 files changed", stderr.getvalue())
+
+    @unittest.skipUnless(mod._isAvailable("git") and hasattr(os, "symlink"),
+                         "git or symbolic links are missing")
+    def test_listTreeFiles_symlink_000(self) :
+        os.symlink("core.py", os.path.join(self.package, "link.py"))
+        self._git("init", "-q")
+        self._git("add", "-A")
+        self._git("commit", "-q", "-m", "first")
+        result = mod.listTreeFiles("HEAD", [""], self.tmpDir)
+        self.assertIn("inputPackage/core.py", result)
+        self.assertNotIn("inputPackage/link.py", result)
+
+    def test_main_diffRender_000(self) :
+        # The diff is shown by viewDotContent, without the render layer
+        cacheDir = os.path.join(self.tmpDir, "renderCache")
+        stderr = StringIO.StringIO()
+        sys.stderr = stderr
+        try :
+            for options in [["--engine", "neato"], ["--render-cache", cacheDir],
+                            ["--timeout", "5"], ["--pack"]] :
+                with self.assertRaises(SystemExit) :
+                    mod._main([self.package, "--diff", "HEAD~1", "HEAD",
+                               "-q"] + options)
+        finally :
+            sys.stderr = sys.__stderr__
+        self.assertIn("--diff cannot be used with --pack", stderr.getvalue())
+
+### ** class TestStreaming
+
+class TestStreaming(unittest.TestCase) :
+
+### *** Test
+
+    def test_spilledEdges_000(self) :
+        edges = mod.SpilledEdges(maxMemory = 1, maxRuns = 3)
+        try :
+            edges.add("f", ["h", "g"])
+            edges.add("a", ["f"])
+            edges.add("b", [])
+            edges.add("g", ["a", "z"])
+            self.assertEqual(len(edges.runs), 1)
+            self.assertListEqual(list(edges.iterEdges()),
+                                 [("a", "f"), ("f", "g"), ("f", "h"),
+                                  ("g", "a"), ("g", "z")])
+            self.assertEqual(edges.nEdges(), 5)
+            self.assertListEqual(edges.functions(),
+                                 ["a", "f", "g", "h", "z"])
+            self.assertListEqual(edges.functions(True),
+                                 ["a", "b", "f", "g", "h", "z"])
+            directory = edges.directory
+        finally :
+            edges.close()
+        self.assertFalse(os.path.exists(directory))
+
+    def test_getStreamingRelations_000(self) :
+        inputs = [MY_TEST_MODULE, MY_TEST_PACKAGE_2]
+        expected = mod.getBatchRelations(inputs, getMethods = True)[0]
+        edges = mod.getStreamingRelations(inputs, getMethods = True,
+                                          maxMemory = 300)
+        try :
+            self.assertGreater(len(edges.runs), 0)
+            self.assertListEqual(list(edges.iterEdges()),
+                                 list(mod._iterEdges(expected)))
+            self.assertListEqual(edges.functions(True),
+                                 mod._getFuncFromRelations(expected, True))
+        finally :
+            edges.close()
+
+    def test_writers_000(self) :
+        expected = mod.getRelationsFromSrc(MY_TEST_PACKAGE_2)
+        edges = mod.getStreamingRelations([MY_TEST_PACKAGE_2],
+                                          maxMemory = 100)
+        try :
+            for outputFormat in ["dot", "jsonl", "graphml"] :
+                stream = StringIO.StringIO()
+                mod.writeRelations(edges, stream, outputFormat)
+                stream2 = StringIO.StringIO()
+                mod.writeRelations(expected, stream2, outputFormat)
+                self.assertEqual(stream.getvalue(), stream2.getvalue())
+            stream = io.BytesIO()
+            mod.writeRelations(edges, stream, "edgelist")
+            stream2 = io.BytesIO()
+            mod.writeRelations(expected, stream2, "edgelist")
+            self.assertEqual(stream.getvalue(), stream2.getvalue())
+        finally :
+            edges.close()
+
+    def test_main_000(self) :
+        stdout = StringIO.StringIO()
+        mod._main([MY_TEST_MODULE, "--max-memory", "1"], stdout = stdout)
+        self.assertEqual(stdout.getvalue(), mod.makeDotFromSrc(MY_TEST_MODULE))
+
+### ** class TestCallWeights
+
+class TestCallWeights(unittest.TestCase) :
+
+### *** setUp
+
+    def setUp(self) :
+        self.source = ("import os\n"
+                       "def f(x) :\n"
+                       "    g(x)\n"
+                       "    for i in h(x) :\n"
+                       "        g(i)\n"
+                       "        while g(i) :\n"
+                       "            os.path.join(i)\n"
+                       "    else :\n"
+                       "        h(x)\n"
+                       "    return [f(y) for y in x]\n"
+                       "def g(x) :\n"
+                       "    return x\n"
+                       "def h(x) :\n"
+                       "    return x\n")
+
+### *** Test
+
+    def test_collectCallSites_000(self) :
+        callSites = dict()
+        mod._collectCallSites(ast.parse(self.source).body[1], callSites)
+        self.assertEqual(callSites, {"g" : [3, 2], "h" : [2, 0],
+                                     "os.path.join" : [1, 2], "f" : [1, 1]})
+
+    def test_splitCallSites_000(self) :
+        (calledFunctions, calledAttributes) = (set(), set())
+        callSites = dict()
+        mod._collectCallSites(ast.parse(self.source).body[1], callSites)
+        mod._splitCallSites(callSites, calledFunctions, calledAttributes)
+        self.assertEqual(calledFunctions, set(["f", "g", "h"]))
+        self.assertEqual(calledAttributes, set(["os.path.join"]))
+
+    def test_resolveCalls_000(self) :
+        (fd, filename) = tempfile.mkstemp(suffix = ".py")
+        with os.fdopen(fd, "w") as fo :
+            fo.write(self.source)
+        try :
+            weights = dict()
+            relations = mod.getRelationsFromSrc(filename, weights = weights)
+        finally :
+            os.remove(filename)
+        self.assertEqual(relations, {"f" : ["f", "g", "h"], "g" : [],
+                                     "h" : []})
+        self.assertEqual(weights, {("f", "f") : (1, 1), ("f", "g") : (3, 2),
+                                   ("f", "h") : (2, 0)})
+
+    def test_resolveCalls_sum_000(self) :
+        weights = dict()
+        weights2 = []
+        relations = mod.getBatchRelations([MY_TEST_PACKAGE_2],
+                                          getMethods = True,
+                                          weights = weights2)
+        mod.getRelationsFromSrc(MY_TEST_PACKAGE_2, getMethods = True,
+                                weights = weights)
+        self.assertEqual(weights2, [weights])
+        self.assertEqual(sorted(weights.keys()),
+                         sorted(mod._iterEdges(relations[0])))
+
+    def test_dotEdgeAttributes_000(self) :
+        self.assertEqual(mod._dotEdgeAttributes(None), "")
+        self.assertEqual(mod._dotEdgeAttributes((1, 0)),
+                         " [penwidth=1,label=\"1\"]")
+        self.assertEqual(mod._dotEdgeAttributes((4, 1)),
+                         " [penwidth=4,label=\"4 (loop 1)\"]")
+        self.assertEqual(mod._dotEdgeAttributes((1000, 5)),
+                         " [penwidth=8,label=\"1000 (loop 5)\"]")
+
+    def test_writers_000(self) :
+        relations = {"f" : ["g", "h"], "g" : [], "h" : []}
+        weights = {("f", "g") : (3, 2), ("f", "h") : (1, 0)}
+        stream = StringIO.StringIO()
+        mod.writeRelations(relations, stream, "jsonl", weights = weights)
+        edges = [json.loads(x) for x in stream.getvalue().splitlines()][-2:]
+        self.assertEqual([(x["count"], x["loopDepth"]) for x in edges],
+                         [(3, 2), (1, 0)])
+        stream = StringIO.StringIO()
+        mod.writeRelations(relations, stream, "graphml", weights = weights)
+        document = xml.dom.minidom.parseString(stream.getvalue())
+        data = [x.firstChild.data for x in
+                document.getElementsByTagName("data")]
+        self.assertListEqual(data, ["3", "2", "1", "0"])
+        stream = io.BytesIO()
+        mod.writeRelations(relations, stream, "edgelist", weights = weights)
+        stream.seek(0)
+        (nodes, edges, result) = mod.readBinaryEdgeList(stream,
+                                                        withWeights = True)
+        self.assertListEqual(result, [(3, 2), (1, 0)])
+        stream = io.BytesIO()
+        mod.writeRelations(relations, stream, "edgelist")
+        stream.seek(0)
+        self.assertIsNone(mod.readBinaryEdgeList(stream, True)[2])
+
+    def test_main_000(self) :
+        stdout = StringIO.StringIO()
+        mod._main([MY_TEST_MODULE, "-W"], stdout = stdout)
+        edges = [x for x in stdout.getvalue().splitlines() if "->" in x]
+        self.assertTrue(len(edges) > 0)
+        for edge in edges :
+            self.assertIn("penwidth=", edge)
+
+### ** class TestLevelOfDetail
+
+class TestLevelOfDetail(unittest.TestCase) :
+
+### *** setUp
+
+    def setUp(self) :
+        self.relations = {"a.f" : ["a._h", "b.g"], "a._h" : ["a._k", "c.x"],
+                          "a._k" : ["b.g"], "b.g" : ["b.g"], "b._lone" : [],
+                          "c.x" : []}
+        self.weights = {("a.f", "a._h") : (2, 1), ("a.f", "b.g") : (1, 0),
+                        ("a._h", "a._k") : (1, 0), ("a._h", "c.x") : (3, 1),
+                        ("a._k", "b.g") : (1, 2), ("b.g", "b.g") : (1, 0)}
+
+### *** Test
+
+    def test_collapsePrivateHelpers_000(self) :
+        (relations, weights, nCollapsed) = mod.collapsePrivateHelpers(
+            self.relations, self.weights)
+        self.assertEqual(nCollapsed, 2)
+        self.assertEqual(relations, {"a.f" : ["b.g", "c.x"], "b.g" : ["b.g"],
+                                     "b._lone" : [], "c.x" : []})
+        self.assertEqual(weights, {("a.f", "b.g") : (3, 3),
+                                   ("a.f", "c.x") : (2, 2),
+                                   ("b.g", "b.g") : (1, 0)})
+
+    def test_collapsePrivateHelpers_noWeights_000(self) :
+        (relations, weights, nCollapsed) = mod.collapsePrivateHelpers(
+            {"_main" : ["_h"], "_h" : ["_h"]})
+        self.assertEqual((relations, weights, nCollapsed),
+                         ({"_main" : []}, None, 1))
+
+    def test_groupByModule_000(self) :
+        (relations, weights) = mod.groupByModule(self.relations, self.weights)
+        self.assertEqual(relations, {"a" : ["b", "c"], "b" : [], "c" : []})
+        self.assertEqual(weights, {("a", "b") : (2, 2), ("a", "c") : (3, 1)})
+        self.assertEqual(mod.groupByModule({"f" : ["f", "g"], "g" : []}),
+                         ({"f" : ["f", "g"], "g" : []}, None))
+
+    def test_groupByModule_condensed_000(self) :
+        relations = {"(a.f, b._g)" : ["c.x"], "c.x" : [],
+                     "c.y" : ["(a.f, b._g)"]}
+        self.assertEqual(mod.groupByModule(relations)[0],
+                         {"(a.f, b._g)" : ["c"], "c" : ["(a.f, b._g)"]})
+        self.assertFalse(mod._isPrivate("(a.f, b._g)"))
+        self.assertEqual(mod.collapsePrivateHelpers(relations)[0], relations)
+
+    def test_main_condense_000(self) :
+        tmpDir = tempfile.mkdtemp()
+        try :
+            package = os.path.join(tmpDir, "pkg")
+            os.mkdir(package)
+            for (name, content) in [
+                    ("__init__.py", ""),
+                    ("a.py", "from pkg import b\n\ndef f(n) :\n"
+                     "    if n :\n        b.g(n - 1)\n\n"
+                     "def main() :\n    f(3)\n"),
+                    ("b.py", "from pkg import a\n\ndef g(n) :\n"
+                     "    a.f(n)\n\ndef h() :\n    g(1)\n")] :
+                with open(os.path.join(package, name), "w") as fo :
+                    fo.write(content)
+            stdout = StringIO.StringIO()
+            mod._main([package, "--condense", "--max-nodes", "2", "-f",
+                       "jsonl"], stdout = stdout, stderr = StringIO.StringIO())
+            nodes = [json.loads(x)["id"] for x in
+                     stdout.getvalue().splitlines()
+                     if json.loads(x)["type"] == "node"]
+            self.assertEqual(sorted(nodes), ["(pkg.a.f, pkg.b.g)", "pkg.a"])
+        finally :
+            shutil.rmtree(tmpDir)
+
+    def test_keepHeaviestCalls_000(self) :
+        (relations, weights) = mod.keepHeaviestCalls(self.relations,
+                                                     self.weights, 2)
+        self.assertEqual(list(mod._iterEdges(relations)),
+                         [("a._h", "c.x"), ("a.f", "a._h")])
+        self.assertEqual(weights, {("a.f", "a._h") : (2, 1),
+                                   ("a._h", "c.x") : (3, 1)})
+        (relations, weights) = mod.keepHeaviestCalls(self.relations,
+                                                     maxNodes = 2)
+        self.assertEqual(relations, {"a._h" : [], "b.g" : ["b.g"]})
+
+    def test_getLevelOfDetail_000(self) :
+        self.assertEqual(mod.getLevelOfDetail(self.relations, 10, 10),
+                         (self.relations, None, [], None))
+        (relations, weights, elided, clusters) = mod.getLevelOfDetail(
+            self.relations, maxEdges = 3, weights = self.weights)
+        self.assertEqual(elided, ["collapsed 2 private helpers into their "
+                                  "callers"])
+        self.assertEqual(len(weights), 3)
+        (relations, weights, elided, clusters) = mod.getLevelOfDetail(
+            {"p.a.f" : ["p.b.g"], "p.b.g" : ["q.c.h"], "q.c.h" : [],
+             "p.a.f2" : ["p.b.g"]}, maxNodes = 3)
+        self.assertEqual(relations, {"p.a" : ["p.b"], "p.b" : ["q.c"],
+                                     "q.c" : []})
+        self.assertEqual(elided, ["grouped 4 functions into 3 modules"])
+        self.assertEqual(sorted(clusters.items()),
+                         [("p", ["p.a", "p.b"]), ("q", ["q.c"])])
+        (relations, weights, elided, clusters) = mod.getLevelOfDetail(
+            self.relations, maxNodes = 2)
+        self.assertEqual(relations, {"a" : ["b"], "b" : []})
+        self.assertEqual(elided, ["collapsed 2 private helpers into their "
+                                  "callers", "grouped 4 functions into 3 "
+                                  "modules", "kept 1 of 2 calls",
+                                  "kept 2 of 3 nodes"])
+
+    def test_iterDotContent_000(self) :
+        dotOptions = {"clusters" : {"p" : ["p.a", "p.b"]},
+                      "label" : "pydep: \"elided\""}
+        content = mod.makeDotFileContent({"p.a" : ["p.b"], "p.b" : []},
+                                         dotOptions)
+        self.assertIn("subgraph cluster_1 {\n\"p.a\";\n\"p.b\";\n"
+                      "subgraph clusterp {\nlabel = \"p\";\"p.a\";\n"
+                      "\"p.b\";\n}\n", content)
+        self.assertTrue(content.endswith("}\nlabel=\"pydep: \\\"elided"
+                                         "\\\"\";\nlabelloc=b;\n}\n"))
+
+    def test_main_000(self) :
+        stdout = StringIO.StringIO()
+        stderr = StringIO.StringIO()
+        mod._main([MY_TEST_PACKAGE_2, "--max-nodes", "3"], stdout = stdout,
+                  stderr = stderr)
+        self.assertIn("subgraph \"clusterinputPackage.sub\"",
+                      stdout.getvalue())
+        self.assertIn("grouped 9 functions into 4 modules", stderr.getvalue())
+        self.assertNotIn("penwidth", stdout.getvalue())
+        stdout = StringIO.StringIO()
+        mod._main([MY_TEST_PACKAGE_2, "--max-edges", "100"], stdout = stdout,
+                  stderr = stderr)
+        self.assertNotIn("label=", stdout.getvalue())
+
+### ** class TestRender
+
+# Fake Graphviz and ImageMagick programs, echoing their arguments and input
+FAKE_DOT = ("#!/bin/sh\n"
+            "if [ \"$2\" = \"-o\" ] ; then\n"
+            "    { echo \"$1\" ; cat ; } > \"$3\"\n"
+            "else\n"
+            "    echo \"$1\" ; cat\n"
+            "fi\n")
+FAKE_DISPLAY = ("#!/bin/sh\n"
+                "{ echo \"$1\" ; cat ; } > \"$(dirname \"$0\")/displayed\"\n")
+
+@unittest.skipIf(os.name == "nt", "the fake programs are shell scripts")
+class TestRender(unittest.TestCase) :
+
+### *** setUp and tearDown
+
+    def setUp(self) :
+        self.tmpDir = tempfile.mkdtemp()
+        for (name, content) in [("dot", FAKE_DOT), ("display", FAKE_DISPLAY)] :
+            self._writeScript(name, content)
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = self.tmpDir + os.pathsep + self.path
+        self.programPaths = dict(mod._PROGRAM_PATHS)
+        mod._PROGRAM_PATHS.clear()
+        self.content = ["digraph G {\n", "a -> b;\n", "}\n"]
+
+    def tearDown(self) :
+        os.environ["PATH"] = self.path
+        mod._PROGRAM_PATHS.clear()
+        mod._PROGRAM_PATHS.update(self.programPaths)
+        shutil.rmtree(self.tmpDir)
+
+    def _writeScript(self, name, content) :
+        filename = os.path.join(self.tmpDir, name)
+        with open(filename, "w") as fo :
+            fo.write(content)
+        os.chmod(filename, 0o755)
+
+### *** Test
+
+    def test_findProgram_000(self) :
+        dot = os.path.join(self.tmpDir, "dot")
+        self.assertEqual(mod._findProgram("dot"), dot)
+        os.remove(dot)
+        # The result is cached
+        self.assertEqual(mod._findProgram("dot"), dot)
+        self.assertTrue(mod._isAvailable("dot"))
+
+    def test_findProgram_missing_000(self) :
+        os.chmod(os.path.join(self.tmpDir, "display"), 0o644)
+        self.assertEqual(mod._findProgram("thisIsAnUnavailableProgram"), None)
+        self.assertNotEqual(mod._findProgram("display"),
+                            os.path.join(self.tmpDir, "display"))
+
+    def test_renderDot_stream_000(self) :
+        stream = io.BytesIO()
+        status = mod.renderDot(self.content, "svg", stream)
+        self.assertEqual(status, 0)
+        self.assertEqual(stream.getvalue(),
+                         b"-Tsvg\ndigraph G {\na -> b;\n}\n")
+
+    def test_renderDot_file_000(self) :
+        outputFile = os.path.join(self.tmpDir, "graph.png")
+        self.assertEqual(mod.renderDot("".join(self.content), "png",
+                                       outputFile), 0)
+        with open(outputFile, "rb") as fi :
+            self.assertEqual(fi.read(), b"-Tpng\ndigraph G {\na -> b;\n}\n")
+
+    def test_renderDot_fileDescriptor_000(self) :
+        outputFile = os.path.join(self.tmpDir, "graph.pdf")
+        with open(outputFile, "wb") as fo :
+            fo.write(b"header\n")
+            mod.renderDot(iter(self.content), "pdf", fo)
+        with open(outputFile, "rb") as fi :
+            self.assertEqual(fi.read(),
+                             b"header\n-Tpdf\ndigraph G {\na -> b;\n}\n")
+
+    def test_renderDot_missing_000(self) :
+        mod._PROGRAM_PATHS["dot"] = None
+        with self.assertRaises(Exception) :
+            mod.renderDot(self.content, "png", io.BytesIO())
+
+    def test_viewDotContent_000(self) :
+        self.assertEqual(mod.viewDotContent(self.content, imageFormat = "svg"),
+                         0)
+        with open(os.path.join(self.tmpDir, "displayed"), "rb") as fi :
+            self.assertEqual(fi.read(),
+                             b"svg:-\n-Tsvg\ndigraph G {\na -> b;\n}\n")
+
+    def test_viewDotContent_noWait_000(self) :
+        viewer = mod.viewDotContent("".join(self.content), wait = False)
+        self.assertEqual(viewer.wait(), 0)
+        with open(os.path.join(self.tmpDir, "displayed"), "rb") as fi :
+            self.assertEqual(fi.read(),
+                             b"png:-\n-Tpng\ndigraph G {\na -> b;\n}\n")
+
+    def test_main_000(self) :
+        outputFile = os.path.join(self.tmpDir, "graph.svg")
+        mod._main([MY_TEST_MODULE, "-T", "svg", "-o", outputFile])
+        stream = StringIO.StringIO()
+        mod._main([MY_TEST_MODULE], stdout = stream)
+        with open(outputFile, "rb") as fi :
+            self.assertEqual(fi.read(), b"-Tsvg\n" + stream.getvalue())
+        self.assertFalse(os.path.exists(outputFile + ".tmp"))
+
+    def test_main_outputDir_000(self) :
+        outputDir = os.path.join(self.tmpDir, "graphs")
+        mod._main([MY_TEST_MODULE, "-T", "pdf", "-d", outputDir])
+        self.assertEqual(os.listdir(outputDir), ["exampleModule.pdf"])
+
+    def _breakDot(self) :
+        self._writeScript("dot", "#!/bin/sh\nexit 1\n")
+
+    def test_renderDot_cache_000(self) :
+        cacheDir = os.path.join(self.tmpDir, "cache")
+        stream = io.BytesIO()
+        self.assertEqual(mod.renderDot(self.content, "svg", stream,
+                                       cacheDir = cacheDir), 0)
+        self._breakDot()
+        # Same content and format: the engine is not run again
+        stream2 = io.BytesIO()
+        mod.renderDot("".join(self.content), "svg", stream2,
+                      cacheDir = cacheDir)
+        self.assertEqual(stream2.getvalue(), stream.getvalue())
+        self.assertEqual(stream.getvalue(),
+                         b"-Tsvg\ndigraph G {\na -> b;\n}\n")
+        with self.assertRaises(Exception) :
+            mod.renderDot(self.content, "png", io.BytesIO(),
+                          cacheDir = cacheDir)
+        with self.assertRaises(Exception) :
+            mod.renderDot(self.content + ["\n"], "svg", io.BytesIO(),
+                          cacheDir = cacheDir)
+        # The failed renders are not cached
+        self.assertEqual(len([x for (d, s, f) in os.walk(cacheDir)
+                              for x in f if x != mod.CACHE_MARKER]), 1)
+
+    def test_viewDotContent_cache_000(self) :
+        cacheDir = os.path.join(self.tmpDir, "cache")
+        mod.renderDot(self.content, "png", io.BytesIO(), cacheDir = cacheDir)
+        self._breakDot()
+        self.assertEqual(mod.viewDotContent(self.content,
+                                            cacheDir = cacheDir), 0)
+        with open(os.path.join(self.tmpDir, "displayed"), "rb") as fi :
+            self.assertEqual(fi.read(),
+                             b"png:-\n-Tpng\ndigraph G {\na -> b;\n}\n")
+
+    def test_main_cache_000(self) :
+        cacheDir = os.path.join(self.tmpDir, "cache")
+        outputFile = os.path.join(self.tmpDir, "graph.svg")
+        arguments = [MY_TEST_MODULE, "-T", "svg", "-o", outputFile,
+                     "--render-cache", cacheDir]
+        mod._main(arguments)
+        with open(outputFile, "rb") as fi :
+            expected = fi.read()
+        os.remove(outputFile)
+        self._breakDot()
+        mod._main(arguments)
+        with open(outputFile, "rb") as fi :
+            self.assertEqual(fi.read(), expected)
+        # The size limit evicts the images
+        mod._main(arguments + ["--render-cache-size", "0"])
+        self.assertEqual([x for (d, s, f) in os.walk(cacheDir) for x in f],
+                         [mod.CACHE_MARKER])
+
+    def test_main_cacheDirectories_000(self) :
+        userFile = os.path.join(self.tmpDir, "data.bin")
+        with open(userFile, "w") as fo :
+            fo.write("x" * 1000)
+        cacheDir = os.path.join(self.tmpDir, "cache")
+        sys.stderr = StringIO.StringIO()
+        try :
+            for arguments in [["--render-cache", self.tmpDir],
+                              ["--render-cache", cacheDir,
+                               "--cache-dir", cacheDir + os.sep]] :
+                with self.assertRaises(SystemExit) :
+                    mod._main([MY_TEST_MODULE, "-T", "svg", "-o",
+                               os.path.join(self.tmpDir, "graph.svg"),
+                               "--render-cache-size", "0"] + arguments)
+        finally :
+            sys.stderr = sys.__stderr__
+        self.assertTrue(os.path.exists(userFile))
+
+    def test_main_cacheWithoutRender_000(self) :
+        sys.stderr = StringIO.StringIO()
+        try :
+            with self.assertRaises(SystemExit) :
+                mod._main([MY_TEST_MODULE, "--render-cache", self.tmpDir])
+        finally :
+            sys.stderr = sys.__stderr__
+
+    def _addPackers(self) :
+        for (name, content) in [("gvpack", "#!/bin/sh\ncat\n"),
+                                ("neato", "#!/bin/sh\necho \"$@\"\ncat\n")] :
+            self._writeScript(name, content)
+
+    def test_getWeaklyConnectedComponents_000(self) :
+        relations = {"a" : ["b"], "b" : [], "c" : ["d", "b"], "d" : [],
+                     "e" : ["e"], "f" : [], "g" : ["h"]}
+        self.assertEqual(mod.getWeaklyConnectedComponents(relations),
+                         [["a", "b", "c", "d"], ["g", "h"], ["e"]])
+        self.assertEqual(mod.getWeaklyConnectedComponents(
+            mod.CsrGraph.fromRelations(relations), drawSingles = True),
+                         [["a", "b", "c", "d"], ["g", "h"], ["e"], ["f"]])
+
+    def test_balanceComponents_000(self) :
+        components = [["a", "b", "c"], ["d", "e"], ["f", "g"], ["h"]]
+        self.assertEqual(mod._balanceComponents(components, 2),
+                         [[["a", "b", "c"], ["h"]], [["d", "e"], ["f", "g"]]])
+        self.assertEqual(mod._balanceComponents(components[:1], 4),
+                         [components[:1]])
+
+    def test_renderPacked_000(self) :
+        self._addPackers()
+        relations = {"a" : ["b"], "b" : [], "c" : ["d"], "d" : [],
+                     "e" : ["e"]}
+        stream = io.BytesIO()
+        self.assertEqual(mod.renderPacked(relations, "png", stream,
+                                          jobs = 2), 0)
+        output = stream.getvalue()
+        self.assertTrue(output.startswith(b"-Tpng -s -n2\n-Tdot\ndigraph G"))
+        # One dot process per batch
+        self.assertEqual(output.count(b"-Tdot\n"), 2)
+        self.assertEqual(output.count(b"digraph G"), 3)
+        for f in ["a", "b", "c", "d", "e"] :
+            self.assertIn(("\n" + f + ";\n").encode("ascii"), output)
+
+    def test_renderPacked_fallback_000(self) :
+        relations = {"a" : ["b"], "b" : [], "c" : ["d"], "d" : []}
+        stream = io.BytesIO()
+        mod.renderPacked(relations, "svg", stream, jobs = 2)
+        stream2 = io.BytesIO()
+        mod.renderDot(mod.iterDotContent(relations), "svg", stream2)
+        self.assertEqual(stream.getvalue(), stream2.getvalue())
+
+    def test_main_pack_000(self) :
+        self._addPackers()
+        stream = io.BytesIO()
+        mod._main([MY_TEST_PACKAGE, "-T", "svg", "--pack", "-j", "0"],
+                  stdout = stream)
+        self.assertTrue(stream.getvalue().startswith(b"-Tsvg -s -n2\n"))
+
+    def test_chooseEngine_000(self) :
+        relations = {"a" : ["b"], "b" : ["c"], "c" : []}
+        self.assertEqual(mod.chooseEngine(relations), "dot")
+        self.assertEqual(mod.chooseEngine(relations, "neato"), "neato")
+        autoEngineNodes = mod.AUTO_ENGINE_NODES
+        mod.AUTO_ENGINE_NODES = 2
+        try :
+            mod._PROGRAM_PATHS["sfdp"] = None
+            self.assertEqual(mod.chooseEngine(relations), "dot")
+            del mod._PROGRAM_PATHS["sfdp"]
+            self._writeScript("sfdp", FAKE_DOT)
+            self.assertEqual(mod.chooseEngine(relations), "sfdp")
+        finally :
+            mod.AUTO_ENGINE_NODES = autoEngineNodes
+
+    def test_renderDot_timeout_000(self) :
+        self._writeScript("dot", "#!/bin/sh\nexec sleep 10\n")
+        stream = io.BytesIO()
+        start = time.time()
+        with self.assertRaises(mod.RenderTimeout) :
+            mod.renderDot(self.content, "png", stream, timeout = 0.2)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(stream.getvalue(), b"")
+        # Renders finishing in time are not affected
+        self._writeScript("dot", FAKE_DOT)
+        mod.renderDot(self.content, "png", stream, timeout = 5)
+        self.assertEqual(stream.getvalue(),
+                         b"-Tpng\ndigraph G {\na -> b;\n}\n")
+
+    def test_renderWithFallback_sfdp_000(self) :
+        self._writeScript("dot", "#!/bin/sh\nexec sleep 10\n")
+        self._writeScript("sfdp", FAKE_DOT)
+        stream = io.BytesIO()
+        stderr = StringIO.StringIO()
+        mod.renderWithFallback({"a" : ["b"], "b" : []}, "svg", stream,
+                               timeout = 0.2, stderr = stderr)
+        self.assertTrue(stream.getvalue().startswith(b"-Tsvg\ndigraph G {"))
+        self.assertEqual(stderr.getvalue(), "pydep: dot did not finish in "
+                         "0.2 s, retrying with sfdp\n")
+
+    def test_renderWithFallback_reduce_000(self) :
+        # Slow for graphs of more than one call (with a timeout, the image
+        # is written to a temporary file given with -o)
+        self._writeScript("neato", "#!/bin/sh\n"
+                        "content=\"$(cat)\"\n"
+                        "if [ $(echo \"$content\" | grep -c -- \"->\") -gt 1 ] ; "
+                        "then\n"
+                        "    exec sleep 10\n"
+                        "fi\n"
+                        "echo \"$content\" > \"$3\"\n")
+        relations = {"a" : ["b"], "b" : ["c"], "c" : ["d"], "d" : []}
+        stream = io.BytesIO()
+        stderr = StringIO.StringIO()
+        mod.renderWithFallback(relations, "png", stream, engine = "neato",
+                               timeout = 0.2, stderr = stderr)
+        self.assertIn(b"label=\"pydep: kept 1 of 3 calls; kept 2 of 4 nodes\"",
+                      stream.getvalue())
+        self.assertIn("retrying with at most 2 nodes", stderr.getvalue())
+
+    def test_main_timeout_000(self) :
+        outputFile = os.path.join(self.tmpDir, "graph.svg")
+        mod._main([MY_TEST_MODULE, "-T", "svg", "-o", outputFile,
+                   "--engine", "dot", "--timeout", "5"])
+        with open(outputFile, "rb") as fi :
+            self.assertTrue(fi.read().startswith(b"-Tsvg\n"))
+        sys.stderr = StringIO.StringIO()
+        try :
+            with self.assertRaises(SystemExit) :
+                mod._main([MY_TEST_MODULE, "--timeout", "5"])
+        finally :
+            sys.stderr = sys.__stderr__
+
+    def test_main_timeoutCleanup_000(self) :
+        self._writeScript("dot", "#!/bin/sh\ntouch \"$3\"\nexec sleep 10\n")
+        mod._PROGRAM_PATHS["sfdp"] = None
+        outputFile = os.path.join(self.tmpDir, "graph.svg")
+        with self.assertRaises(mod.RenderTimeout) :
+            mod._main([MY_TEST_MODULE, "-T", "svg", "-o", outputFile,
+                       "--engine", "dot", "--timeout", "0.1"],
+                      stderr = StringIO.StringIO())
+        self.assertFalse(os.path.exists(outputFile))
+        self.assertFalse(os.path.exists(outputFile + ".tmp"))
+        # The reduced graphs are only computed in memory
+        sys.stderr = StringIO.StringIO()
+        try :
+            with self.assertRaises(SystemExit) :
+                mod._main([MY_TEST_MODULE, "-T", "svg", "-o", outputFile,
+                           "--timeout", "5", "--max-memory", "1"])
+        finally :
+            sys.stderr = sys.__stderr__
+
+    def test_main_packFailure_000(self) :
+        self._addPackers()
+        self._breakDot()
+        with self.assertRaises(Exception) :
+            mod._main([MY_TEST_MODULE, "--quickView", "--pack"])
+
+    def test_main_timeoutFailure_000(self) :
+        self._breakDot()
+        with self.assertRaises(Exception) :
+            mod._main([MY_TEST_MODULE, "--quickView", "--timeout", "5"])
+        # The viewer is not started on an empty image
+        self.assertFalse(os.path.exists(os.path.join(self.tmpDir,
+                                                     "displayed")))
+
+    def test_main_format_000(self) :
+        stderr = StringIO.StringIO()
+        sys.stderr = stderr
+        try :
+            with self.assertRaises(SystemExit) :
+                mod._main([MY_TEST_MODULE, "-T", "png", "-f", "jsonl"])
+        finally :
+            sys.stderr = sys.__stderr__
+        self.assertIn("-T requires the dot output format", stderr.getvalue())
+
+### ** class TestMain
+
+class TestMain(unittest.TestCase) :
+
+### *** Test
+
+    def test_main_stdout_000(self) :
+        stdout = StringIO.StringIO()
+        mod._main([MY_TEST_MODULE], stdout = stdout)
+        expected = mod.makeDotFromSrc(MY_TEST_MODULE)
+        self.assertEqual(stdout.getvalue(), expected)
+
+### ** class TestCallGraph
+
+class TestCallGraph(unittest.TestCase) :
+
+### *** Test
+
+    def test_fromSource_file_000(self) :
+        graph = mod.CallGraph.fromSource(MY_TEST_MODULE)
+        self.assertEqual(graph.relations(),
+                         mod.getRelationsFromSrc(MY_TEST_MODULE))
+
+    def test_fromSource_package_000(self) :
+        graph = mod.CallGraph.fromSource(MY_TEST_PACKAGE_2, getMethods = True)
+        self.assertEqual(graph.relations(),
+                         mod.getRelationsFromSrc(MY_TEST_PACKAGE_2,
+                                                 getMethods = True))
+
+    def test_record_000(self) :
+        graph = mod.CallGraph.fromSource(MY_TEST_PACKAGE_2, getMethods = True)
+        record = graph["inputPackage.shapes.Square.summary"]
+        self.assertEqual(os.path.basename(record.filename), "shapes.py")
+        with open(record.filename, "r") as fi :
+            line = fi.readlines()[record.lineno - 1]
+        self.assertIn("def summary", line)
+        self.assertIsInstance(record.callees, tuple)
+        self.assertFalse(hasattr(record, "__dict__"))
+
+    def test_callees_shared_000(self) :
+        graph = mod.CallGraph.fromSource(MY_TEST_PACKAGE_2)
+        record = graph["inputPackage.core.run"]
+        for callee in record.callees :
+            self.assertIs(callee, graph[callee].name)
+
+    def test_merge_000(self) :
+        a = mod.CallGraph.fromRelations({"f" : ["g"], "g" : []})
+        b = mod.CallGraph.fromRelations({"f" : ["h"], "h" : []})
+        result = a.merge(b).relations()
+        self.assertEqual(result, {"f" : ["g", "h"], "g" : [], "h" : []})
+
+    def test_filter_000(self) :
+        a = mod.CallGraph.fromRelations({"f" : ["g", "_h"], "g" : ["_h"],
+                                         "_h" : []})
+        result = a.filter(lambda x : not mod._isPrivate(x.name)).relations()
+        self.assertEqual(result, {"f" : ["g"], "g" : []})
+
+    def test_focus_000(self) :
+        a = mod.CallGraph.fromRelations({"f" : ["g"], "g" : ["h"],
+                                         "h" : ["i"], "i" : []})
+        result = a.focus("g", depth = 1).relations()
+        self.assertEqual(result, {"f" : ["g"], "g" : ["h"], "h" : []})
+        self.assertRaises(Exception, a.focus, "zzz")
+
+    def test_write_000(self) :
+        graph = mod.CallGraph.fromSource(MY_TEST_MODULE)
+        stream = StringIO.StringIO()
+        graph.write(stream, "jsonl")
+        expected = StringIO.StringIO()
+        mod.writeRelations(mod.getRelationsFromSrc(MY_TEST_MODULE), expected,
+                           "jsonl")
+        self.assertEqual(stream.getvalue(), expected.getvalue())
+
+### ** class TestProfiler
+
+class TestProfiler(unittest.TestCase) :
+
+### *** Test
+
+    def test_disabled_000(self) :
+        profiler = mod.Profiler(enabled = False)
+        with profiler.stage("extract") as counts :
+            counts["files"] = 1
+        self.assertListEqual(profiler.stages, [])
+
+    def test_enabled_000(self) :
+        profiler = mod.Profiler()
+        mod.getRelationsFromSrc(MY_TEST_PACKAGE, profiler = profiler)
+        result = [x["name"] for x in profiler.stages]
+        self.assertListEqual(result, ["discover", "extract", "resolve"])
+        self.assertEqual(profiler.stages[0]["files"], 3)
+
+    def test_main_profile_000(self) :
+        (fd, filename) = tempfile.mkstemp()
+        os.close(fd)
+        try :
+            mod._main([MY_TEST_MODULE, "--profile", filename],
+                      stdout = StringIO.StringIO())
+            with open(filename, "r") as fi :
+                report = json.load(fi)
+        finally :
+            os.remove(filename)
+        result = [x["name"] for x in report["stages"]]
+        self.assertListEqual(result, ["extract", "write"])
+
+    def test_main_profileSource_000(self) :
+        tmpDir = tempfile.mkdtemp()
+        try :
+            source = os.path.join(tmpDir, "a.py")
+            shutil.copy(MY_TEST_MODULE, source)
+            sys.stderr = StringIO.StringIO()
+            try :
+                with self.assertRaises(SystemExit) :
+                    mod._main(["--profile", source, MY_TEST_MODULE],
+                              stdout = StringIO.StringIO())
+                with self.assertRaises(SystemExit) :
+                    mod._main(["--profile", MY_TEST_MODULE])
+            finally :
+                sys.stderr = sys.__stderr__
+            with open(source, "r") as fi, open(MY_TEST_MODULE, "r") as fi2 :
+                self.assertEqual(fi.read(), fi2.read())
+        finally :
+            shutil.rmtree(tmpDir)
+
 ### ** class TestGetDotOptions
 
 class TestGetDotOptions(unittest.TestCase) :